@@ -1,23 +1,355 @@
 import google.generativeai as genai
+from google.ai import generativelanguage as glm
+from google.api_core import exceptions as google_exceptions
 import json
+import hashlib
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+import db
+import metrics
 
-def analyze_tender(title, description="", criteria="", api_key=None, extra_context="", pdf_data=None):
+# Quota retries back off exponentially from RETRY_BASE_DELAY (with jitter),
+# capped at RETRY_MAX_DELAY. A model that stays throttled is skipped by every
+# caller for MODEL_COOLDOWN seconds (or as long as the API asks).
+RETRY_BASE_DELAY = 2
+RETRY_MAX_DELAY = 30
+RETRY_MAX_ATTEMPTS = 4
+MODEL_COOLDOWN = 60
+MAX_INLINE_WAIT = 15  # longer retry hints skip to the next model instead of waiting
+
+# Batch analysis pacing. Size this to the Gemini quota of the key in use
+# (requests per minute across all workers).
+BATCH_MAX_WORKERS = 4
+BATCH_REQUESTS_PER_MINUTE = 60
+
+# Text context forwarded to the model (matches utils_pdf.MAX_TEXT_CHARS plus a header)
+EXTRA_CONTEXT_MAX_CHARS = 61000
+
+# Persistent analysis cache (tenders.db), shared by app.py and daily_digest.py
+ANALYSIS_CACHE_TTL = 7 * 24 * 3600  # seconds
+ANALYSIS_CACHE_MAX_ENTRIES = 20000
+
+_cache_stats = {"hits": 0, "misses": 0}
+_cache_stats_lock = threading.Lock()
+
+# Tender documents are read by the model once: the requirements it extracts
+# are stored per document (SHA-256 of the PDF) and every later analysis, for
+# any profile, sends that compact extract instead of the document.
+# Bump REQUIREMENTS_VERSION when the fields or the prompt change.
+REQUIREMENTS_VERSION = 1
+REQUIREMENTS_MAX_ENTRIES = 5000
+REQUIREMENTS_MAX_ITEMS = 15  # per list field
+REQUIREMENTS_MAX_CHARS = 300  # per item
+REQUIREMENT_FIELDS = {
+    "plazos": "Plazos",
+    "garantias": "Garantías",
+    "requisitos_tecnicos": "Requisitos técnicos",
+    "criterios_evaluacion": "Criterios de evaluación",
+}
+
+REQUIREMENTS_PROMPT = """
+    ROL: Eres un experto analista de licitaciones públicas en CHILE (Mercado Público).
+    IDIOMA: Tu idioma nativo es ESPAÑOL. NO hablas ni entiendes inglés para la salida.
+
+    TAREA:
+    Lee las bases de licitación adjuntas (texto y/o PDF escaneado) y extrae SOLO lo que el documento dice.
+    No evalúes la oportunidad. Si un dato no aparece, deja la lista vacía o el texto vacío.
+
+    {text}
+
+    FORMATO DE SALIDA (OBLIGATORIO):
+    Responde ÚNICAMENTE un objeto JSON válido, en ESPAÑOL, con frases cortas.
+
+    {{ "resumen": "str (qué se compra, 30 palabras)",
+       "plazos": ["str (cierre, consultas, entrega, vigencia del contrato...)"],
+       "garantias": ["str (seriedad de la oferta, fiel cumplimiento: monto y plazo)"],
+       "requisitos_tecnicos": ["str"],
+       "presupuesto": "str (monto disponible o estimado, moneda)",
+       "criterios_evaluacion": ["str (criterio y ponderación)"] }}
+    """
+
+# Packed mode: several tenders scored in one call, sharing the role/format
+# preamble and company profile. Chunk size is derived from the token budget.
+PACKED_TOKEN_BUDGET = 6000
+PACKED_MAX_ITEMS = 40
+PACKED_OUTPUT_TOKENS_PER_ITEM = 60
+
+PACKED_PROMPT = """
+    ROL: Eres un experto analista de licitaciones públicas en CHILE (Mercado Público).
+    IDIOMA: Tu idioma nativo es ESPAÑOL. NO hablas ni entiendes inglés para la salida.
+
+    TAREA:
+    {context_criteria}
+    Evalúa CADA UNA de las {count} licitaciones siguientes y determina si es una buena oportunidad.
+
+    LICITACIONES (JSON):
+    ===
+    {entries}
+    ===
+
+    FORMATO DE SALIDA (OBLIGATORIO):
+    Responde ÚNICAMENTE un arreglo JSON válido con un objeto por licitación, en el mismo orden.
+    Campo "reason": DEBE ser en ESPAÑOL.
+
+    [{{ "CodigoExterno": "str (el mismo de la entrada)", "score": int, "reason": "str (Resumen en Español de 20 palabras)" }}]
+    """
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: refills `rate` tokens per second up to `capacity`.
+    acquire() blocks until a token is available.
+    """
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class ModelScheduler:
+    """
+    Shared by every analysis call (and thread) in the process:
+    - caches one model client per (api_key, model)
+    - exponential backoff with jitter, honoring retry hints from the API
+    - per-model circuit breaker, so throttled models are skipped right away
+    - metrics on retries and time spent waiting
+    """
+    def __init__(self, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY, max_attempts=RETRY_MAX_ATTEMPTS,
+                 cooldown=MODEL_COOLDOWN, max_inline_wait=MAX_INLINE_WAIT):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.cooldown = cooldown
+        self.max_inline_wait = max_inline_wait
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._clients = {}
+            self._open_until = {}
+            self.metrics = {"calls": 0, "quota_errors": 0, "retries": 0, "skipped": 0,
+                            "circuit_opened": 0, "wait_seconds": 0.0}
+
+    def client(self, api_key, model_name):
+        with self._lock:
+            model = self._clients.get((api_key, model_name))
+            if model is None:
+                model = _build_model(api_key, model_name)
+                self._clients[(api_key, model_name)] = model
+            self.metrics["calls"] += 1
+            return model
+
+    def is_open(self, model_name):
+        with self._lock:
+            if self._open_until.get(model_name, 0) > time.monotonic():
+                self.metrics["skipped"] += 1
+                return True
+            return False
+
+    def trip(self, model_name, seconds):
+        with self._lock:
+            until = time.monotonic() + seconds
+            if until > self._open_until.get(model_name, 0):
+                self._open_until[model_name] = until
+                self.metrics["circuit_opened"] += 1
+        print(f"[WARN] {model_name} paused for {seconds:.0f}s.")
+
+    def next_reopen(self, models):
+        # Seconds until the first of `models` accepts calls again
+        with self._lock:
+            now = time.monotonic()
+            return max(0.0, min(self._open_until.get(m, 0) for m in models) - now)
+
+    def backoff(self, attempt, retry_after=None):
+        if retry_after is not None:
+            delay = retry_after + random.uniform(0, 0.5)
+        else:
+            # "Equal jitter": half fixed, half random, so waiting callers spread out
+            ceiling = min(self.max_delay, self.base_delay * (2 ** attempt))
+            delay = ceiling / 2 + random.uniform(0, ceiling / 2)
+        return min(delay, self.max_delay)
+
+    def wait(self, seconds):
+        with self._lock:
+            self.metrics["wait_seconds"] += seconds
+        with metrics.timer("llm.retry_sleep"):
+            time.sleep(seconds)
+
+    def record(self, key):
+        with self._lock:
+            self.metrics[key] += 1
+        metrics.incr(f"llm.{key}")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.metrics)
+            stats["wait_seconds"] = round(stats["wait_seconds"], 2)
+            return stats
+
+
+@lru_cache(maxsize=8)
+def _api_client(api_key):
+    return glm.GenerativeServiceClient(client_options={"api_key": api_key})
+
+def _build_model(api_key, model_name):
+    # genai.configure() is process-wide: with two keys in one process every
+    # model would use whichever was configured last. Each model gets a client
+    # bound to its own key instead (the SDK has no public per-model key).
+    model = genai.GenerativeModel(model_name)
+    model._client = _api_client(api_key)
+    return model
+
+def _is_quota_error(e):
+    if isinstance(e, google_exceptions.ResourceExhausted):
+        return True
+    error_str = str(e)
+    return "ResourceExhausted" in error_str or "429" in error_str
+
+def _retry_after(e):
+    """
+    Seconds the API asked us to wait, if the error carries a hint
+    (RetryInfo `retry_delay { seconds: N }` or "retry in Ns").
+    """
+    match = re.search(r"retry_delay\s*\{\s*seconds:\s*(\d+)", str(e)) or re.search(r"retry in ([\d.]+)\s*s", str(e), re.IGNORECASE)
+    return float(match.group(1)) if match else None
+
+# app.py hot-reloads this module on every rerun; keep the shared scheduler
+# (and what it knows about throttled models) alive across reloads.
+scheduler = globals().get("scheduler") or ModelScheduler()
+
+def scheduler_stats():
+    return scheduler.stats()
+
+# Prioritizing High Quality Flash 2.0 now that Billing is active
+MODELS_TO_TRY = ['gemini-2.0-flash', 'gemini-1.5-flash', 'gemini-2.0-flash-lite']
+
+BUSY_RESULT = {
+    "score": 0,
+    "reason": "⚠️ IA Ocupada (Tráfico Alto). Espera 1 min e intenta de nuevo."
+}
+
+def _generate(content_parts, api_key, parse, rate_limiter=None):
+    """
+    Sends `content_parts` to Gemini, walking the fallback models through the
+    shared scheduler. `parse` turns the response text into the result; parse
+    errors move on to the next model. Returns None when every model failed.
+    """
+    models = MODELS_TO_TRY
+    # Everything throttled: wait for the first model to come back if it is soon
+    pause = scheduler.next_reopen(models)
+    if pause > 0:
+        if pause > scheduler.max_delay:
+            print("[WARN] All models paused by quota.")
+            return None
+        scheduler.wait(pause)
+
+    for model_name in models:
+        if scheduler.is_open(model_name):
+            continue
+
+        for attempt in range(scheduler.max_attempts):
+            try:
+                # Shared pacing when running as part of a batch
+                if rate_limiter:
+                    rate_limiter.acquire()
+                model = scheduler.client(api_key, model_name)
+                with metrics.timer("llm.call", model=model_name):
+                    response = model.generate_content(content_parts)
+            except Exception as e:
+                if not _is_quota_error(e):
+                    # e.g. model not found: try the next model in the list
+                    print(f"[WARN] Failed with {model_name} (Non-Quota): {e}")
+                    break
+
+                scheduler.record("quota_errors")
+                retry_after = _retry_after(e)
+                if attempt + 1 >= scheduler.max_attempts or (retry_after or 0) > scheduler.max_inline_wait:
+                    # Stop hammering this model for everyone, fall through to the next one
+                    scheduler.trip(model_name, max(scheduler.cooldown, retry_after or 0))
+                    break
+                wait_time = scheduler.backoff(attempt, retry_after)
+                print(f"[WARN] Quota hit on {model_name}. Waiting {wait_time:.1f}s... ({attempt+1}/{scheduler.max_attempts})")
+                scheduler.record("retries")
+                scheduler.wait(wait_time)
+                continue
+
+            try:
+                text = response.text.replace("```json", "").replace("```", "").strip()
+                return parse(text)
+            except Exception as e:
+                print(f"[WARN] Unusable answer from {model_name}: {e}")
+                break
+    return None
+
+def analysis_cache_key(code, title, description="", criteria="", extra_context="", pdf_data=None):
+    """
+    Content address of an analysis: any change to the tender, the profile,
+    the models in use or the attached PDF produces a different key.
+    """
+    pdf_digest = hashlib.sha256(pdf_data).hexdigest() if pdf_data else ""
+    material = json.dumps([code, title, description, criteria, extra_context, MODELS_TO_TRY, pdf_digest], ensure_ascii=False)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+def _cache_get(key):
+    try:
+        result = db.get_cached_analysis(key, ANALYSIS_CACHE_TTL)
+    except Exception as e:
+        print(f"[WARN] Analysis cache unavailable: {e}")
+        result = None
+    with _cache_stats_lock:
+        _cache_stats["hits" if result is not None else "misses"] += 1
+    metrics.incr("analysis_cache.hits" if result is not None else "analysis_cache.misses")
+    return result
+
+def _cache_put(key, result):
+    try:
+        db.put_cached_analysis(key, result, ANALYSIS_CACHE_MAX_ENTRIES)
+    except Exception as e:
+        print(f"[WARN] Could not store analysis in cache: {e}")
+
+def cache_stats():
+    with _cache_stats_lock:
+        return dict(_cache_stats)
+
+@metrics.timed("analyze_tender")
+def analyze_tender(title, description="", criteria="", api_key=None, extra_context="", pdf_data=None, rate_limiter=None, code=None):
     # 1. Fallback to Mock if no key
     if not api_key:
         print("[INFO] No API Key provided, using mock analysis.")
         return _mock_analysis()
 
-    # 2. Try Gemini with Fallback Models
-    # Prioritizing High Quality Flash 2.0 now that Billing is active
-    models_to_try = ['gemini-2.0-flash', 'gemini-1.5-flash', 'gemini-2.0-flash-lite']
-    
-    # 3. Prompt Engineering
+    # Same tender + profile + document already scored? Reuse it.
+    cache_key = analysis_cache_key(code, title, description, criteria, extra_context, pdf_data)
+    cached = _cache_get(cache_key)
+    if cached is not None:
+        return cached
+
+    # 2. Prompt Engineering
     context_criteria = f"Criterios/Perfil de la Empresa: {criteria}" if criteria else "Perfil general de tecnología."
     
-    # Text-based extra context (deprecated for PDF but kept for compatibility)
+    # Text-based extra context (e.g. text extracted from the PDF's text pages)
     pdf_instruction = ""
     if extra_context:
-        pdf_instruction = f"CONTEXTO ADICIONAL (TEXTO): {extra_context[:10000]}\n"
+        pdf_instruction = f"CONTEXTO ADICIONAL (TEXTO): {extra_context[:EXTRA_CONTEXT_MAX_CHARS]}\n"
     
     # Vision/PDF instruction
     if pdf_data:
@@ -47,52 +379,249 @@ def analyze_tender(title, description="", criteria="", api_key=None, extra_conte
     {{ "score": int, "reason": "str (Resumen en Español de 20 palabras)" }}
     """
 
-    for model_name in models_to_try:
-        # Retry loop for EACH model
-        max_retries = 5
-        base_delay = 3 # Start with 3 seconds
-        
-        for attempt in range(max_retries):
+    # 3. Construct Payload
+    content_parts = [prompt]
+    if pdf_data:
+        content_parts.append({
+            "mime_type": "application/pdf",
+            "data": pdf_data
+        })
+
+    def parse(text):
+        data = json.loads(text)
+        return {
+            "score": data.get("score", 0),
+            "reason": data.get("reason", "Sin razón clara")
+        }
+
+    # 4. Try Gemini with Fallback Models
+    result = _generate(content_parts, api_key, parse, rate_limiter)
+    if result is None:
+        # If we get here, it means ALL models failed after ALL retries
+        print("[ERROR] AI capabilities exhausted.")
+        return dict(BUSY_RESULT)
+    _cache_put(cache_key, result)
+    return result
+
+def _parse_requirements(text):
+    data = json.loads(text)
+    if not isinstance(data, dict):
+        raise ValueError("Requirements answer is not a JSON object")
+
+    def clean(value):
+        return " ".join(str(value).split())[:REQUIREMENTS_MAX_CHARS]
+
+    extract = {"resumen": clean(data.get("resumen") or ""), "presupuesto": clean(data.get("presupuesto") or "")}
+    for field in REQUIREMENT_FIELDS:
+        items = data.get(field) or []
+        if isinstance(items, str):
+            items = [items]
+        extract[field] = [clean(i) for i in items if str(i).strip()][:REQUIREMENTS_MAX_ITEMS]
+    return extract
+
+def get_requirements(sha256):
+    """
+    Stored requirements of the document with this SHA-256, or None.
+    """
+    try:
+        extract = db.get_pdf_extract(sha256, REQUIREMENTS_VERSION)
+    except Exception as e:
+        print(f"[WARN] Requirements cache unavailable: {e}")
+        extract = None
+    metrics.incr("requirements_cache.hits" if extract is not None else "requirements_cache.misses")
+    return extract
+
+@metrics.timed("extract_requirements")
+def extract_requirements(prepared, sha256, api_key, rate_limiter=None):
+    """
+    One model pass over a document prepared by utils_pdf.prepare_pdf (its
+    text pages, plus the scanned pages as PDF) that pulls out deadlines,
+    guarantees, technical requirements, budget and evaluation criteria.
+    The result is stored under `sha256`. Returns None if no model answered.
+    """
+    if not api_key or not (prepared["text"] or prepared["scanned_pdf"]):
+        return None
+    text = f"TEXTO DEL DOCUMENTO:\n{prepared['text'][:EXTRA_CONTEXT_MAX_CHARS]}" if prepared["text"] else ""
+    content_parts = [REQUIREMENTS_PROMPT.format(text=text)]
+    if prepared["scanned_pdf"]:
+        content_parts.append({"mime_type": "application/pdf", "data": prepared["scanned_pdf"]})
+
+    extract = _generate(content_parts, api_key, _parse_requirements, rate_limiter)
+    if extract is None:
+        return None
+    try:
+        db.put_pdf_extract(sha256, REQUIREMENTS_VERSION, extract, prepared["pages"], REQUIREMENTS_MAX_ENTRIES)
+    except Exception as e:
+        print(f"[WARN] Could not store requirements: {e}")
+    return dict(extract, pages=prepared["pages"])
+
+def requirements_context(extract):
+    """
+    The extract as the text context of an analysis (a few KB instead of the document).
+    """
+    lines = [f"[DOCUMENTO PDF ADJUNTO - REQUISITOS EXTRAÍDOS ({extract.get('pages')} páginas)]"]
+    if extract.get("resumen"):
+        lines.append(f"Resumen: {extract['resumen']}")
+    if extract.get("presupuesto"):
+        lines.append(f"Presupuesto: {extract['presupuesto']}")
+    for field, label in REQUIREMENT_FIELDS.items():
+        if extract.get(field):
+            lines.append(f"{label}:")
+            lines.extend(f"- {item}" for item in extract[field])
+    return "\n".join(lines)
+
+def tender_description(t):
+    # What the model sees as description for a listed tender. Much richer once
+    # the full record has been hydrated (see mercado_logic.attach_details).
+    parts = [f"Organismo: {t['Organismo']}"]
+    if t.get("Region"):
+        parts.append(f"Región: {t['Region']}")
+    if isinstance(t.get("MontoEstimado"), (int, float)) and t["MontoEstimado"] > 0:
+        parts.append(f"Monto estimado: {t['MontoEstimado']:,.0f} {t.get('Moneda') or ''}".strip())
+    description = " | ".join(parts)
+
+    if t.get("Descripcion"):
+        description += f"\nDescripción: {t['Descripcion'][:2000]}"
+    items = t.get("Items") or []
+    if items:
+        lines = [f"- {i.get('Producto') or ''}: {(i.get('Descripcion') or '')[:200]} ({i.get('Cantidad')} {i.get('Unidad') or ''})"
+                 for i in items[:15]]
+        description += "\nÍtems:\n" + "\n".join(lines)
+    return description
+
+def pack_tenders(tenders, criteria="", token_budget=PACKED_TOKEN_BUDGET, max_items=PACKED_MAX_ITEMS):
+    """
+    Splits tenders into chunks whose packed prompt stays within `token_budget`
+    (rough estimate: 4 characters per token), at most `max_items` per chunk.
+    """
+    budget = token_budget - _estimate_tokens(PACKED_PROMPT + criteria)
+    chunks = []
+    chunk = []
+    used = 0
+    for t in tenders:
+        cost = _estimate_tokens(json.dumps(_packed_entry(t), ensure_ascii=False)) + PACKED_OUTPUT_TOKENS_PER_ITEM
+        if chunk and (used + cost > budget or len(chunk) >= max_items):
+            chunks.append(chunk)
+            chunk = []
+            used = 0
+        chunk.append(t)
+        used += cost
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+def _tender_cache_key(t, criteria):
+    return analysis_cache_key(t['CodigoExterno'], t['Nombre'], tender_description(t), criteria)
+
+def _estimate_tokens(text):
+    return len(text) // 4 + 1
+
+def _packed_entry(t):
+    return {"CodigoExterno": t['CodigoExterno'], "Titulo": t['Nombre'], "Descripcion": tender_description(t)}
+
+@metrics.timed("analyze_tenders_packed")
+def analyze_tenders_packed(tenders, criteria="", api_key=None, rate_limiter=None):
+    """
+    Scores several tenders with a single model call. Returns {CodigoExterno: analysis}.
+    Items missing or invalid in the model's answer are re-split into smaller
+    packs, down to single analyze_tender calls.
+    """
+    if not api_key:
+        return {t['CodigoExterno']: _mock_analysis() for t in tenders}
+    if len(tenders) == 1:
+        t = tenders[0]
+        return {t['CodigoExterno']: analyze_tender(t['Nombre'], description=tender_description(t), criteria=criteria,
+                                                   api_key=api_key, rate_limiter=rate_limiter, code=t['CodigoExterno'])}
+
+    context_criteria = f"Criterios/Perfil de la Empresa: {criteria}" if criteria else "Perfil general de tecnología."
+    entries = json.dumps([_packed_entry(t) for t in tenders], ensure_ascii=False, indent=1)
+    prompt = PACKED_PROMPT.format(context_criteria=context_criteria, count=len(tenders), entries=entries)
+
+    wanted = {t['CodigoExterno'] for t in tenders}
+
+    def parse(text):
+        data = json.loads(text)
+        if not isinstance(data, list):
+            raise ValueError("Packed answer is not a JSON array")
+        parsed = {}
+        for item in data:
+            # Keep only well-formed entries for codes we actually asked about
+            if not isinstance(item, dict) or item.get("CodigoExterno") not in wanted:
+                continue
             try:
-                genai.configure(api_key=api_key)
-                model = genai.GenerativeModel(model_name)
-                
-                # Construct Payload
-                content_parts = [prompt]
-                if pdf_data:
-                    content_parts.append({
-                        "mime_type": "application/pdf",
-                        "data": pdf_data
-                    })
-                
-                response = model.generate_content(content_parts)
-                text = response.text.replace("```json", "").replace("```", "").strip()
-                data = json.loads(text)
-                
-                return {
-                    "score": data.get("score", 0),
-                    "reason": data.get("reason", "Sin razón clara")
-                }
-            except Exception as e:
-                error_str = str(e)
-                # If it's a Quota/Rate Limit error, we WAIT and RETRY
-                if "ResourceExhausted" in error_str or "429" in error_str:
-                    wait_time = base_delay * (attempt + 1) # 3, 6, 9, 12, 15...
-                    print(f"[WARN] Quota hit on {model_name}. Waiting {wait_time}s... ({attempt+1}/{max_retries})")
-                    import time
-                    time.sleep(wait_time)
-                    continue
+                score = max(0, min(100, int(item.get("score"))))
+            except (TypeError, ValueError):
+                continue
+            reason = item.get("reason")
+            if isinstance(reason, str) and reason.strip():
+                parsed[item["CodigoExterno"]] = {"score": score, "reason": reason}
+        return parsed
+
+    results = _generate([prompt], api_key, parse, rate_limiter)
+    if results is None:
+        # No model answered (quota, bad key, blocked prompt): smaller calls would fail the same way
+        print("[ERROR] AI capabilities exhausted.")
+        return {t['CodigoExterno']: dict(BUSY_RESULT) for t in tenders}
+    # Packed scores are cached per tender, under the same key a single analysis would use
+    for t in tenders:
+        if t['CodigoExterno'] in results:
+            _cache_put(_tender_cache_key(t, criteria), results[t['CodigoExterno']])
+
+    missing = [t for t in tenders if t['CodigoExterno'] not in results]
+    if missing:
+        print(f"[WARN] Packed answer incomplete ({len(missing)}/{len(tenders)} missing), re-splitting.")
+        half = max(1, len(missing) // 2)
+        for part in (missing[:half], missing[half:]):
+            if part:
+                results.update(analyze_tenders_packed(part, criteria, api_key, rate_limiter))
+    return results
+
+def analyze_batch(tenders, criteria="", api_key=None, max_workers=BATCH_MAX_WORKERS,
+                  requests_per_minute=BATCH_REQUESTS_PER_MINUTE, packed=False, token_budget=PACKED_TOKEN_BUDGET):
+    """
+    Analyzes many tenders concurrently, paced by a token bucket sized to the
+    model quota. Yields (tender, analysis) pairs as soon as each one completes,
+    so callers can update progress incrementally.
+    With packed=True several tenders share one model call (see pack_tenders).
+    """
+    bucket = TokenBucket(rate=requests_per_minute / 60.0, capacity=max_workers)
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        if packed:
+            # Cached tenders come back right away, only the rest get packed
+            pending = []
+            for t in tenders:
+                cached = _cache_get(_tender_cache_key(t, criteria)) if api_key else None
+                if cached is not None:
+                    yield t, cached
                 else:
-                    # If it's another error (e.g. model not found), try the next model in the list
-                    print(f"[WARN] Failed with {model_name} (Non-Quota): {e}")
-                    break # Break inner loop to try next model
-        
-    # If we get here, it means ALL models failed after ALL retries
-    print("[ERROR] AI capabilities exhausted.")
-    return {
-        "score": 0,
-        "reason": "⚠️ IA Ocupada (Tráfico Alto). Espera 1 min e intenta de nuevo."
-    }
+                    pending.append(t)
+
+            futures = {
+                executor.submit(analyze_tenders_packed, chunk, criteria, api_key, bucket): chunk
+                for chunk in pack_tenders(pending, criteria, token_budget)
+            }
+            for future in as_completed(futures):
+                results = future.result()
+                for t in futures[future]:
+                    yield t, results.get(t['CodigoExterno'], dict(BUSY_RESULT))
+        else:
+            futures = {
+                executor.submit(analyze_tender, t['Nombre'], description=tender_description(t),
+                                criteria=criteria, api_key=api_key, rate_limiter=bucket, code=t['CodigoExterno']): t
+                for t in tenders
+            }
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+    except GeneratorExit:
+        # Consumer stopped early (e.g. a Streamlit rerun): drop the queued calls instead of waiting for them
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    except BaseException:
+        executor.shutdown(cancel_futures=True)
+        raise
+    executor.shutdown()
 
 def _heuristic_analysis(title, description, criteria):
     """
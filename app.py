@@ -6,267 +6,209 @@ import analyst
 importlib.reload(mercado_logic)
 importlib.reload(analyst)
 from mercado_logic import get_tenders
-from analyst import analyze_tender
+from analyst import analyze_batch
+from ranking import rank_tenders, bm25_scores
+import tender_frame
 import db
 import time
-import io
+import contextlib
+import functools
+import utils_export
+import metrics
+import mp_client
+import worker
+import semantic
+from utils_pdf import pdf_digest
+
+PAGE_SIZES = [10, 25, 50, 100]
+FAVORITES_PAGE_SIZE = 50
+FAVORITE_ORDERS = {"Cierre": "date", "Score": "score", "Guardado": "added"}
+JOB_POLL_INTERVAL = 2  # seconds between job status checks while waiting on the worker
+FETCH_JOB_TTL = 3600  # a finished fetch is reused like cached_get_tenders
+EVENT_CONSUMER = "app"  # change feed cursor: what was already seen here
 
 # Config
 st.set_page_config(page_title="Tender Vibe Assistant", page_icon="🚀", layout="wide")
 
-# DB Init
-db.init_db()
-
-import json
-
-CONFIG_FILE = "config.json"
-
-def load_config():
-    try:
-        with open(CONFIG_FILE, "r") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        # Fallback/Auto-create with user provided defaults so it always works
-        default_data = {
-            "api_ticket": "21D64027-871C-4D03-A1CA-90D62AACD9A4",
-            "gemini_key": ""
-        }
+# Per-rerun timing; ?profile=1 also dumps a cProfile of this rerun (see metrics.py)
+_run_started = time.perf_counter()
+_profiling = contextlib.ExitStack()
+_profiling.enter_context(metrics.profile("app", st.query_params.get("profile") == "1"))
+
+# Page body: the timing and profile are closed even on st.rerun()/st.stop() or an exception
+try:
+    # DB Init
+    db.init_db()
+
+    import json
+
+    CONFIG_FILE = "config.json"
+
+    def load_config():
+        try:
+            with open(CONFIG_FILE, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            # Fallback/Auto-create with user provided defaults so it always works
+            default_data = {
+                "api_ticket": "21D64027-871C-4D03-A1CA-90D62AACD9A4",
+                "gemini_key": ""
+            }
+            with open(CONFIG_FILE, "w") as f:
+                json.dump(default_data, f)
+            return default_data
+
+    def save_config(t, k, user_email, last_keyword, last_profile):
+        data = {"api_ticket": t, "gemini_key": k, "email_to": user_email, "last_keyword": last_keyword, "last_profile": last_profile}
         with open(CONFIG_FILE, "w") as f:
-            json.dump(default_data, f)
-        return default_data
-
-def save_config(t, k, user_email, last_keyword, last_profile):
-    data = {"api_ticket": t, "gemini_key": k, "email_to": user_email, "last_keyword": last_keyword, "last_profile": last_profile}
-    with open(CONFIG_FILE, "w") as f:
-        json.dump(data, f)
-
-config = load_config()
-from utils_pdf import extract_text_from_pdf
-
-
-def format_date(date_str):
-    try:
-        # Try parsing ISO format
-        dt = datetime.datetime.fromisoformat(date_str)
-        return dt.strftime("%d-%m-%Y %H:%M")
-    except:
-        return date_str
-
-# Wrapper for caching to ensure IDs don't shift between runs
-@st.cache_data(ttl=3600, show_spinner=False)
-def cached_get_tenders(keyword, ticket, start_date, end_date, only_published=True):
-    tenders = get_tenders(keyword, ticket=ticket, start_date=start_date, end_date=end_date, only_published=only_published)
-    # Ensure Link exists for caching generated from older runs or if logic missed it
-    for t in tenders:
-        if "Link" not in t:
-            # Fallback to Google Search because MP portal blocks external referrers/sessions
-            t["Link"] = f"https://www.google.com/search?q=site:mercadopublico.cl+%22{t.get('CodigoExterno')}%22"
-    return tenders
-
-def to_excel(tenders_list):
-    output = io.BytesIO()
-    # Flatten data for nice Excel
-    rows = []
-    for t in tenders_list:
-        # Get AI analysis if available
-        ai_score = 0
-        ai_reason = "No analizado"
-        
-        # Check session state
-        ss_key = f"analysis_{t['CodigoExterno']}"
-        if ss_key in st.session_state:
-            res = st.session_state[ss_key]
-            ai_score = res['score']
-            ai_reason = res['reason']
-        # Or check DB if favorited? (Optional, but let's stick to session state for now as it captures live analysis)
-            
-
-        rows.append({
-            "ID": t['CodigoExterno'],
-            "Nombre": t['Nombre'],
-            "Organismo": t['Organismo'],
-            "Fecha Cierre": t['FechaCierre'],
-            "Estado": t.get('Estado', 'Desconocido'),
-            "Link": t.get('Link', ''),
-            "Score IA": ai_score,
-            "Razón IA": ai_reason
-        })
-    
-    df = pd.DataFrame(rows)
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Licitaciones')
-    return output.getvalue()
-
-# Sidebar
-st.sidebar.title("🎛️ Filtros")
-
-# 1. Main Inputs (Moved UP so they are available for saving)
-# Load defaults from config if available
-default_keyword = config.get("last_keyword", "Tecnología, Computación")
-default_profile = config.get("last_profile", "Soy una empresa de tecnología que busca desarrollo de software. No vendo hardware.")
-
-# Define inputs
-keyword = st.sidebar.text_input("Palabras Clave (separar por comas)", value=default_keyword)
-company_profile = st.sidebar.text_area("Perfil de mi Empresa / Criterios", value=default_profile)
-
-import datetime
-today = datetime.date.today()
-# Default to looking at today, allow picking a range
-date_range = st.sidebar.date_input("Rango de Fechas (Max 7 días)", (today, today))
-
-start_date = today
-end_date = today
-
-if isinstance(date_range, tuple):
-    if len(date_range) == 2:
-        start_date = date_range[0]
-        end_date = date_range[1]
-    elif len(date_range) == 1:
-        start_date = date_range[0]
-        end_date = date_range[0]
-
-show_favorites = st.sidebar.checkbox("⭐ Ver Favoritos")
-filter_published = st.sidebar.checkbox("✅ Solo Publicadas (Nuevas)", value=True, help="Si se desmarca, mostrará también Adjudicadas, Cerradas, etc.")
-
-st.sidebar.markdown("---")
-
-# 2. Config Section (Now has access to 'keyword' and 'company_profile')
-# Inputs with defaults
-default_ticket = config.get("api_ticket", "")
-default_key = config.get("gemini_key", "")
-default_email_to = config.get("email_to", "")
-
-# Collapsible configuration section for APIs
-with st.sidebar.expander("🔐 Configurar APIs (Opcional)"):
-    st.caption("Ingresa tus propias llaves si deseas.")
-    st.markdown("[Obtener Ticket](https://api.mercadopublico.cl) | [Obtener Gemini Key](https://aistudio.google.com/app/apikey)")
-    
-    api_ticket = st.text_input("Mercado Público Ticket", value=default_ticket, type="password")
-    gemini_key = st.text_input("Gemini API Key", value=default_key, type="password")
-
-# Separate section for Email
-with st.sidebar.expander("📧 Configurar Reportes"):
-    st.caption("Recibe las licitaciones en tu correo.")
-    email_to = st.text_input("Email Destinatario", value=default_email_to)
-
-# Global Save Button
-if st.sidebar.button("💾 Guardar Configuración"):
-    save_config(api_ticket, gemini_key, email_to, keyword, company_profile)
-    st.success("¡Configuración guardada!")
-
-# Use config values if input is empty (fallback)
-if not api_ticket:
-    api_ticket = default_ticket
-if not gemini_key:
-    gemini_key = default_key
-
-if not api_ticket:
-    st.warning("⚠️ Modo Prueba")
-
-st.sidebar.markdown("---")
-if st.sidebar.button("🔄 Recargar"):
-    st.cache_data.clear()
-    st.rerun()
-
-st.title("🚀 Asistente de Licitaciones - Vibe Edition")
-
-if show_favorites:
-    st.subheader("Tus Licitaciones Guardadas")
-    favs = db.get_favorites()
-    if favs:
-        df_fav = pd.DataFrame(favs)
-        st.dataframe(df_fav)
-        
-        # Helper to visualize delete buttons better
-        st.write("Gestionar favoritos:")
-        for idx, fav in enumerate(favs):
-            col_a, col_b = st.columns([4, 1])
-            with col_a:
-                st.write(f"📌 {fav['Nombre']} ({fav['CodigoExterno']})")
-            with col_b:
-                if st.button(f"🗑️ Borrar", key=f"del_{fav['CodigoExterno']}_{idx}"):
-                    db.remove_favorite(fav['CodigoExterno'])
-                    st.rerun()
-    else:
-        st.info("No tienes favoritos aún.")
-
-else:
-    # Load Data
-    st.write(f"Buscando licitaciones entre **{start_date} y {end_date}** para: **{keyword}**...")
-    tenders = cached_get_tenders(keyword, ticket=api_ticket, start_date=start_date, end_date=end_date, only_published=filter_published)
-    
-    # BATCH ANALYSIS BUTTON
-    if len(tenders) > 0:
-        if st.button(f"⚡ Analizar Todo ({len(tenders)} licitaciones)"):
-            progress_bar = st.progress(0)
-            status_text = st.empty()
-            
-            for i, t in enumerate(tenders):
-                # Check if already analyzed to save time
-                key = f"analysis_{t['CodigoExterno']}"
-                if key not in st.session_state:
-                    status_text.text(f"Analizando {i+1}/{len(tenders)}: {t['Nombre']}...")
-                    
-                    # Call AI
-                    analysis = analyze_tender(t['Nombre'], description=f"Organismo: {t['Organismo']}", criteria=company_profile, api_key=gemini_key)
-                    st.session_state[key] = analysis
-                    
-                    time.sleep(1) # Polite delay for API
-                
-                progress_bar.progress((i + 1) / len(tenders))
-            
-            status_text.success("¡Análisis Completo!")
-            # st.rerun() # Removed to prevent UI reset which hides results
-
-    # General Export Button (always visible if results exist)
-    if len(tenders) > 0:
-        excel_data = to_excel(tenders)
-        st.download_button(
-            label="📥 Descargar Excel",
-            data=excel_data,
-            file_name=f"licitaciones_{keyword}_{start_date}.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
-
-    # Display as Grid or Table
-    for idx, t in enumerate(tenders):
+            json.dump(data, f)
+
+    config = load_config()
+
+
+    def format_date(date_str):
+        try:
+            # Try parsing ISO format
+            dt = datetime.datetime.fromisoformat(date_str)
+            return dt.strftime("%d-%m-%Y %H:%M")
+        except:
+            return date_str
+
+    # Wrapper for caching to ensure IDs don't shift between runs
+    @st.cache_data(ttl=3600, show_spinner=False)
+    def cached_get_tenders(keyword, ticket, start_date, end_date, only_published=True, semantic_match=False):
+        # Columnar result: compact to cache, links are derived when rendering
+        return get_tenders(keyword, ticket=ticket, start_date=start_date, end_date=end_date, only_published=only_published,
+                           as_frame=True, semantic_match=semantic_match)
+
+    @st.cache_data(ttl=300, show_spinner=False)
+    def cached_search_local(keyword, start_date, end_date, only_published=True, semantic_match=False):
+        # Historical search over the local FTS index (or the embeddings), never touches the network
+        estado = "Publicada" if only_published else None
+        if semantic_match:
+            tenders = db.get_listings(semantic.search(keyword), date_from=start_date, date_to=end_date, estado=estado)
+        else:
+            tenders = db.search_tenders(keyword, date_from=start_date, date_to=end_date, estado=estado)
+        return tender_frame.to_frame(tenders)
+
+    def store_analysis(code, analysis):
+        st.session_state[f"analysis_{code}"] = analysis
+        # Any new analysis invalidates the cached exports
+        st.session_state["analysis_version"] = st.session_state.get("analysis_version", 0) + 1
+
+    def session_analyses():
+        # AI analysis from session state (captures live analysis), by code
+        return {key[len("analysis_"):]: res for key, res in st.session_state.items()
+                if isinstance(key, str) and key.startswith("analysis_")}
+
+    def job_credentials():
+        # The worker reads config.json; only keys typed here but not saved travel with the job
+        return {name: value for name, value in (("api_ticket", api_ticket), ("gemini_key", gemini_key))
+                if value and value != config.get(name)}
+
+    def submit_job(kind, params, key, reuse_for=0):
+        """
+        Enqueues (or reuses) the job for `key` in this session. A failed job is
+        kept, so it is shown instead of being retried on every rerun.
+        """
+        jobs = st.session_state.setdefault("jobs", {})
+        job = db.get_job(jobs[key], with_result=False) if key in jobs else None
+        if job is None or (job["status"] == "done" and time.time() - job["finished_at"] > reuse_for):
+            jobs[key] = db.enqueue_job(kind, params, key=key, reuse_for=reuse_for)
+            job = db.get_job(jobs[key], with_result=False)
+        return job
+
+    @st.cache_data(show_spinner=False)
+    def cached_job_frame(job_id):
+        # Finished jobs don't change: decoded once
+        return tender_frame.to_frame(db.get_job(job_id)["result"])
+
+    @st.fragment(run_every=JOB_POLL_INTERVAL)
+    def job_progress(job_id, label):
+        # Polls only this fragment; the whole script reruns once the job ends
+        job = db.get_job(job_id, with_result=False)
+        if job["status"] not in db.JOB_ACTIVE:
+            st.rerun()
+        waiting = "en cola" if job["status"] == "queued" else "en curso"
+        st.progress(job["progress"], text=f"{label} ({job['message'] or waiting})")
+
+    @st.fragment(run_every=JOB_POLL_INTERVAL)
+    def batch_progress(job_id, names):
+        job = db.get_job(job_id)
+        if job["status"] not in db.JOB_ACTIVE:
+            st.rerun()
+        st.progress(job["progress"], text=job["message"] or "En cola...")
+        with st.container(height=250):
+            for code, analysis in reversed(list((job["result"] or {}).items())):
+                st.write(f"**{analysis['score']}/100** · {names.get(code, code)} — {analysis['reason']}")
+
+    def change_label(event):
+        if event["kind"] == db.EVENT_NEW:
+            return "🆕 Nueva"
+        estados = mercado_logic.CODIGO_ESTADO_MAP
+        return f"🔄 {estados.get(event['old_estado'], event['old_estado'])} → {estados.get(event['new_estado'], event['new_estado'])}"
+
+    def export_data(frame, analyses, fmt, cache_key, cache):
+        # Only runs when the download is requested; reused until the results or analyses change
+        if cache_key not in cache:
+            for stale in [k for k in cache if k[:2] != cache_key[:2]]:
+                del cache[stale]
+            with metrics.timer("export", fmt=fmt, rows=len(frame)):
+                cache[cache_key] = utils_export.export_bytes(utils_export.export_frame(frame, analyses), fmt)
+        return cache[cache_key]
+
+    def render_tender_card(t, idx):
+        # Full card with per-tender widgets (PDF upload, analyze, favorite)
         with st.container(border=True):
             col1, col2, col3 = st.columns([3, 1, 1])
             with col1:
                 st.subheader(f"{t['Nombre']}")
                 st.caption(f"ID: {t['CodigoExterno']} | {t['Organismo']}")
                 st.caption(f"📌 Estado: **{t.get('Estado', 'N/A')}** | Publicado: {t.get('FechaPublicacion', 'N/A')}")
-                # Fallback link generation just in case
-                link = t.get('Link', f"https://www.google.com/search?q=site:mercadopublico.cl+%22{t.get('CodigoExterno')}%22")
-                st.markdown(f"[🔎 Buscar en Google (Ficha)]({link})")
+                if t['CodigoExterno'] in tender_changes:
+                    st.caption(change_label(tender_changes[t['CodigoExterno']]))
+                st.markdown(f"[🔎 Buscar en Google (Ficha)]({t['Link']})")
             with col2:
                 formatted_date = format_date(t['FechaCierre'])
                 st.write(f"📅 **Cierre:**\n{formatted_date}")
             with col3:
                 # PDF Uploader
                 uploaded_pdf = st.file_uploader("📂 PDF", type="pdf", key=f"pdf_{t['CodigoExterno']}_{idx}", label_visibility="collapsed")
-                
+                # Documents are read by the AI once, then analyzed from their stored requirements
+                pdf_sha = pdf_digest(uploaded_pdf) if uploaded_pdf else None
+            
                 # Unique key for analysis button
+                job_key = f"job_{t['CodigoExterno']}"
                 if st.button("🤖 Analizar", key=f"btn_{t['CodigoExterno']}_{idx}"):
-                    pdf_bytes = None
-                    spinner_text = "🤖 Analizando licitación..."
-                    
-                    if uploaded_pdf:
-                        # Use bytes directly for Gemini Vision (OCR)
-                        pdf_bytes = uploaded_pdf.getvalue()
-                        spinner_text = "🧠 Leyendo documento adjunto (PDF/Imagen) y analizando..."
-                    
-                    with st.spinner(spinner_text):
-                        # Pass pdf_data instead of extra_context
-                        analysis = analyze_tender(t['Nombre'], description=f"Organismo: {t['Organismo']}", criteria=company_profile, api_key=gemini_key, pdf_data=pdf_bytes)
-                        st.session_state[f"analysis_{t['CodigoExterno']}"] = analysis
-                
+                    if use_worker:
+                        pdf_path = worker.save_job_file(uploaded_pdf.getvalue()) if uploaded_pdf else None
+                        st.session_state[job_key] = db.enqueue_job("analyze", {"tender": t, "criteria": company_profile, "pdf_path": pdf_path, **job_credentials()})
+                    else:
+                        spinner_text = "🤖 Analizando licitación..."
+                        if uploaded_pdf:
+                            spinner_text = ("📄 Documento ya leído, analizando sus requisitos..."
+                                            if db.get_pdf_extract(pdf_sha, analyst.REQUIREMENTS_VERSION)
+                                            else "🧠 Leyendo documento adjunto (PDF/Imagen) y analizando...")
+                        with st.spinner(spinner_text):
+                            store_analysis(t['CodigoExterno'], worker.run_analysis(t, company_profile, gemini_key, pdf=uploaded_pdf))
+
+                if job_key in st.session_state:
+                    job = db.get_job(st.session_state[job_key])
+                    if job["status"] in db.JOB_ACTIVE:
+                        job_progress(job["id"], "🤖 Analizando")
+                    else:
+                        del st.session_state[job_key]
+                        if job["status"] == "done":
+                            store_analysis(t['CodigoExterno'], job["result"])
+                        else:
+                            st.error(f"Falló el análisis: {job['error']}")
+            
             # Analysis Result
             if f"analysis_{t['CodigoExterno']}" in st.session_state:
                 res = st.session_state[f"analysis_{t['CodigoExterno']}"]
                 score = res.get("score", 0)
                 reason = res.get("reason", "No reason provided")
-                
+            
                 # Visual feedback for PDF
                 pdf_badge = ""
                 if "[PDF]" in reason:
@@ -279,7 +221,18 @@ else:
                     st.warning(f"⚠️ Score: {score}/100 - {pdf_badge}{reason}")
                 else:
                     st.info(f"❄️ Score: {score}/100 - {pdf_badge}{reason}")
-                
+
+                document = db.get_pdf_extract(pdf_sha, analyst.REQUIREMENTS_VERSION) if pdf_sha else None
+                if document:
+                    with st.expander(f"📄 Requisitos del documento ({document['pages']} páginas)"):
+                        if document["resumen"]:
+                            st.write(document["resumen"])
+                        if document["presupuesto"]:
+                            st.markdown(f"**Presupuesto:** {document['presupuesto']}")
+                        for field, label in analyst.REQUIREMENT_FIELDS.items():
+                            if document[field]:
+                                st.markdown(f"**{label}:**\n" + "\n".join(f"- {item}" for item in document[field]))
+            
                 if st.button("⭐ Guardar Favorito", key=f"fav_{t['CodigoExterno']}"):
                     t_data = t.copy()
                     t_data['ai_score'] = res['score']
@@ -289,9 +242,303 @@ else:
                     else:
                         st.warning("Ya existe en favoritos")
 
-# Footer
-st.markdown("---")
-st.caption("Powered by Vibe Coding 🚀 & Cris")
+    # Sidebar
+    st.sidebar.title("🎛️ Filtros")
+
+    # 1. Main Inputs (Moved UP so they are available for saving)
+    # Load defaults from config if available
+    default_keyword = config.get("last_keyword", "Tecnología, Computación")
+    default_profile = config.get("last_profile", "Soy una empresa de tecnología que busca desarrollo de software. No vendo hardware.")
+
+    # Define inputs
+    keyword = st.sidebar.text_input("Palabras Clave (separar por comas)", value=default_keyword)
+    company_profile = st.sidebar.text_area("Perfil de mi Empresa / Criterios", value=default_profile)
+
+    import datetime
+    today = datetime.date.today()
+    # Default to looking at today, allow picking a range
+    date_range = st.sidebar.date_input("Rango de Fechas", (today, today), help="Máximo 8 días nuevos por búsqueda; los días ya descargados (backfill.py) no cuentan.")
+
+    start_date = today
+    end_date = today
+
+    if isinstance(date_range, tuple):
+        if len(date_range) == 2:
+            start_date = date_range[0]
+            end_date = date_range[1]
+        elif len(date_range) == 1:
+            start_date = date_range[0]
+            end_date = date_range[0]
+
+    show_favorites = st.sidebar.checkbox("⭐ Ver Favoritos")
+    # Latest unseen event (new tender / state change) per code, see db.diff_snapshot
+    tender_changes = {}
+    filter_published = st.sidebar.checkbox("✅ Solo Publicadas (Nuevas)", value=True, help="Si se desmarca, mostrará también Adjudicadas, Cerradas, etc.")
+    search_local = st.sidebar.checkbox("🗄️ Buscar en Histórico Local", help="Busca en las licitaciones ya indexadas (ingest.py), sin conexión y sin límite de 7 días. Resultados ordenados por relevancia.")
+    semantic_match = st.sidebar.checkbox("🧠 Búsqueda Semántica", help="Encuentra también licitaciones parecidas aunque no usen tus palabras (\"notebooks\" ~ \"computadores portátiles\"). Se calcula localmente, sin costo de IA.")
+
+    st.sidebar.markdown("---")
+
+    # 2. Config Section (Now has access to 'keyword' and 'company_profile')
+    # Inputs with defaults
+    default_ticket = config.get("api_ticket", "")
+    default_key = config.get("gemini_key", "")
+    default_email_to = config.get("email_to", "")
+
+    # Collapsible configuration section for APIs
+    with st.sidebar.expander("🔐 Configurar APIs (Opcional)"):
+        st.caption("Ingresa tus propias llaves si deseas.")
+        st.markdown("[Obtener Ticket](https://api.mercadopublico.cl) | [Obtener Gemini Key](https://aistudio.google.com/app/apikey)")
+    
+        api_ticket = st.text_input("Mercado Público Ticket", value=default_ticket, type="password")
+        gemini_key = st.text_input("Gemini API Key", value=default_key, type="password")
+
+    # Separate section for Email
+    with st.sidebar.expander("📧 Configurar Reportes"):
+        st.caption("Recibe las licitaciones en tu correo.")
+        email_to = st.text_input("Email Destinatario", value=default_email_to)
+
+    # Global Save Button
+    if st.sidebar.button("💾 Guardar Configuración"):
+        save_config(api_ticket, gemini_key, email_to, keyword, company_profile)
+        st.success("¡Configuración guardada!")
+
+    # Use config values if input is empty (fallback)
+    if not api_ticket:
+        api_ticket = default_ticket
+    if not gemini_key:
+        gemini_key = default_key
+
+    if not api_ticket:
+        st.warning("⚠️ Modo Prueba")
+
+    # With `python worker.py` running, heavy work is queued to it instead of blocking this script
+    use_worker = worker.worker_available()
+    if use_worker:
+        st.sidebar.caption("⚙️ Worker activo: búsquedas y análisis en segundo plano")
+
+    st.sidebar.markdown("---")
+    if st.sidebar.button("🔄 Recargar"):
+        st.cache_data.clear()
+        st.rerun()
+
+    st.title("🚀 Asistente de Licitaciones - Vibe Edition")
+
+    if show_favorites:
+        st.subheader("Tus Licitaciones Guardadas")
+        col_search, col_score, col_order = st.columns([2, 1, 1])
+        with col_search:
+            fav_search = st.text_input("🔍 Buscar", placeholder="Nombre o ID", key="fav_search")
+        with col_score:
+            fav_min_score = st.number_input("Score mínimo", min_value=0, max_value=100, value=0, key="fav_min_score")
+        with col_order:
+            fav_order = st.selectbox("Ordenar por", list(FAVORITE_ORDERS), key="fav_order")
+
+        # State changes (Adjudicada, Revocada...) of saved tenders picked up by the change feed
+        fav_events = db.get_events(kinds=[db.EVENT_STATE], favorites_only=True)
+        if fav_events:
+            with st.expander(f"🔔 Cambios de estado en favoritos ({len(fav_events)})"):
+                for e in reversed(fav_events[-20:]):
+                    st.write(f"{change_label(e)} · **{e['nombre']}** ({e['codigo']}) — {datetime.datetime.fromtimestamp(e['created_at']):%d-%m-%Y %H:%M}")
+
+        fav_total = db.count_favorites(min_score=fav_min_score, search=fav_search)
+        if fav_total:
+            fav_pages = max(1, -(-fav_total // FAVORITES_PAGE_SIZE))
+            fav_page = st.number_input(f"Página (de {fav_pages})", min_value=1, max_value=fav_pages, value=1)
+            favs = db.get_favorites(limit=FAVORITES_PAGE_SIZE, offset=(fav_page - 1) * FAVORITES_PAGE_SIZE,
+                                    min_score=fav_min_score, search=fav_search, order_by=FAVORITE_ORDERS[fav_order])
+            df_fav = pd.DataFrame(favs)
+
+            # Select rows in the table, then delete them all in one transaction
+            event = st.dataframe(df_fav, hide_index=True, width="stretch", on_select="rerun",
+                                 selection_mode="multi-row", key="fav_table")
+            selected = [favs[i]['CodigoExterno'] for i in event.selection.rows if i < len(favs)]
+            if st.button(f"🗑️ Borrar seleccionados ({len(selected)})", disabled=not selected):
+                db.remove_favorites_many(selected)
+                st.rerun()
+        else:
+            st.info("No tienes favoritos aún.")
+
+    else:
+        # Load Data
+        st.write(f"Buscando licitaciones entre **{start_date} y {end_date}** para: **{keyword}**...")
+        if search_local:
+            tenders = cached_search_local(keyword, start_date, end_date, only_published=filter_published, semantic_match=semantic_match)
+        elif use_worker:
+            # The worker also queues the detail hydration once the listing is in
+            fetch_job = submit_job("fetch", {"keyword": keyword, "start_date": start_date.isoformat(), "end_date": end_date.isoformat(),
+                                             "only_published": filter_published, "semantic": semantic_match, **job_credentials()},
+                                   key=f"fetch:{keyword}|{start_date}|{end_date}|{filter_published}|{semantic_match}", reuse_for=FETCH_JOB_TTL)
+            if fetch_job["status"] == "done":
+                tenders = cached_job_frame(fetch_job["id"])
+            else:
+                if fetch_job["status"] == "failed":
+                    st.error(f"Falló la búsqueda: {fetch_job['error']}")
+                    if st.button("🔁 Reintentar"):
+                        del st.session_state["jobs"][fetch_job["key"]]
+                        st.rerun()
+                else:
+                    job_progress(fetch_job["id"], "📡 Buscando licitaciones")
+                tenders = tender_frame.empty_frame()
+        else:
+            tenders = cached_get_tenders(keyword, ticket=api_ticket, start_date=start_date, end_date=end_date, only_published=filter_published,
+                                         semantic_match=semantic_match)
+            # Full records (description, items, amounts) load in the background for the AI
+            mercado_logic.start_background_hydration(tender_frame.to_records(tenders.filter(["CodigoExterno", "CodigoEstado"])), api_ticket)
+    
+        # BATCH ANALYSIS BUTTON
+        if len(tenders) > 0:
+            col_packed, col_topk = st.columns(2)
+            with col_packed:
+                packed_mode = st.checkbox("📦 Modo Empaquetado", value=True, help="Evalúa varias licitaciones por llamada a la IA. Usa mucha menos cuota en días con muchas licitaciones.")
+            with col_topk:
+                top_k = st.number_input("🎯 Analizar solo las más relevantes", min_value=1, max_value=len(tenders), value=min(50, len(tenders)),
+                                        help="Un ranking local (BM25, o similitud semántica si está activa, contra tu perfil) elige qué licitaciones se envían a la IA. Las que no mencionan nada de tu perfil se omiten.")
+            if st.button(f"⚡ Analizar Todo ({len(tenders)} licitaciones)"):
+                if use_worker:
+                    # Ranked and analyzed by the worker; already analyzed tenders are skipped to save time and quota
+                    st.session_state["batch_job"] = db.enqueue_job("analyze_batch", {
+                        "tenders": [{k: v for k, v in t.items() if k != "Link"} for t in tender_frame.iter_records(tenders)],
+                        "criteria": company_profile, "top_k": int(top_k), "packed": packed_mode, "semantic": semantic_match,
+                        "skip": list(session_analyses()), **job_credentials()})
+                else:
+                    progress_bar = st.progress(0)
+                    status_text = st.empty()
+                    live_results = st.container(height=250)
+            
+                    # Local pre-filter, then skip tenders already analyzed to save time and quota
+                    candidates = rank_tenders(mercado_logic.attach_details(tender_frame.to_records(tenders)), company_profile, top_k=int(top_k), min_score=0,
+                                              scorer=semantic.profile_scores if semantic_match else bm25_scores)
+                    pending = [t for t in candidates if f"analysis_{t['CodigoExterno']}" not in st.session_state]
+                    total = len(candidates)
+                    done = total - len(pending)
+                    status_text.text(f"{total} de {len(tenders)} licitaciones pasan el filtro local.")
+                    progress_bar.progress(done / total if total else 1.0)
+            
+                    # Runs concurrently (rate limited inside analyze_batch), results arrive as they finish
+                    for t, analysis in analyze_batch(pending, criteria=company_profile, api_key=gemini_key, packed=packed_mode):
+                        store_analysis(t['CodigoExterno'], analysis)
+                        done += 1
+                        status_text.text(f"Analizado {done}/{total}: {t['Nombre']}")
+                        live_results.write(f"**{analysis['score']}/100** · {t['Nombre']} — {analysis['reason']}")
+                        progress_bar.progress(done / total)
+            
+                    status_text.success("¡Análisis Completo!")
+                    # st.rerun() # Removed to prevent UI reset which hides results
+
+            if "batch_job" in st.session_state:
+                batch_job = db.get_job(st.session_state["batch_job"])
+                if batch_job["status"] in db.JOB_ACTIVE:
+                    batch_progress(batch_job["id"], dict(zip(tenders["CodigoExterno"], tenders["Nombre"])))
+                else:
+                    del st.session_state["batch_job"]
+                    for code, analysis in (batch_job["result"] or {}).items():
+                        store_analysis(code, analysis)
+                    if batch_job["status"] == "done":
+                        st.success("¡Análisis Completo!")
+                    else:
+                        st.error(f"Falló el análisis: {batch_job['error']}")
+
+        # General Export Button (always visible if results exist)
+        if len(tenders) > 0:
+            col_fmt, col_download = st.columns([1, 3])
+            with col_fmt:
+                export_fmt = st.selectbox("Formato", utils_export.available_formats(),
+                                          format_func=lambda f: utils_export.EXPORT_FORMATS[f][0], label_visibility="collapsed")
+            label, extension, mime = utils_export.EXPORT_FORMATS[export_fmt]
+            # Every input that changes the frame; the row count catches a listing refreshed after its TTL
+            result_key = (search_local, semantic_match, keyword, start_date, end_date, filter_published, len(tenders))
+            cache_key = (result_key, st.session_state.get("analysis_version", 0), export_fmt)
+            export_cache = st.session_state.setdefault("export_cache", {})
+            analyses = session_analyses()
+            with col_download:
+                st.download_button(
+                    label=f"📥 Descargar {label}",
+                    data=functools.partial(export_data, tenders, analyses, export_fmt, cache_key, export_cache),
+                    file_name=f"licitaciones_{keyword}_{start_date}.{extension}",
+                    mime=mime
+                )
+
+        # Display: filtering and sorting run on the frame, widgets only for what is visible
+        if len(tenders) > 0:
+            seen_event = db.get_event_cursor(EVENT_CONSUMER) or 0
+            tender_changes = {e['codigo']: e for e in db.get_events(seen_event, codes=tenders["CodigoExterno"].tolist())}
+            col_filter, col_sort, col_mode = st.columns([2, 1, 1])
+            with col_filter:
+                text_filter = st.text_input("🔍 Filtrar resultados", placeholder="Nombre u organismo")
+                col_new, col_seen = st.columns(2)
+                with col_new:
+                    only_changes = st.checkbox(f"🆕 Solo novedades ({len(tender_changes)})", disabled=not tender_changes,
+                                               help="Licitaciones nuevas o que cambiaron de estado desde la última vez que marcaste todo como visto.")
+                with col_seen:
+                    if st.button("✔️ Marcar como visto", disabled=not tender_changes):
+                        db.set_event_cursor(EVENT_CONSUMER, db.latest_event_id())
+                        st.rerun()
+            with col_sort:
+                sort_options = {"Publicación": None, "Cierre": "FechaCierre", "Organismo": "Organismo", "Nombre": "Nombre"}
+                if "Relevancia" in tenders:
+                    sort_options = {"Relevancia": None, **{k: v for k, v in sort_options.items() if v}}
+                if "Similitud" in tenders:
+                    sort_options["Similitud"] = "Similitud"
+                sort_by = sort_options[st.selectbox("↕️ Ordenar por", list(sort_options))]
+            with col_mode:
+                view_mode = st.radio("Vista", ["Tarjetas", "Tabla"], horizontal=True)
+
+            view = tender_frame.filter_text(tenders, text_filter)
+            if only_changes:
+                view = view[view["CodigoExterno"].isin(tender_changes)].reset_index(drop=True)
+            if sort_by:
+                # Similarity is a score: best first
+                view = view.sort_values(sort_by, ascending=sort_by != "Similitud", kind="stable", ignore_index=True)
+            if len(view) < len(tenders):
+                st.caption(f"{len(view)} de {len(tenders)} licitaciones")
+
+            if view_mode == "Tabla":
+                # One virtualized grid; the full card is only built for the selected row
+                analyses = session_analyses()
+                table = view.filter(["CodigoExterno", "Nombre", "Organismo", "FechaCierre", "Estado"]).assign(
+                    Score=view["CodigoExterno"].map(lambda c: analyses[c]['score'] if c in analyses else None),
+                    Novedad=view["CodigoExterno"].map(lambda c: change_label(tender_changes[c]) if c in tender_changes else ""),
+                    Link=tender_frame.links(view))
+                event = st.dataframe(table, hide_index=True, width="stretch", on_select="rerun",
+                                     selection_mode="single-row", key="tender_table",
+                                     column_config={"Link": st.column_config.LinkColumn("Ficha", display_text="🔎")})
+                for row in event.selection.rows:
+                    if row < len(view):
+                        render_tender_card(next(tender_frame.iter_records(view.iloc[[row]])), row)
+            else:
+                col_size, col_page = st.columns(2)
+                with col_size:
+                    page_size = st.selectbox("Por página", PAGE_SIZES)
+                n_pages = max(1, -(-len(view) // page_size))
+                with col_page:
+                    # The label changes with the page count, which resets to page 1 on new filters
+                    page = st.number_input(f"Página (de {n_pages})", min_value=1, max_value=n_pages, value=1)
+                first = (page - 1) * page_size
+                for idx, t in enumerate(tender_frame.iter_records(view.iloc[first:first + page_size]), start=first):
+                    render_tender_card(t, idx)
+
+    # Footer
+    st.markdown("---")
+    ai_cache = analyst.cache_stats()
+    st.caption(f"🧠 Caché IA (esta ejecución): {ai_cache['hits']} aciertos / {ai_cache['misses']} fallos")
+    st.caption("Powered by Vibe Coding 🚀 & Cris")
+finally:
+    metrics.record("app.rerun", time.perf_counter() - _run_started)
+    _profiling.close()
+
+# Hidden diagnostics panel: open the app with ?diag=1
+if st.query_params.get("diag") == "1":
+    with st.expander("🩺 Diagnóstico", expanded=True):
+        hours = st.number_input("Últimas horas", min_value=1, value=24)
+        diag = metrics.read_log(since=time.time() - hours * 3600)
+        if diag["stages"]:
+            st.dataframe(pd.DataFrame.from_dict(diag["stages"], orient="index").sort_values("p95_ms", ascending=False), width="stretch")
+        st.json({"counters": diag["counters"], "http": mp_client.stats(), "modelos": analyst.scheduler_stats(), "cache_ia": analyst.cache_stats()})
+        jobs = db.get_jobs(limit=20)
+        if jobs:
+            st.dataframe(pd.DataFrame(jobs).filter(["id", "kind", "status", "progress", "attempts", "worker", "message", "error"]),
+                         hide_index=True, width="stretch")
 
 
 
@@ -0,0 +1,113 @@
+import argparse
+import datetime
+import json
+import time
+import db
+import metrics
+import semantic
+from mercado_logic import fetch_day_listing, get_rate_limiter, API_URL, CODIGO_ESTADO_MAP
+
+CONFIG_FILE = "config.json"
+
+# Backfills run unattended for hours: one request at a time, well spaced.
+BACKFILL_MIN_INTERVAL = 2.0  # seconds between request starts
+# Consecutive failed days before giving up (the ticket is probably throttled/banned)
+MAX_CONSECUTIVE_FAILURES = 5
+FAILURE_BACKOFF = 30  # seconds, multiplied by the consecutive failure count
+
+def load_config():
+    with open(CONFIG_FILE, "r") as f:
+        return json.load(f)
+
+@metrics.timed("backfill.day")
+def backfill_day(day, ticket, limiter):
+    """
+    Brings one day into the local store (raw listing cache + full-text index).
+    Returns the number of listings, or None if the API call failed.
+    """
+    items = db.get_raw_listing(day)
+    if items is None:
+        items = fetch_day_listing(day, ticket, limiter)
+        if items is None:
+            return None
+        db.save_raw_listing(day, items)
+    # Known to the change feed, but past days are not reported as new tenders
+    db.diff_snapshot(day, items, emit=day >= datetime.date.today())
+    semantic.index_items(items)
+    return db.index_listings(day, items, CODIGO_ESTADO_MAP)
+
+def run_backfill(start_date, end_date, ticket, min_interval=BACKFILL_MIN_INTERVAL,
+                 max_failures=MAX_CONSECUTIVE_FAILURES, failure_backoff=FAILURE_BACKOFF):
+    """
+    Loads every day between `start_date` and `end_date`, checkpointing each
+    completed day in tenders.db (backfill_progress). Re-running the same range
+    skips finished days, so an interrupted or banned run resumes where it stopped.
+    Returns a stats dict.
+    """
+    today = datetime.date.today()
+    done = db.get_backfill_done(start_date, end_date)
+    pending = []
+    day = start_date
+    while day <= end_date:
+        if day not in done:
+            pending.append(day)
+        day += datetime.timedelta(days=1)
+
+    print(f"[INFO] {len(done)} days already done, {len(pending)} pending.")
+    limiter = get_rate_limiter(API_URL, min_interval)
+    stats = {"days": 0, "listings": 0, "failed": 0, "skipped": len(done), "aborted": False}
+    failures = 0
+    t0 = time.perf_counter()
+
+    try:
+        for day in pending:
+            try:
+                count = backfill_day(day, ticket, limiter)
+            except Exception as e:
+                print(f"[ERROR] {day.isoformat()}: {e}")
+                count = None
+
+            if count is None:
+                stats["failed"] += 1
+                failures += 1
+                db.mark_backfill_day(day, "failed", error="fetch failed")
+                if failures >= max_failures:
+                    print(f"[ERROR] {failures} consecutive failures, stopping. Re-run to resume.")
+                    stats["aborted"] = True
+                    break
+                time.sleep(failure_backoff * failures)
+                continue
+
+            failures = 0
+            stats["days"] += 1
+            stats["listings"] += count
+            # Today's listing is still changing: store it, but don't mark it final
+            if day < today:
+                db.mark_backfill_day(day, "done", listings=count)
+
+            elapsed = time.perf_counter() - t0
+            print(f"[INFO] {day.isoformat()}: {count} listings "
+                  f"({stats['days'] / elapsed * 60:.1f} days/min, {stats['listings'] / elapsed:.1f} listings/s)")
+    except KeyboardInterrupt:
+        print("[WARN] Interrupted. Re-run the same range to resume.")
+        stats["aborted"] = True
+
+    elapsed = time.perf_counter() - t0
+    stats["elapsed"] = elapsed
+    stats["days_per_min"] = stats["days"] / elapsed * 60 if elapsed else 0.0
+    stats["listings_per_s"] = stats["listings"] / elapsed if elapsed else 0.0
+    return stats
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resumable day-by-day backfill of Mercado Público listings into tenders.db")
+    parser.add_argument("--from", dest="date_from", type=datetime.date.fromisoformat, required=True)
+    parser.add_argument("--to", dest="date_to", type=datetime.date.fromisoformat, default=datetime.date.today())
+    parser.add_argument("--interval", type=float, default=BACKFILL_MIN_INTERVAL,
+                        help="Seconds between API requests")
+    args = parser.parse_args()
+
+    config = load_config()
+    stats = run_backfill(args.date_from, args.date_to, config.get("api_ticket"), min_interval=args.interval)
+    print(f"Done. {stats['days']} days ({stats['skipped']} already done, {stats['failed']} failed), "
+          f"{stats['listings']} listings in {stats['elapsed']:.0f}s: "
+          f"{stats['days_per_min']:.1f} days/min, {stats['listings_per_s']:.1f} listings/s.")
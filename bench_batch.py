@@ -0,0 +1,50 @@
+import os
+import tempfile
+import time
+import analyst
+import db
+from bench_support import install_fake_gemini
+
+N_TENDERS = 200
+LATENCY = 0.3
+ERROR_RATE = 0.1
+
+def make_tenders(n):
+    return [{"CodigoExterno": f"{i}-LE26", "Nombre": f"Licitación de prueba {i}", "Organismo": "Municipalidad"} for i in range(n)]
+
+def bench_batch():
+    # Fast retries so injected 429s don't dominate the run
+    analyst.scheduler.base_delay = 0.2
+    tenders = make_tenders(N_TENDERS)
+    print(f"{N_TENDERS} tenders, {LATENCY}s model latency, {ERROR_RATE:.0%} injected 429s\n")
+
+    # Old app behaviour: serial calls plus time.sleep(1) between them
+    # Fresh throwaway database per run so the analysis cache starts cold
+    db.DB_NAME = os.path.join(tempfile.mkdtemp(), "bench_serial.db")
+    model = install_fake_gemini(latency=LATENCY, error_rate=ERROR_RATE)
+    t0 = time.perf_counter()
+    for t in tenders[:10]:
+        analyst.analyze_tender(t["Nombre"], description=f"Organismo: {t['Organismo']}", api_key="FAKE")
+        time.sleep(1)
+    serial = (time.perf_counter() - t0) * N_TENDERS / 10
+    print(f"Serial + sleep(1) (extrapolated): {serial:6.2f}s")
+
+    for label, packed in [("analyze_batch", False), ("analyze_batch packed", True)]:
+        # Packed answers also drop 5% of the items to exercise re-splitting
+        db.DB_NAME = os.path.join(tempfile.mkdtemp(), f"bench_{'packed' if packed else 'single'}.db")
+        model = install_fake_gemini(latency=LATENCY, error_rate=ERROR_RATE, drop_rate=0.05 if packed else 0.0)
+        t0 = time.perf_counter()
+        first = None
+        results = {}
+        for t, analysis in analyst.analyze_batch(tenders, api_key="FAKE", max_workers=8, requests_per_minute=600, packed=packed):
+            first = first or time.perf_counter() - t0
+            results[t["CodigoExterno"]] = analysis
+        elapsed = time.perf_counter() - t0
+
+        failed = sum(1 for a in results.values() if "IA Ocupada" in a["reason"])
+        print(f"\n{label} (8 workers, 600 rpm): {elapsed:6.2f}s  first result after {first:.2f}s")
+        print(f"  results: {len(results)}/{N_TENDERS}, gave up: {failed}, model calls: {model.calls}")
+        print(f"  scheduler: {analyst.scheduler_stats()}")
+
+if __name__ == "__main__":
+    bench_batch()
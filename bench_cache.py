@@ -0,0 +1,32 @@
+import datetime
+import os
+import tempfile
+import time
+import db
+import mercado_logic
+from bench_support import StubServer
+
+KEYWORDS = ["computación", "aseo", "computación, aseo", "software", ""]
+
+def bench_cache():
+    # Work on a throwaway database so the real tenders.db is untouched
+    db.DB_NAME = os.path.join(tempfile.mkdtemp(), "bench_tenders.db")
+    start_date = datetime.date(2026, 1, 5)
+    end_date = start_date + datetime.timedelta(days=6)
+
+    with StubServer(default_latency=0.5, items_per_day=3000) as server:
+        mercado_logic.API_URL = server.url
+
+        t0 = time.perf_counter()
+        mercado_logic.get_tenders(KEYWORDS[0], ticket="STUB", start_date=start_date, end_date=end_date, min_interval=0.05)
+        print(f"Cold week ({server.requests} HTTP calls): {time.perf_counter() - t0:.2f}s\n")
+
+        for keyword in KEYWORDS:
+            before = server.requests
+            t0 = time.perf_counter()
+            tenders = mercado_logic.get_tenders(keyword, ticket="STUB", start_date=start_date, end_date=end_date)
+            elapsed_ms = (time.perf_counter() - t0) * 1000
+            print(f"keyword={keyword!r:22s} {elapsed_ms:8.1f} ms  HTTP calls: {server.requests - before}  ({len(tenders)} tenders)")
+
+if __name__ == "__main__":
+    bench_cache()
@@ -0,0 +1,38 @@
+import copy
+import datetime
+import os
+import tempfile
+import time
+import db
+from bench_support import make_listing
+
+N_ITEMS = 5000
+N_POLLS = 20
+CHANGES_PER_POLL = 10  # state transitions + new tenders between two polls
+
+def bench_changes():
+    db.DB_NAME = os.path.join(tempfile.mkdtemp(), "bench.db")
+    day = datetime.date.today()
+    items = make_listing(day.strftime("%d%m%Y"), n=N_ITEMS)["Listado"]
+
+    t0 = time.perf_counter()
+    first = db.diff_snapshot(day, items)
+    seed = time.perf_counter() - t0
+    print(f"{N_ITEMS} tenders, first snapshot: {len(first)} events in {seed * 1000:.0f} ms\n")
+
+    elapsed = 0.0
+    events = 0
+    for poll in range(N_POLLS):
+        items = copy.deepcopy(items)
+        for i in range(CHANGES_PER_POLL // 2):
+            items[(poll * CHANGES_PER_POLL + i) % N_ITEMS]["CodigoEstado"] = 8
+            items.append({"CodigoExterno": f"NEW-{poll}-{i}", "Nombre": "Nueva", "CodigoEstado": 5})
+        t0 = time.perf_counter()
+        events += len(db.diff_snapshot(day, items))
+        elapsed += time.perf_counter() - t0
+
+    print(f"{N_POLLS} polls: {elapsed / N_POLLS * 1000:.1f} ms per diff, "
+          f"{events / N_POLLS:.0f} events per poll instead of {len(items)} tenders")
+
+if __name__ == "__main__":
+    bench_changes()
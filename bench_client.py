@@ -0,0 +1,34 @@
+import time
+import requests
+import mp_client
+from bench_support import StubServer
+
+N_REQUESTS = 100
+
+def bench_client():
+    # TLS stub so the per-request handshake cost is real
+    with StubServer(items_per_day=200, tls=True) as server:
+        print(f"{N_REQUESTS} sequential listing requests against a local HTTPS stub\n")
+
+        before = server.connections
+        t0 = time.perf_counter()
+        for i in range(N_REQUESTS):
+            requests.get(server.url, params={"fecha": f"{i:08d}", "ticket": "STUB"}, timeout=30, verify=server.cert_file)
+        bare = time.perf_counter() - t0
+        bare_conns = server.connections - before
+
+        before = server.connections
+        t0 = time.perf_counter()
+        for i in range(N_REQUESTS):
+            mp_client.get(server.url, params={"fecha": f"{i:08d}", "ticket": "STUB"}, timeout=30, verify=server.cert_file)
+        pooled = time.perf_counter() - t0
+        pooled_conns = server.connections - before
+
+        print(f"bare requests.get   {bare:6.2f}s  {1000 * bare / N_REQUESTS:6.1f} ms/req  {bare_conns} connections")
+        print(f"mp_client (pooled)  {pooled:6.2f}s  {1000 * pooled / N_REQUESTS:6.1f} ms/req  {pooled_conns} connections")
+        stats = mp_client.stats()
+        print(f"\nmp_client stats: {stats['requests']} requests, avg {stats['avg_ms']} ms, "
+              f"{stats['connections_opened']} connections opened")
+
+if __name__ == "__main__":
+    bench_client()
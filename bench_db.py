@@ -0,0 +1,96 @@
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import time
+import db
+
+N_FAVORITES = 2000
+N_WRITERS = 4
+WRITES_PER_WRITER = 500
+
+def make_tenders(n, prefix="F"):
+    return [{"CodigoExterno": f"{prefix}{i}", "Nombre": f"Licitación de prueba {i}", "FechaCierre": f"2026-03-{i % 28 + 1:02d}",
+             "ai_score": i % 100, "ai_reason": "Coincide con el perfil."} for i in range(n)]
+
+def legacy_add_favorite(path, t):
+    # Previous db.add_favorite: fresh connection and transaction per call
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("INSERT INTO favorites (id, title, date, score, reason) VALUES (?, ?, ?, ?, ?)",
+                     (t['CodigoExterno'], t['Nombre'], t['FechaCierre'], t.get('ai_score', 0), t.get('ai_reason', '')))
+        conn.commit()
+        return True
+    except sqlite3.IntegrityError:
+        return False
+    finally:
+        conn.close()
+
+def writer(path, worker, results):
+    # One process = one app session / digest run hammering the same file
+    db.DB_NAME = path
+    errors = 0
+    for t in make_tenders(WRITES_PER_WRITER, prefix=f"W{worker}-"):
+        try:
+            db.add_favorite(t)
+            db.put_cached_analysis(f"k{worker}-{t['CodigoExterno']}", {"score": 1, "reason": "x"}, 100000)
+        except sqlite3.OperationalError:
+            errors += 1
+    results.put(errors)
+
+def reader(path, stop):
+    db.DB_NAME = path
+    while not stop.is_set():
+        db.get_favorites(limit=50, order_by="score")
+
+def bench_db():
+    db.DB_NAME = os.path.join(tempfile.mkdtemp(), "bench.db")
+    db.init_db()
+    tenders = make_tenders(N_FAVORITES)
+    print(f"{N_FAVORITES} favorites\n")
+
+    t0 = time.perf_counter()
+    for t in tenders:
+        legacy_add_favorite(db.DB_NAME, t)
+    legacy = time.perf_counter() - t0
+    db.remove_favorites_many(t['CodigoExterno'] for t in tenders)
+
+    t0 = time.perf_counter()
+    for t in tenders:
+        db.add_favorite(t)
+    reused = time.perf_counter() - t0
+    db.remove_favorites_many(t['CodigoExterno'] for t in tenders)
+
+    t0 = time.perf_counter()
+    db.add_favorites_many(tenders)
+    bulk = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    page = db.get_favorites(limit=50, offset=500, min_score=50, order_by="score")
+    paged = time.perf_counter() - t0
+
+    print(f"add one by one, new connection each  {legacy * 1000:8.1f} ms")
+    print(f"add one by one, reused connection    {reused * 1000:8.1f} ms")
+    print(f"add_favorites_many                   {bulk * 1000:8.1f} ms")
+    print(f"filtered page of {len(page)} (score >= 50)     {paged * 1000:8.1f} ms")
+
+    # Concurrent writers plus a reader on the same file
+    results = multiprocessing.Queue()
+    stop = multiprocessing.Event()
+    readers = [multiprocessing.Process(target=reader, args=(db.DB_NAME, stop))]
+    writers = [multiprocessing.Process(target=writer, args=(db.DB_NAME, w, results)) for w in range(N_WRITERS)]
+    t0 = time.perf_counter()
+    for p in readers + writers:
+        p.start()
+    for p in writers:
+        p.join()
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    for p in readers:
+        p.join()
+    errors = sum(results.get() for _ in writers)
+    total = N_WRITERS * WRITES_PER_WRITER * 2
+    print(f"\n{N_WRITERS} writer processes + 1 reader: {total} writes in {elapsed:.2f}s, {errors} 'database is locked' errors")
+
+if __name__ == "__main__":
+    bench_db()
@@ -0,0 +1,37 @@
+import io
+import time
+import pandas as pd
+import utils_export
+from bench_frame import make_days, build_frame
+from matcher import KeywordMatcher
+
+N_ROWS = 20_000
+
+def legacy_xlsx(df):
+    # Previous path: pd.ExcelWriter with the default openpyxl workbook
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        df.to_excel(writer, index=False, sheet_name='Licitaciones')
+    return output.getvalue()
+
+def bench_export():
+    frame = build_frame(make_days(), KeywordMatcher("")).head(N_ROWS)
+    analyses = {code: {"score": 50, "reason": "Coincide parcialmente con el perfil."}
+                for code in frame["CodigoExterno"][::10]}
+    df = utils_export.export_frame(frame, analyses)
+    print(f"Export of {len(df)} rows\n")
+
+    writers = [("xlsx (pd.ExcelWriter)", legacy_xlsx), ("xlsx (write-only)", utils_export.to_xlsx),
+               ("csv", utils_export.to_csv)]
+    if utils_export.parquet_available():
+        writers.append(("parquet", utils_export.to_parquet))
+    for label, fn in writers:
+        t0 = time.perf_counter()
+        data = fn(df)
+        elapsed = time.perf_counter() - t0
+        print(f"{label:24s} {elapsed * 1000:8.1f} ms  {len(data) / 2**20:6.2f} MB")
+
+    # The app no longer pays any of this on reruns: the file is built on download only
+
+if __name__ == "__main__":
+    bench_export()
@@ -0,0 +1,34 @@
+import datetime
+import time
+import mercado_logic
+from bench_support import StubServer
+
+# Per-day latencies (seconds) that the stub server will simulate
+DAY_LATENCIES = [0.8, 1.5, 0.6, 2.0, 1.2, 0.9, 1.1]
+
+def bench_fetch():
+    start_date = datetime.date(2026, 1, 5)
+    days = [start_date + datetime.timedelta(days=i) for i in range(len(DAY_LATENCIES))]
+    latency = {d.strftime("%d%m%Y"): lat for d, lat in zip(days, DAY_LATENCIES)}
+
+    with StubServer(latency=latency) as server:
+        mercado_logic.API_URL = server.url
+
+        print(f"Sum of day latencies:   {sum(DAY_LATENCIES):.2f}s")
+        print(f"Slowest single day:     {max(DAY_LATENCIES):.2f}s\n")
+
+        results = {}
+        for label, workers in [("Sequential (1 worker)", 1), (f"Concurrent ({len(days)} workers)", len(days))]:
+            t0 = time.perf_counter()
+            tenders = mercado_logic.get_tenders("computación", ticket="STUB", start_date=days[0], end_date=days[-1],
+                                                max_workers=workers, min_interval=0.05, use_cache=False)
+            elapsed = time.perf_counter() - t0
+            results[label] = tenders
+            print(f"{label:28s} {elapsed:6.2f}s  ({len(tenders)} tenders)")
+
+        sequential, concurrent = results.values()
+        same = [t["CodigoExterno"] for t in sequential] == [t["CodigoExterno"] for t in concurrent]
+        print(f"\nSame results and order: {same}")
+
+if __name__ == "__main__":
+    bench_fetch()
@@ -0,0 +1,94 @@
+import random
+import sys
+import time
+import pandas as pd
+import tender_frame
+from mercado_logic import filter_listing, CODIGO_ESTADO_MAP
+from matcher import KeywordMatcher
+from bench_matcher import make_corpus
+
+N_ROWS = 100_000
+N_DAYS = 30
+N_ORGANISMOS = 900
+
+def make_days():
+    # A month of listings, every row a match so both forms hold N_ROWS tenders
+    rng = random.Random(7)
+    corpus = make_corpus(N_ROWS)
+    for item in corpus:
+        item["CodigoEstado"] = 5
+        item["FechaCierre"] = f"2026-02-{rng.randint(1, 28):02d}T15:00:00"
+        item["Comprador"] = {"NombreOrganismo": f"Municipalidad de Comuna {rng.randrange(N_ORGANISMOS)}"}
+    per_day = N_ROWS // N_DAYS + 1
+    return [(f"{d + 1:02d}012026", corpus[d * per_day:(d + 1) * per_day]) for d in range(N_DAYS)]
+
+def build_dicts(days, matcher):
+    tenders = []
+    for date_str, items in days:
+        tenders.extend(filter_listing(items, matcher, date_str))
+    return tenders
+
+def build_frame(days, matcher):
+    return tender_frame.concat_frames(tender_frame.listing_frame(items, matcher, date_str, True, CODIGO_ESTADO_MAP)
+                                      for date_str, items in days)
+
+def dict_export_rows(tenders):
+    # Previous to_excel row building
+    return pd.DataFrame([{"ID": t['CodigoExterno'], "Nombre": t['Nombre'], "Organismo": t['Organismo'],
+                          "Fecha Cierre": t['FechaCierre'], "Estado": t.get('Estado', 'Desconocido'),
+                          "Link": t.get('Link', '')} for t in tenders])
+
+def frame_export_rows(frame):
+    return pd.DataFrame({"ID": frame["CodigoExterno"], "Nombre": frame["Nombre"], "Organismo": frame["Organismo"],
+                         "Fecha Cierre": frame["FechaCierre"], "Estado": frame["Estado"],
+                         "Link": tender_frame.links(frame)})
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - t0
+
+def dicts_size(tenders):
+    # Deep size: the dicts plus every value they hold (keys are shared/interned)
+    size = sys.getsizeof(tenders)
+    for t in tenders:
+        size += sys.getsizeof(t)
+        for value in t.values():
+            size += sys.getsizeof(value)
+            if isinstance(value, list):
+                size += sum(sys.getsizeof(v) for v in value)
+    return size
+
+def bench_frame():
+    days = make_days()
+    matcher = KeywordMatcher("")
+    print(f"{N_ROWS} tenders over {N_DAYS} days, {N_ORGANISMOS} buyers\n")
+
+    tenders = build_dicts(days, matcher)
+    frame = build_frame(days, matcher)
+    mem_dicts = dicts_size(tenders)
+    mem_frame = frame.memory_usage(deep=True).sum()
+    print(f"{'':26s} {'list of dicts':>14s} {'DataFrame':>14s}")
+    print(f"{'memory (MB)':26s} {mem_dicts / 2**20:14.1f} {mem_frame / 2**20:14.1f}")
+
+    organismo = "Municipalidad de Comuna 42"
+    steps = [
+        ("build", lambda: build_dicts(days, matcher), lambda: build_frame(days, matcher)),
+        ("filter by organismo", lambda: [t for t in tenders if t['Organismo'] == organismo],
+                                lambda: frame[frame["Organismo"] == organismo]),
+        ("sort by cierre", lambda: sorted(tenders, key=lambda t: t['FechaCierre']),
+                           lambda: frame.sort_values("FechaCierre", kind="stable")),
+        ("export rows", lambda: dict_export_rows(tenders), lambda: frame_export_rows(frame)),
+        ("render 50 cards", lambda: [t['Link'] for t in tenders[:50]],
+                            lambda: [t['Link'] for t in tender_frame.iter_records(frame.head(50))]),
+    ]
+    for label, dict_fn, frame_fn in steps:
+        _, t_dict = timed(dict_fn)
+        _, t_frame = timed(frame_fn)
+        print(f"{label + ' (ms)':26s} {t_dict * 1000:14.1f} {t_frame * 1000:14.1f}")
+
+    same = tender_frame.to_records(frame) == tenders
+    print(f"\nSame tenders and order: {same}")
+
+if __name__ == "__main__":
+    bench_frame()
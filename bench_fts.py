@@ -0,0 +1,58 @@
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+import db
+
+DOMAIN_WORDS = ["adquisición", "servicio", "mantención", "equipos", "aseo", "vehículos", "arriendo", "construcción",
+                "insumos", "médicos", "alimentación", "capacitación", "seguridad", "mobiliario", "combustible", "obras",
+                "escolares", "jardín", "pavimentación", "tecnología", "computación", "software", "notebooks",
+                "impresoras", "telefonía", "licencias", "redes", "hospital", "ambulancia"]
+ORGANISMOS = [f"Municipalidad {i}" for i in range(300)] + ["Ministerio de Salud", "SII", "Gobierno Regional"]
+
+QUERIES = ["tecnologia", "computación, software", "notebooks, impresoras, licencias", "ambulancia, hospital", "pavim"]
+
+def populate(n_rows, days=365):
+    rng = random.Random(7)
+    # Realistic sparsity: a large filler vocabulary, and each domain word in roughly 1% of listings
+    filler = ["".join(rng.choice("abcdefghijlmnoprstuv") for _ in range(rng.randint(4, 10))) for _ in range(20000)]
+
+    def text(n_words):
+        words = rng.choices(filler, k=n_words)
+        if rng.random() < 0.2:
+            words[rng.randrange(n_words)] = rng.choice(DOMAIN_WORDS)
+        return " ".join(words)
+
+    start = datetime.date(2025, 1, 1)
+    per_day = n_rows // days
+    for d in range(days):
+        day = start + datetime.timedelta(days=d)
+        items = [{
+            "CodigoExterno": f"{d}-{i}-LE25",
+            "Nombre": text(6).capitalize(),
+            "Descripcion": text(20),
+            "Comprador": {"NombreOrganismo": rng.choice(ORGANISMOS)},
+            "CodigoEstado": rng.choice([5, 6, 8]),
+            "FechaCierre": "2025-12-30T15:00:00",
+        } for i in range(per_day)]
+        db.index_listings(day, items, {5: "Publicada", 6: "Cerrada", 8: "Adjudicada"})
+    return start, start + datetime.timedelta(days=days - 1)
+
+def bench_fts(n_rows):
+    db.DB_NAME = os.path.join(tempfile.mkdtemp(), "bench_fts.db")
+    t0 = time.perf_counter()
+    start, end = populate(n_rows)
+    print(f"Indexed {n_rows} listings in {time.perf_counter() - t0:.1f}s\n")
+
+    month_from = end - datetime.timedelta(days=30)
+    for query in QUERIES:
+        for label, kwargs in [("full year", {}), ("last 30 days, Publicada", {"date_from": month_from, "date_to": end, "estado": "Publicada"})]:
+            t0 = time.perf_counter()
+            results = db.search_tenders(query, limit=50, **kwargs)
+            elapsed_ms = (time.perf_counter() - t0) * 1000
+            print(f"{query!r:36s} {label:26s} {elapsed_ms:8.1f} ms  top: {results[0]['Nombre'][:40] if results else '-'}")
+
+if __name__ == "__main__":
+    bench_fts(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
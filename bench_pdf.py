@@ -0,0 +1,121 @@
+import base64
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pypdf import PdfWriter
+from pypdf.generic import (DecodedStreamObject, DictionaryObject, NameObject, NumberObject,
+                           StreamObject)
+
+TEXT_PAGES = 220
+SCANNED_PAGES = 8
+SCAN_SIZE = 1000  # pixels per side of a fake scanned page (grayscale, 1 MB raw)
+LOGO_SIZE = 300   # letterhead image on every text page (90 KB raw)
+PROFILES = ["Empresa de desarrollo de software", "Venta de computadores y notebooks", "Servicios de soporte TI"]
+
+def _image(writer, size):
+    image = StreamObject()
+    image._data = os.urandom(size * size)
+    image.update({
+        NameObject("/Type"): NameObject("/XObject"),
+        NameObject("/Subtype"): NameObject("/Image"),
+        NameObject("/Width"): NumberObject(size),
+        NameObject("/Height"): NumberObject(size),
+        NameObject("/ColorSpace"): NameObject("/DeviceGray"),
+        NameObject("/BitsPerComponent"): NumberObject(8),
+    })
+    return writer._add_object(image)
+
+def _text_page(writer, n):
+    page = writer.add_blank_page(width=612, height=792)
+    font = DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+    })
+    lines = [f"Bases técnicas página {n}, requisito {k}: el oferente deberá acreditar experiencia en servicios."
+             for k in range(40)]
+    ops = ["q 60 0 0 60 40 700 cm /Logo Do Q", "BT /F1 9 Tf 40 680 Td 11 TL"] + [f"({line.encode('latin-1', 'replace').decode('latin-1')}) '" for line in lines] + ["ET"]
+    content = DecodedStreamObject()
+    content.set_data("\n".join(ops).encode("latin-1"))
+    page[NameObject("/Resources")] = DictionaryObject({
+        NameObject("/Font"): DictionaryObject({NameObject("/F1"): writer._add_object(font)}),
+        NameObject("/XObject"): DictionaryObject({NameObject("/Logo"): _image(writer, LOGO_SIZE)}),
+    })
+    page[NameObject("/Contents")] = writer._add_object(content)
+
+def _scanned_page(writer, n):
+    page = writer.add_blank_page(width=612, height=792)
+    content = DecodedStreamObject()
+    content.set_data(b"q 612 0 0 792 0 0 cm /Im1 Do Q")
+    page[NameObject("/Resources")] = DictionaryObject({
+        NameObject("/XObject"): DictionaryObject({NameObject("/Im1"): _image(writer, SCAN_SIZE)})
+    })
+    page[NameObject("/Contents")] = writer._add_object(content)
+
+def make_sample_pdf(path):
+    # Text pages (with a letterhead image) and a scanned, image-only page every few pages
+    writer = PdfWriter()
+    every = max(1, TEXT_PAGES // SCANNED_PAGES)
+    scanned = 0
+    for n in range(TEXT_PAGES):
+        _text_page(writer, n + 1)
+        if n % every == 0 and scanned < SCANNED_PAGES:
+            _scanned_page(writer, n + 1)
+            scanned += 1
+    with open(path, "wb") as f:
+        writer.write(f)
+
+def run_one(mode, path):
+    # Runs in its own process so peak RSS is not shared between modes
+    t0 = time.perf_counter()
+    if mode == "old":
+        # Previous app path: whole upload in memory, inlined (base64) into the request
+        with open(path, "rb") as f:
+            pdf_bytes = f.read()
+        payload = len(base64.b64encode(pdf_bytes))
+    else:
+        from utils_pdf import prepare_pdf
+        prepared = prepare_pdf(path)
+        payload = len(prepared["text"].encode("utf-8")) + len(base64.b64encode(prepared["scanned_pdf"] or b""))
+    elapsed = time.perf_counter() - t0
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{mode} {elapsed:.2f} {peak_mb:.1f} {payload}")
+
+def bench_pdf():
+    path = os.path.join(tempfile.mkdtemp(), "bases_tecnicas.pdf")
+    make_sample_pdf(path)
+    size_mb = os.path.getsize(path) / 1e6
+    print(f"Sample PDF: {TEXT_PAGES + SCANNED_PAGES} pages ({SCANNED_PAGES} scanned), {size_mb:.1f} MB\n")
+
+    labels = {"old": "Whole file to model", "new": "prepare_pdf"}
+    for mode in ["old", "new"]:
+        out = subprocess.run([sys.executable, __file__, mode, path], capture_output=True, text=True).stdout.split()
+        _, elapsed, peak_mb, payload = out[-4:]
+        print(f"{labels[mode]:22s} time {float(elapsed):6.2f}s  peak RSS {float(peak_mb):7.1f} MB  "
+              f"sent to model {int(payload) / 1e6:6.2f} MB")
+    bench_repeat(path)
+
+def bench_repeat(path):
+    # Same bases analyzed for several profiles: read once, then only the requirements extract is sent
+    import db
+    import worker
+    from bench_support import install_fake_gemini
+    db.DB_NAME = os.path.join(tempfile.mkdtemp(), "bench.db")
+    model = install_fake_gemini(latency=0)
+    tender = {"CodigoExterno": "1000-1-LE", "Nombre": "Adquisición de equipos", "Organismo": "Municipalidad"}
+    print()
+    for profile in PROFILES:
+        calls, sent = model.calls, model.bytes_sent
+        t0 = time.perf_counter()
+        worker.run_analysis(tender, profile, "fake-key", pdf=path)
+        print(f"Analysis for {profile!r:40s} time {time.perf_counter() - t0:6.2f}s  "
+              f"{model.calls - calls} calls  sent to model {(model.bytes_sent - sent) / 1e6:6.3f} MB")
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3:
+        run_one(sys.argv[1], sys.argv[2])
+    else:
+        bench_pdf()
@@ -0,0 +1,41 @@
+import os
+import random
+import tempfile
+import time
+import numpy as np
+import db
+import semantic
+
+N_ITEMS = 60000
+N_QUERIES = 50
+WORDS = ("adquisicion equipos computacionales notebooks computadores portatiles impresoras licencias software "
+         "servicio aseo limpieza oficinas mantencion vehiculos camionetas arriendo insumos medicos farmacos "
+         "construccion pavimentacion calles alimentos raciones escolares seguridad guardias mobiliario sillas").split()
+
+def bench_semantic():
+    tmp = tempfile.mkdtemp()
+    db.DB_NAME = os.path.join(tmp, "bench.db")
+    rng = random.Random(0)
+    items = [{"CodigoExterno": f"{i}-BENCH-LE", "Nombre": " ".join(rng.sample(WORDS, 6))} for i in range(N_ITEMS)]
+    store = semantic.VectorStore(semantic.get_embedder(), root=os.path.join(tmp, "embeddings"))
+
+    t0 = time.perf_counter()
+    store.ensure(items)
+    print(f"Embedding + storing {N_ITEMS} listings: {time.perf_counter() - t0:.1f} s ({store.model})")
+
+    queries = [semantic.embed_query(" ".join(rng.sample(WORDS, 2))) for _ in range(N_QUERIES)]
+    t0 = time.perf_counter()
+    exact = [store.search(q, k=20)[0] for q in queries]
+    exact_ms = (time.perf_counter() - t0) / N_QUERIES * 1000
+
+    t0 = time.perf_counter()
+    store.build_index()
+    print(f"IVF build: {time.perf_counter() - t0:.1f} s")
+    t0 = time.perf_counter()
+    approx = [store.search(q, k=20)[0] for q in queries]
+    ivf_ms = (time.perf_counter() - t0) / N_QUERIES * 1000
+    recall = np.mean([len(np.intersect1d(a, e)) / len(e) for a, e in zip(approx, exact)])
+    print(f"Top-20 search: {exact_ms:.1f} ms exact, {ivf_ms:.1f} ms IVF (recall {recall:.2f})")
+
+if __name__ == "__main__":
+    bench_semantic()
@@ -0,0 +1,267 @@
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import analyst
+import daily_digest
+import db
+import metrics
+import mercado_logic
+import mp_client
+import tender_frame
+import utils_export
+from bench_support import FIXTURES_DIR, Fixtures, SmtpSink, StubServer, install_fake_gemini
+
+# Offline end-to-end suite: the Mercado Público API is a local stub replaying
+# recorded payloads (bench_support.Fixtures), Gemini is FakeGeminiModel and
+# mail goes to SmtpSink. Results are saved as JSON to compare runs.
+RESULTS_DIR = "bench_results"
+# Timings worse than the baseline by more than this are reported as
+# regressions, unless the difference is below the noise floor
+REGRESSION_THRESHOLD = 0.2
+NOISE_FLOOR_S = 0.01
+
+SCALES = {
+    "quick": {"days": 2, "items_per_day": 1000, "api_latency": 0.02, "details": 50, "batch": 40,
+              "llm_latency": 0.05, "error_rate": 0.1, "llm_rpm": 600, "digests": 3, "digest_top_k": 3},
+    "full": {"days": 7, "items_per_day": 5000, "api_latency": 0.1, "details": 200, "batch": 200,
+             "llm_latency": 0.2, "error_rate": 0.1, "llm_rpm": 600, "digests": 10, "digest_top_k": 5},
+}
+KEYWORDS = ["computación, notebooks", "aseo", "vehículos, arriendo", "software", ""]
+PROFILE = "Empresa de tecnología: desarrollo de software y venta de computadores. No hacemos aseo."
+
+
+def bench_fetch(params, start_date, end_date):
+    # Cold range: HTTP, JSON parsing, raw cache, FTS indexing and change feed
+    t0 = time.perf_counter()
+    frame = mercado_logic.get_tenders("", ticket="STUB", start_date=start_date, end_date=end_date,
+                                      only_published=False, min_interval=0, as_frame=True)
+    listing_s = time.perf_counter() - t0
+
+    tenders = tender_frame.to_records(frame.head(params["details"]))
+    t0 = time.perf_counter()
+    fetched = mercado_logic.hydrate_details(tenders, "STUB", min_interval=0)
+    detail_s = time.perf_counter() - t0
+    return {"listing_s": listing_s, "listings_per_s": len(frame) / listing_s,
+            "detail_s": detail_s, "details_per_s": fetched / detail_s}, frame
+
+
+def bench_filter(params, start_date, end_date, frame):
+    # Warm queries: every day comes from the local cache, only matching runs
+    times = []
+    for keyword in KEYWORDS:
+        for only_published in (True, False):
+            t0 = time.perf_counter()
+            mercado_logic.get_tenders(keyword, ticket="STUB", start_date=start_date, end_date=end_date,
+                                      only_published=only_published, as_frame=True)
+            times.append(time.perf_counter() - t0)
+    query_s = statistics.median(times)
+
+    text_times = []
+    for text in ("software", "municipalidad", "aseo"):
+        t0 = time.perf_counter()
+        tender_frame.filter_text(frame, text)
+        text_times.append(time.perf_counter() - t0)
+    return {"query_ms": query_s * 1000, "listings_per_s": params["days"] * params["items_per_day"] / query_s,
+            "text_filter_ms": statistics.median(text_times) * 1000}
+
+
+def bench_analysis(params, frame):
+    tenders = mercado_logic.attach_details(tender_frame.to_records(frame.head(params["batch"])))
+    model = install_fake_gemini(latency=params["llm_latency"], error_rate=params["error_rate"])
+    # Fast retries so injected 429s don't dominate the run
+    analyst.scheduler.base_delay = 0.2
+    results = {}
+    analyses = {}
+    for mode, packed in (("single", False), ("packed", True)):
+        # Cold analysis cache for each mode
+        conn = db._connect()
+        with conn:
+            conn.execute("DELETE FROM analysis_cache")
+        calls = model.calls
+        t0 = time.perf_counter()
+        for t, analysis in analyst.analyze_batch(tenders, criteria=PROFILE, api_key="FAKE", max_workers=8,
+                                                 requests_per_minute=params["llm_rpm"], packed=packed):
+            analyses[t["CodigoExterno"]] = analysis
+        elapsed = time.perf_counter() - t0
+        results.update({f"{mode}_s": elapsed, f"{mode}_tenders_per_s": len(tenders) / elapsed,
+                        f"{mode}_calls": model.calls - calls})
+
+    t0 = time.perf_counter()
+    list(analyst.analyze_batch(tenders, criteria=PROFILE, api_key="FAKE", max_workers=8,
+                               requests_per_minute=params["llm_rpm"], packed=True))
+    results["cached_s"] = time.perf_counter() - t0
+    results["quota_errors"] = analyst.scheduler.stats()["quota_errors"]
+    return results, analyses
+
+
+def bench_export(frame, analyses):
+    df = utils_export.export_frame(frame, analyses)
+    results = {}
+    for fmt in utils_export.available_formats():
+        t0 = time.perf_counter()
+        data = utils_export.export_bytes(df, fmt)
+        elapsed = time.perf_counter() - t0
+        results.update({f"{fmt}_s": elapsed, f"{fmt}_rows_per_s": len(df) / elapsed, f"{fmt}_mb": len(data) / 2**20})
+    return results
+
+
+def bench_digest(params):
+    # Today's listing is not in the fetched range, so the digest pays its own fetch
+    install_fake_gemini(latency=params["llm_latency"], error_rate=0.0)
+    with SmtpSink() as smtp:
+        config = {"api_ticket": "STUB", "gemini_key": "FAKE", "smtp_host": "127.0.0.1", "smtp_port": smtp.port,
+                  "smtp_starttls": False,
+                  "digests": [{"name": f"bench-{i}", "keyword": KEYWORDS[i % (len(KEYWORDS) - 1)], "profile": PROFILE,
+                               "email_to": f"bench{i}@localhost", "top_k": params["digest_top_k"]}
+                              for i in range(params["digests"])]}
+        pipeline = daily_digest.DigestPipeline(config, daily_digest.digest_specs(config), full=True)
+        t0 = time.perf_counter()
+        sent = asyncio.run(pipeline.run())
+        elapsed = time.perf_counter() - t0
+    results = {"digest_s": elapsed, "digests_per_s": params["digests"] / elapsed, "sent": sent, "received": smtp.messages}
+    # Busy time per pipeline stage; "hydrate" is paced like the real API (MIN_REQUEST_INTERVAL)
+    results.update({f"{stage}_s": seconds for stage, seconds in pipeline.timer.totals.items()})
+    return results
+
+
+def run_suite(scale="quick", fixtures_dir=FIXTURES_DIR):
+    params = dict(SCALES[scale])
+    workdir = tempfile.mkdtemp()
+    db.DB_NAME = os.path.join(workdir, "bench.db")
+    metrics.METRICS_LOG = os.path.join(workdir, "metrics.jsonl")
+    end_date = datetime.date.today() - datetime.timedelta(days=1)
+    start_date = end_date - datetime.timedelta(days=params["days"] - 1)
+
+    stages = {}
+    with StubServer(default_latency=params["api_latency"], items_per_day=params["items_per_day"],
+                    fixtures=Fixtures(fixtures_dir)) as server:
+        mercado_logic.API_URL = server.url
+        daily_digest.API_URL = server.url
+        stages["fetch"], frame = bench_fetch(params, start_date, end_date)
+        stages["fetch"]["http_requests"] = server.requests
+        stages["filter"] = bench_filter(params, start_date, end_date, frame)
+        stages["analysis"], analyses = bench_analysis(params, frame)
+        stages["export"] = bench_export(frame, analyses)
+        stages["digest"] = bench_digest(params)
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": commit or None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "scale": scale,
+        "params": params,
+        "results": {stage: {k: round(v, 4) for k, v in values.items()} for stage, values in stages.items()},
+    }
+
+
+def save_results(run, directory=RESULTS_DIR):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{run['timestamp'].replace(':', '')}-{run['scale']}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(run, f, indent=1)
+    return path
+
+
+def _seconds(metric, value):
+    # Timing metrics in seconds, None for throughputs and counts (derived or informational)
+    if metric.endswith("per_s"):
+        return None
+    if metric.endswith("_ms"):
+        return value / 1000
+    if metric.endswith("_s"):
+        return value
+    return None
+
+
+def compare(baseline, current, threshold=REGRESSION_THRESHOLD):
+    """
+    Prints every metric of `current` next to `baseline`. Returns the
+    regressions: (stage, metric, change) of timings slower than `threshold`.
+    """
+    if baseline.get("params") != current.get("params"):
+        print("[WARN] Runs used different parameters, changes are not comparable.")
+    regressions = []
+    for stage, values in current["results"].items():
+        for metric, value in values.items():
+            old = baseline["results"].get(stage, {}).get(metric)
+            if old is None:
+                print(f"{stage:9s} {metric:24s} {'':>10s} {value:10.3f}")
+                continue
+            change = (value - old) / old if old else 0.0
+            seconds = _seconds(metric, value)
+            worse = seconds is not None and change > threshold and seconds - _seconds(metric, old) > NOISE_FLOOR_S
+            if worse:
+                regressions.append((stage, metric, change))
+            print(f"{stage:9s} {metric:24s} {old:10.3f} {value:10.3f} {change:+8.1%}{'  << REGRESSION' if worse else ''}")
+    return regressions
+
+
+def record_fixtures(ticket, day, details, directory=FIXTURES_DIR):
+    # One real day and the first `details` records, replayed later by Fixtures
+    os.makedirs(directory, exist_ok=True)
+    date_str = day.strftime("%d%m%Y")
+    response = mp_client.get(mercado_logic.API_URL, params={"fecha": date_str, "ticket": ticket})
+    response.raise_for_status()
+    listing = response.json()
+    with open(os.path.join(directory, f"listado-{date_str}.json"), "w", encoding="utf-8") as f:
+        json.dump(listing, f, ensure_ascii=False)
+    limiter = mercado_logic.get_rate_limiter(mercado_logic.API_URL)
+    for item in listing.get("Listado", [])[:details]:
+        limiter.wait()
+        response = mp_client.get(mercado_logic.API_URL, params={"codigo": item["CodigoExterno"], "ticket": ticket})
+        if response.status_code == 200:
+            with open(os.path.join(directory, f"codigo-{item['CodigoExterno']}.json"), "w", encoding="utf-8") as f:
+                json.dump(response.json(), f, ensure_ascii=False)
+    print(f"Recorded {len(listing.get('Listado', []))} listings and {details} records of {date_str} in {directory}/")
+
+
+def _print_run(run):
+    for stage, values in run["results"].items():
+        print(f"{stage:9s} " + "  ".join(f"{k}={v:g}" for k, v in values.items()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmark suite (stub API, fake Gemini, SMTP sink)")
+    parser.add_argument("--scale", choices=SCALES, default="quick")
+    parser.add_argument("--fixtures", default=FIXTURES_DIR, help="Directory of recorded payloads")
+    parser.add_argument("--compare", nargs="+", metavar="RESULT",
+                        help="BASELINE [CURRENT]: compare saved runs (CURRENT defaults to a fresh run)")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    parser.add_argument("--record", metavar="TICKET", help="Record real API payloads into --fixtures")
+    parser.add_argument("--date", help="Day to record (ddmmyyyy, default yesterday)")
+    parser.add_argument("--details", type=int, default=20, help="Records to save with --record")
+    args = parser.parse_args()
+
+    if args.record:
+        day = datetime.datetime.strptime(args.date, "%d%m%Y").date() if args.date \
+            else datetime.date.today() - datetime.timedelta(days=1)
+        record_fixtures(args.record, day, args.details, args.fixtures)
+        sys.exit(0)
+
+    if args.compare and len(args.compare) > 1:
+        with open(args.compare[1], encoding="utf-8") as f:
+            current = json.load(f)
+    else:
+        current = run_suite(args.scale, args.fixtures)
+        print(f"Saved {save_results(current)}\n")
+    if args.compare:
+        with open(args.compare[0], encoding="utf-8") as f:
+            regressions = compare(json.load(f), current, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) above {args.threshold:.0%}.")
+            sys.exit(1)
+    else:
+        _print_run(current)
@@ -0,0 +1,301 @@
+"""
+Helpers shared by the bench_*.py scripts.
+Runs a local stand-in for api.mercadopublico.cl so benchmarks never touch the real API.
+"""
+import copy
+import glob
+import json
+import os
+import random
+import re
+import socketserver
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+STUB_PATH = "/servicios/v1/publico/licitaciones.json"
+
+# Recorded API payloads (bench_suite.py --record): listado-ddmmyyyy.json and codigo-<code>.json
+FIXTURES_DIR = "bench_fixtures"
+DETAIL_FIXTURE = "debug_tender.json"
+# Vocabulary of the synthetic listings that scale a recorded day up
+SYNTHETIC_ACTIONS = ["Adquisición de", "Arriendo de", "Servicio de", "Mantención de", "Suministro de", "Contratación de"]
+SYNTHETIC_SUBJECTS = ["equipos computacionales", "notebooks", "licencias de software", "desarrollo de software",
+                      "aseo y limpieza", "vehículos", "insumos médicos", "mobiliario de oficina", "alimentación escolar",
+                      "seguridad y vigilancia", "impresoras y tóner", "soporte informático", "obras de pavimentación"]
+
+
+def _self_signed_cert():
+    # Throwaway localhost certificate (cert + key in one PEM) via the openssl CLI
+    path = os.path.join(tempfile.mkdtemp(), "stub.pem")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                    "-subj", "/CN=127.0.0.1", "-addext", "subjectAltName=IP:127.0.0.1",
+                    "-keyout", path, "-out", path], check=True, capture_output=True)
+    return path
+
+
+def make_detail(code, codigo_estado=5):
+    # Full `codigo` record, shaped like debug_tender.json
+    return {"Cantidad": 1, "Version": "v1", "Listado": [{
+        "CodigoExterno": code,
+        "Nombre": f"Licitación {code}",
+        "CodigoEstado": codigo_estado,
+        "Descripcion": "Adquisición de equipos computacionales y licencias de software para oficinas municipales.",
+        "Tipo": "LE",
+        "Moneda": "CLP",
+        "MontoEstimado": 25000000.0,
+        "Comprador": {"NombreOrganismo": "ILUSTRE MUNICIPALIDAD DE QUILLON", "RegionUnidad": "Región del Ñuble",
+                      "ComunaUnidad": "Quillón"},
+        "Fechas": {"FechaPublicacion": "2026-01-06T12:26:14", "FechaCierre": "2026-01-26T15:01:00"},
+        "Adjudicacion": None,
+        "Items": {"Cantidad": 1, "Listado": [{"Correlativo": 1, "Categoria": "Equipos informáticos",
+                                               "NombreProducto": "Notebooks", "Descripcion": "Notebook 16GB RAM",
+                                               "UnidadMedida": "Unidad", "Cantidad": 20.0}]},
+    }]}
+
+
+def make_listing(date_str, n=50):
+    # Synthetic day of listings with the same shape as the real `Listado`
+    items = []
+    for i in range(n):
+        items.append({
+            "CodigoExterno": f"{1000 + i}-{date_str}-LE",
+            "Nombre": f"Adquisición de equipos de computación {i}" if i % 3 == 0 else f"Servicio de aseo {i}",
+            "CodigoEstado": 5 if i % 2 == 0 else 8,
+            "FechaCierre": "2026-01-26T15:01:00",
+        })
+    return {"Cantidad": len(items), "FechaCreacion": "2026-01-06T21:46:31", "Version": "v1", "Listado": items}
+
+
+class Fixtures:
+    """
+    Recorded API payloads replayed by StubServer: `Listado` days
+    (listado-ddmmyyyy.json) and `codigo` records (codigo-<code>.json) from
+    `directory`, with debug_tender.json as the record of any other code.
+    A day is served as recorded, then topped up to `n` items with synthetic
+    listings (seeded by date, so every run sees the same day).
+    """
+    def __init__(self, directory=FIXTURES_DIR, detail_file=DETAIL_FIXTURE, seed=0):
+        self.seed = seed
+        self.listings = {}
+        self.details = {}
+        for path in glob.glob(os.path.join(directory, "listado-*.json")):
+            with open(path, encoding="utf-8") as f:
+                self.listings[os.path.basename(path)[8:-5]] = json.load(f)["Listado"]
+        for path in glob.glob(os.path.join(directory, "codigo-*.json")):
+            with open(path, encoding="utf-8") as f:
+                self.details[os.path.basename(path)[7:-5]] = json.load(f)
+        with open(detail_file, encoding="utf-8") as f:
+            self.detail_template = json.load(f)
+        # Listing-shaped items every synthetic listing is derived from
+        self.pool = [item for items in self.listings.values() for item in items] or [
+            {k: r.get(k) for k in ("CodigoExterno", "Nombre", "CodigoEstado", "FechaCierre")}
+            for r in self.detail_template["Listado"]]
+
+    def listing(self, date_str, n):
+        items = list(self.listings.get(date_str, []))
+        rng = random.Random(f"{self.seed}-{date_str}")
+        for i in range(len(items), n):
+            item = dict(self.pool[i % len(self.pool)])
+            item["CodigoExterno"] = f"{1000 + i}-{date_str}-LE"
+            item["Nombre"] = f"{rng.choice(SYNTHETIC_ACTIONS)} {rng.choice(SYNTHETIC_SUBJECTS)} {i}"
+            item["CodigoEstado"] = rng.choice([5, 5, 5, 6, 7, 8])
+            items.append(item)
+        return {"Cantidad": len(items), "FechaCreacion": "2026-01-06T21:46:31", "Version": "v1", "Listado": items}
+
+    def detail(self, code):
+        if code in self.details:
+            return self.details[code]
+        payload = copy.deepcopy(self.detail_template)
+        payload["Listado"][0]["CodigoExterno"] = code
+        return payload
+
+
+class StubServer:
+    """
+    Minimal threaded HTTP server answering `?fecha=ddmmyyyy` with a synthetic listing
+    and `?codigo=...` with a full tender record (replayed from `fixtures` when given).
+    `latency` maps a date string or code to the seconds the response should take (default_latency otherwise).
+    """
+    def __init__(self, latency=None, default_latency=0.0, items_per_day=50, tls=False, fixtures=None):
+        self.latency = latency or {}
+        self.default_latency = default_latency
+        self.items_per_day = items_per_day
+        self.fixtures = fixtures
+        self.requests = 0
+        self.connections = 0
+        self.cert_file = None
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, like the real API
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                # One handler instance per accepted TCP connection
+                with stub._lock:
+                    stub.connections += 1
+                super().setup()
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                params = parse_qs(parsed.query)
+                date_str = params.get("fecha", [""])[0]
+                code = params.get("codigo", [""])[0]
+                with stub._lock:
+                    stub.requests += 1
+                time.sleep(stub.latency.get(date_str or code, stub.default_latency))
+
+                if stub.fixtures is not None:
+                    payload = stub.fixtures.detail(code) if code else stub.fixtures.listing(date_str, stub.items_per_day)
+                else:
+                    payload = make_detail(code) if code else make_listing(date_str, stub.items_per_day)
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        if tls:
+            self.cert_file = _self_signed_cert()
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(self.cert_file)
+            self.httpd.socket = context.wrap_socket(self.httpd.socket, server_side=True)
+        self.scheme = "https" if tls else "http"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address
+        return f"{self.scheme}://{host}:{port}{STUB_PATH}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class SmtpSink:
+    """
+    Local SMTP server that accepts and counts every message, so digest runs
+    go through smtplib without sending anything (no STARTTLS, no auth).
+    """
+    def __init__(self):
+        self.messages = 0
+        self._lock = threading.Lock()
+        sink = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                self.wfile.write(b"220 bench ESMTP\r\n")
+                in_data = False
+                for line in self.rfile:
+                    if in_data:
+                        if line.rstrip(b"\r\n") == b".":
+                            in_data = False
+                            with sink._lock:
+                                sink.messages += 1
+                            self.wfile.write(b"250 OK\r\n")
+                        continue
+                    command = line[:4].upper()
+                    if command == b"DATA":
+                        in_data = True
+                        self.wfile.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+                    elif command == b"QUIT":
+                        self.wfile.write(b"221 Bye\r\n")
+                        return
+                    else:
+                        self.wfile.write(b"250 OK\r\n")
+
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGeminiModel:
+    """
+    Deterministic stand-in for genai.GenerativeModel.
+    Sleeps `latency` seconds per call and raises a quota error on roughly
+    `error_rate` of the calls (seeded, so runs are reproducible).
+    """
+    def __init__(self, model_name, latency=0.2, error_rate=0.0, seed=0, drop_rate=0.0):
+        self.model_name = model_name
+        self.latency = latency
+        self.error_rate = error_rate
+        # Packed prompts: share of items silently left out of the answer array
+        self.drop_rate = drop_rate
+        self.calls = 0
+        self.bytes_sent = 0  # prompt text + attached files, what a request would upload
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def generate_content(self, content_parts):
+        with self._lock:
+            self.calls += 1
+            self.bytes_sent += sum(len(p.encode("utf-8")) if isinstance(p, str) else len(p["data"])
+                                   for p in (content_parts if isinstance(content_parts, list) else [content_parts]))
+            throttled = self._rng.random() < self.error_rate
+        time.sleep(self.latency)
+        if throttled:
+            raise Exception("429 Resource has been exhausted (e.g. check quota).")
+        prompt = content_parts[0] if isinstance(content_parts, list) else content_parts
+        if '"requisitos_tecnicos"' in prompt:
+            # Requirements extraction (analyst.extract_requirements)
+            return FakeResponse(json.dumps({
+                "resumen": "Adquisición de equipos computacionales", "presupuesto": "25.000.000 CLP",
+                "plazos": ["Cierre de ofertas: 26-01-2026", "Entrega: 30 días corridos"],
+                "garantias": ["Fiel cumplimiento: 5% del contrato"],
+                "requisitos_tecnicos": ["Experiencia acreditada en servicios similares"],
+                "criterios_evaluacion": ["Precio 60%", "Experiencia 40%"]}, ensure_ascii=False))
+        codes = re.findall(r'"CodigoExterno": "([^"]+)"', prompt)
+        if codes:
+            # Packed prompt: answer with a JSON array keyed by CodigoExterno
+            with self._lock:
+                kept = [c for c in codes if self._rng.random() >= self.drop_rate]
+            answer = [{"CodigoExterno": c, "score": sum(map(ord, c)) % 100, "reason": "Respuesta simulada"} for c in kept]
+            return FakeResponse(json.dumps(answer))
+        score = sum(map(ord, prompt)) % 100
+        return FakeResponse(json.dumps({"score": score, "reason": "Respuesta simulada"}))
+
+
+def install_fake_gemini(latency=0.2, error_rate=0.0, seed=0, drop_rate=0.0):
+    """
+    Routes analyst.py model calls to a single shared FakeGeminiModel and returns it.
+    """
+    import analyst
+    model = FakeGeminiModel("fake", latency=latency, error_rate=error_rate, seed=seed, drop_rate=drop_rate)
+    analyst._build_model = lambda api_key, model_name: model
+    analyst.scheduler.reset()
+    return model
@@ -1,84 +1,216 @@
+import asyncio
+import contextlib
+import html
 import json
 import smtplib
+import time
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+import argparse
 import datetime
-from mercado_logic import get_tenders
-from analyst import analyze_tender
+import db
+import metrics
+from mercado_logic import load_day_listing, listing_texts, tender_record, get_mock_data, hydrate_details, attach_details, get_rate_limiter, API_URL
+from matcher import KeywordMatcher, fold
+from analyst import analyze_tender, tender_description, TokenBucket, BUSY_RESULT, BATCH_MAX_WORKERS, BATCH_REQUESTS_PER_MINUTE
+from ranking import rank_tenders, bm25_scores
+import semantic
+from tender_frame import tender_link
 
 # Consts
 CONFIG_FILE = "config.json"
+DIGEST_TOP_K = 10  # max tenders sent to the AI per digest
+ANALYSIS_WORKERS = BATCH_MAX_WORKERS
+QUEUE_SIZE = 50  # bounded queues between stages (backpressure)
+# Change feed consumer (db.get_event_cursor): each run only covers tenders
+# that appeared (or were re-published) since the previous successful run
+EVENT_CONSUMER = "digest"
+
+# SMTP defaults (Gmail). For local testing point smtp_host/smtp_port at a debug
+# server, e.g. `python -m aiosmtpd -n -l localhost:1025` (or, up to Python 3.11,
+# `python -m smtpd -n -c DebuggingServer localhost:1025`), with "smtp_starttls": false.
+SMTP_HOST = "smtp.gmail.com"
+SMTP_PORT = 587
 
 def load_config():
     with open(CONFIG_FILE, "r") as f:
         return json.load(f)
 
-def send_email(subject, html_body, to_email, config):
-    sender_email = config.get("email_user")
-    password = config.get("email_pass")
-    
-    if not sender_email or not password:
-        print("❌ Error: Email credentials not found in config.")
-        return
-
-    msg = MIMEMultipart()
-    msg['From'] = sender_email
-    msg['To'] = to_email
-    msg['Subject'] = subject
-
-    msg.attach(MIMEText(html_body, 'html'))
-
-    try:
-        # Connect to Gmail SMTP
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(sender_email, password)
-        text = msg.as_string()
-        server.sendmail(sender_email, to_email, text)
-        server.quit()
-        print(f"✅ Email sent successfully to {to_email}")
-    except Exception as e:
-        print(f"❌ Failed to send email: {e}")
-
-def run_digest():
-    config = load_config()
-    ticket = config.get("api_ticket")
-    gemini_key = config.get("gemini_key")
-    
-    # Use config values or fallback
-    target_keyword = config.get("last_keyword", "computacion")
-    target_profile = config.get("last_profile", "Empresa de tecnología general")
-    target_email = config.get("email_to") or config.get("email_user") # Fallback to self if no recipient configured
-    
-    print(f"Fetching tenders for today (Keyword: {target_keyword})...")
-    # Default uses today's date if not specified
-    tenders = get_tenders(keyword=target_keyword, ticket=ticket) 
-    
-    if not tenders:
-        print("No tenders found today.")
-        return
-
-    print(f"found {len(tenders)} tenders. Analyzing for profile: {target_profile[:30]}...")
-    
-    analyzed_results = []
-    
-    # Analyze first 5 to avoid quota limits/spamming for demo
-    limit = 5
-    for i, t in enumerate(tenders[:limit]):
-        print(f"Analyzing {i+1}/{limit}: {t['Nombre']}...")
-        analysis = analyze_tender(t['Nombre'], description=f"Organismo: {t['Organismo']}", criteria=target_profile, api_key=gemini_key)
-        
-        # Add analysis to tender object
-        t['Score'] = analysis['score']
-        t['Reason'] = analysis['reason']
-        
-        # Ensure Link is present (using our Google Search strategy)
-        t['Link'] = f"https://www.google.com/search?q=site:mercadopublico.cl+%22{t.get('CodigoExterno')}%22"
-        
-        analyzed_results.append(t)
-        
-    # Generate HTML
-    html = """
+def digest_specs(config):
+    """
+    Digests to build in this run: the subscriptions table (tenders.db), else
+    config["digests"], a list of {"keyword", "profile", "email_to", "top_k",
+    "min_score"}; without either, the single last_keyword/last_profile/email_to
+    from the app is used.
+    """
+    default_to = config.get("email_to") or config.get("email_user")  # Fallback to self if no recipient configured
+    default_top_k = config.get("digest_top_k", DIGEST_TOP_K)
+    subscriptions = db.get_subscriptions()
+    if subscriptions:
+        return [{
+            "name": sub["name"],
+            "keyword": sub["keywords"],
+            "profile": sub["profile"],
+            "email_to": sub["recipients"],
+            "top_k": sub["top_k"] or default_top_k,
+            "min_score": sub["min_score"],
+        } for sub in subscriptions]
+
+    specs = config.get("digests") or [{}]
+    return [{
+        "name": spec.get("name", spec.get("keyword", config.get("last_keyword", "computacion"))),
+        "keyword": spec.get("keyword", config.get("last_keyword", "computacion")),
+        "profile": spec.get("profile", config.get("last_profile", "Empresa de tecnología general")),
+        "email_to": spec.get("email_to", default_to),
+        "top_k": spec.get("top_k", default_top_k),
+        "min_score": spec.get("min_score", 0),
+    } for spec in specs]
+
+def match_subscriptions(listing, specs, date_str):
+    """
+    Splits one day's listing among all digests with a single matcher pass:
+    one KeywordMatcher over the union of every digest's terms, then each
+    digest keeps the tenders hit by its own terms. Returns one tender list per spec.
+    """
+    published = [item for item in listing if item.get("CodigoEstado") == 5]
+    union = KeywordMatcher(", ".join(spec["keyword"] or "" for spec in specs))
+    all_hits = union.match_many(listing_texts(published))
+    hit_idx = [i for i, hits in enumerate(all_hits) if hits]
+    records = {}
+
+    def record(i, hits):
+        base = records.get(i)
+        if base is None:
+            base = records[i] = tender_record(published[i], [], date_str)
+        return dict(base, Coincidencias=hits)
+
+    per_spec = []
+    for spec in specs:
+        terms = {fold(term) for term in KeywordMatcher(spec["keyword"]).terms}
+        if not terms:
+            # Empty keyword matches everything (same as get_tenders)
+            per_spec.append([record(i, []) for i in range(len(published))])
+            continue
+        tenders = []
+        for i in hit_idx:
+            hits = [h for h in all_hits[i] if fold(h) in terms]
+            if hits:
+                tenders.append(record(i, hits))
+        per_spec.append(tenders)
+    return per_spec
+
+def _recipients(email_to):
+    if isinstance(email_to, str):
+        email_to = email_to.split(",")
+    return [e.strip() for e in email_to or [] if e and e.strip()]
+
+
+class StageTimer:
+    """
+    Accumulates busy time per pipeline stage (stages overlap, so the sum can
+    exceed the wall time).
+    """
+    def __init__(self):
+        self.totals = {}
+        self.counts = {}
+        self.started = time.perf_counter()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - t0
+            self.totals[name] = self.totals.get(name, 0.0) + elapsed
+            self.counts[name] = self.counts.get(name, 0) + 1
+            metrics.record(f"digest.{name}", elapsed)
+
+    def report(self):
+        lines = [f"[TIMING] {name:8s} {self.totals[name]:7.2f}s  ({self.counts[name]} calls)" for name in self.totals]
+        lines.append(f"[TIMING] {'wall':8s} {time.perf_counter() - self.started:7.2f}s")
+        return "\n".join(lines)
+
+
+class Mailer:
+    """
+    One SMTP connection for every message of the run, opened on first use
+    and reopened once if the server drops it.
+    """
+    def __init__(self, config):
+        self.host = config.get("smtp_host", SMTP_HOST)
+        self.port = config.get("smtp_port", SMTP_PORT)
+        self.starttls = config.get("smtp_starttls", True)
+        self.user = config.get("email_user")
+        self.password = config.get("email_pass")
+        self.sender = self.user or "digest@localhost"
+        self._server = None
+
+    def can_send(self):
+        # Gmail needs credentials; a local/debug server doesn't
+        if self.host == SMTP_HOST and not (self.user and self.password):
+            print("❌ Error: Email credentials not found in config.")
+            return False
+        return True
+
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=30)
+        if self.starttls:
+            server.starttls()
+        if self.user and self.password:
+            server.login(self.user, self.password)
+        self._server = server
+
+    def send(self, subject, html_body, recipients):
+        msg = MIMEMultipart()
+        msg['From'] = self.sender
+        msg['To'] = ", ".join(recipients)
+        msg['Subject'] = subject
+        msg.attach(MIMEText(html_body, 'html'))
+
+        for attempt in range(2):
+            try:
+                if self._server is None:
+                    self._connect()
+                self._server.sendmail(self.sender, recipients, msg.as_string())
+                print(f"✅ Email sent successfully to {msg['To']}")
+                return True
+            except smtplib.SMTPServerDisconnected:
+                self._server = None
+            except Exception as e:
+                print(f"❌ Failed to send email: {e}")
+                return False
+        print("❌ Failed to send email: server disconnected")
+        return False
+
+    def close(self):
+        if self._server is not None:
+            with contextlib.suppress(Exception):
+                self._server.quit()
+            self._server = None
+
+
+def render_digest(results):
+    """
+    HTML body for a list of analyzed tenders (dicts with Score/Reason/Link).
+    """
+    rows = []
+    for t in results:
+        color = "green" if t['Score'] >= 70 else "orange" if t['Score'] >= 40 else "red"
+        rows.append(f"""
+            <tr>
+                <td style="padding: 10px; border: 1px solid #ddd; color: {color}; font-weight: bold;">{t['Score']}</td>
+                <td style="padding: 10px; border: 1px solid #ddd;">
+                    <b>{html.escape(t['Nombre'] or '')}</b><br>
+                    <small>{html.escape(t['Organismo'] or '')}</small><br>
+                    <i>{html.escape(t['Reason'] or '')}</i>
+                </td>
+                <td style="padding: 10px; border: 1px solid #ddd;">{html.escape(t['FechaCierre'] or '')}</td>
+                <td style="padding: 10px; border: 1px solid #ddd;"><a href="{t['Link']}">Ver Ficha</a></td>
+            </tr>
+        """)
+
+    return """
     <html>
     <body style="font-family: Arial, sans-serif;">
         <h2 style="color: #2E86C1;">📊 Reporte Diario de Licitaciones</h2>
@@ -90,33 +222,224 @@ def run_digest():
                 <th style="padding: 10px; border: 1px solid #ddd;">Cierre</th>
                 <th style="padding: 10px; border: 1px solid #ddd;">Link</th>
             </tr>
-    """
-    
-    for t in analyzed_results:
-        color = "green" if t['Score'] >= 70 else "orange" if t['Score'] >= 40 else "red"
-        html += f"""
-            <tr>
-                <td style="padding: 10px; border: 1px solid #ddd; color: {color}; font-weight: bold;">{t['Score']}</td>
-                <td style="padding: 10px; border: 1px solid #ddd;">
-                    <b>{t['Nombre']}</b><br>
-                    <small>{t['Organismo']}</small><br>
-                    <i>{t['Reason']}</i>
-                </td>
-                <td style="padding: 10px; border: 1px solid #ddd;">{t['FechaCierre']}</td>
-                <td style="padding: 10px; border: 1px solid #ddd;"><a href="{t['Link']}">Ver Ficha</a></td>
-            </tr>
-        """
-        
-    html += """
+    """ + "".join(rows) + """
         </table>
         <p><i>Generado por Tender Vibe Assistant 🤖</i></p>
     </body>
     </html>
     """
-    
-    # Send
-    date_str = datetime.datetime.now().strftime("%d-%m-%Y")
-    send_email(f"Licitaciones del Día ({date_str}) - {target_keyword}", html, target_email, config)
+
+
+class DigestState:
+    # One digest in flight: its candidates and the analyses received so far
+    def __init__(self, spec, candidates):
+        self.spec = spec
+        self.candidates = candidates
+        self.results = [None] * len(candidates)
+        self.pending = len(candidates)
+
+
+class DigestPipeline:
+    """
+    fetch -> rank -> analyze -> render -> send, as asyncio stages joined by
+    bounded queues. The day listing is fetched once for every digest and each
+    (tender, profile) pair is analyzed once per run. Blocking work (HTTP,
+    Gemini, SMTP) runs in threads.
+    Unless full=True, only tenders new since the last run (change feed) are considered.
+    """
+    def __init__(self, config, specs, day=None, workers=ANALYSIS_WORKERS, full=False):
+        self.config = config
+        self.specs = specs
+        self.day = day or datetime.date.today()
+        self.ticket = config.get("api_ticket")
+        self.gemini_key = config.get("gemini_key")
+        self.workers = workers
+        self.timer = StageTimer()
+        self.bucket = TokenBucket(rate=BATCH_REQUESTS_PER_MINUTE / 60.0, capacity=workers)
+        self.mailer = Mailer(config)
+        self.analyses = {}  # (CodigoExterno, profile) -> Future
+        self.slots = 0
+        self.sent = 0
+        self.failed = 0  # delivery errors: the delta is kept for the next run
+        self.skipped = 0  # no recipients/credentials: retrying wouldn't help
+        self.cursor = None if full else db.get_event_cursor(EVENT_CONSUMER)
+        self.last_event = None
+
+    async def _fetch(self):
+        with self.timer.stage("fetch"):
+            if not self.ticket:
+                return None
+            listing = await asyncio.to_thread(load_day_listing, self.day, self.ticket, get_rate_limiter(API_URL))
+            return await asyncio.to_thread(self._unseen, listing)
+
+    def _unseen(self, listing):
+        # Delta since the previous run: tenders with a "new" event, or moved back to Publicada
+        if self.cursor is None:
+            self.last_event = db.latest_event_id()
+            return listing
+        events = db.get_events(self.cursor)
+        self.last_event = events[-1]["id"] if events else self.cursor
+        fresh = {e["codigo"] for e in events if e["new_estado"] == 5}
+        print(f"[INFO] {len(fresh)} new/re-published tenders since the last digest.")
+        return [item for item in listing if item.get("CodigoExterno") in fresh]
+
+    def _match(self, listing):
+        if listing is None:
+            print("[WARNING] No API Ticket provided. Using Mock Data.")
+            return [get_mock_data(spec["keyword"]) for spec in self.specs]
+        return match_subscriptions(listing, self.specs, self.day.strftime("%d%m%Y"))
+
+    def _select(self, spec, tenders):
+        # Local relevance ranking first: only the most promising tenders reach the AI
+        # "semantic_matching": true in config.json ranks by embedding similarity instead of BM25
+        scorer = semantic.profile_scores if self.config.get("semantic_matching") else bm25_scores
+        candidates = rank_tenders(tenders, spec["profile"], top_k=spec["top_k"], min_score=0, scorer=scorer)
+        print(f"[{spec['name']}] {len(tenders)} tenders, {len(candidates)} match the profile locally.")
+        return candidates
+
+    async def _rank_stage(self, analysis_q, render_q):
+        listing = await self._fetch()
+        with self.timer.stage("match"):
+            matched = await asyncio.to_thread(self._match, listing)
+        for spec, tenders in zip(self.specs, matched):
+            with self.timer.stage("rank"):
+                candidates = await asyncio.to_thread(self._select, spec, tenders)
+            self.slots += len(candidates)
+            if candidates:
+                # Full records give the AI real descriptions; unchanged ones are not refetched
+                with self.timer.stage("hydrate"):
+                    await asyncio.to_thread(hydrate_details, candidates, self.ticket)
+                    candidates = attach_details(candidates)
+            state = DigestState(spec, candidates)
+            if not candidates:
+                await render_q.put(state)
+            for i, t in enumerate(candidates):
+                await analysis_q.put((state, i, t))
+        for _ in range(self.workers):
+            await analysis_q.put(None)
+
+    async def _analyze(self, t, profile):
+        key = (t['CodigoExterno'], profile)
+        future = self.analyses.get(key)
+        if future is not None:
+            # Same tender for the same profile in another digest
+            return await future
+        future = self.analyses[key] = asyncio.get_running_loop().create_future()
+        with self.timer.stage("analyze"):
+            try:
+                analysis = await asyncio.to_thread(
+                    analyze_tender, t['Nombre'], description=tender_description(t), criteria=profile,
+                    api_key=self.gemini_key, rate_limiter=self.bucket, code=t['CodigoExterno'])
+            except Exception as e:
+                print(f"[ERROR] Analysis failed for {t['CodigoExterno']}: {e}")
+                analysis = dict(BUSY_RESULT)
+        future.set_result(analysis)
+        return analysis
+
+    async def _analysis_worker(self, analysis_q, render_q):
+        while True:
+            item = await analysis_q.get()
+            if item is None:
+                return
+            state, i, t = item
+            analysis = await self._analyze(t, state.spec["profile"])
+            state.results[i] = dict(t, Score=analysis['score'], Reason=analysis['reason'], Link=tender_link(t['CodigoExterno']))
+            state.pending -= 1
+            if state.pending == 0:
+                await render_q.put(state)
+
+    async def _render_stage(self, render_q, send_q):
+        date_str = self.day.strftime("%d-%m-%Y")
+        while True:
+            state = await render_q.get()
+            if state is None:
+                break
+            if not state.results:
+                print(f"[{state.spec['name']}] No tenders found today.")
+                continue
+            results = [t for t in state.results if t['Score'] >= state.spec["min_score"]]
+            if not results:
+                print(f"[{state.spec['name']}] No tenders above score {state.spec['min_score']}.")
+                continue
+            with self.timer.stage("render"):
+                body = render_digest(results)
+            subject = f"Licitaciones del Día ({date_str}) - {state.spec['name']}"
+            await send_q.put((subject, body, _recipients(state.spec["email_to"])))
+        await send_q.put(None)
+
+    async def _send_stage(self, send_q):
+        while True:
+            item = await send_q.get()
+            if item is None:
+                break
+            subject, body, recipients = item
+            if not recipients or not self.mailer.can_send():
+                print(f"[WARN] Not sending '{subject}': no recipients or credentials.")
+                self.skipped += 1
+                continue
+            with self.timer.stage("send"):
+                if await asyncio.to_thread(self.mailer.send, subject, body, recipients):
+                    self.sent += 1
+                else:
+                    self.failed += 1
+
+    async def run(self):
+        analysis_q = asyncio.Queue(maxsize=QUEUE_SIZE)
+        render_q = asyncio.Queue(maxsize=QUEUE_SIZE)
+        send_q = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+        renderer = asyncio.create_task(self._render_stage(render_q, send_q))
+        sender = asyncio.create_task(self._send_stage(send_q))
+        try:
+            await asyncio.gather(self._rank_stage(analysis_q, render_q),
+                                 *(self._analysis_worker(analysis_q, render_q) for _ in range(self.workers)))
+            await render_q.put(None)
+            await asyncio.gather(renderer, sender)
+        finally:
+            renderer.cancel()
+            sender.cancel()
+            self.mailer.close()
+
+        # Only a fully delivered run consumes its delta; otherwise the next run retries it
+        if self.last_event is not None and not self.failed:
+            db.set_event_cursor(EVENT_CONSUMER, self.last_event)
+
+        print(self.timer.report())
+        print(f"Digests sent: {self.sent}/{len(self.specs)} ({self.skipped} skipped), candidate slots: {self.slots}, "
+              f"unique analyses: {len(self.analyses)}")
+        return self.sent
+
+@metrics.timed("run_digest")
+def run_digest(config=None, full=False):
+    config = config or load_config()
+    specs = digest_specs(config)
+    print(f"Building {len(specs)} digest(s) for {datetime.date.today()}...")
+    # "profile_run": true in config.json (or TENDER_PROFILE=1) dumps a cProfile of the run
+    with metrics.profile("digest", config.get("profile_run")):
+        return asyncio.run(DigestPipeline(config, specs, full=full).run())
 
 if __name__ == "__main__":
-    run_digest()
+    parser = argparse.ArgumentParser(description="Daily tender digest. Without options, builds and sends every digest.")
+    parser.add_argument("--list", action="store_true", help="List subscriptions")
+    parser.add_argument("--add", metavar="NAME", help="Add a subscription (with --keywords, --profile, --to)")
+    parser.add_argument("--keywords", default="")
+    parser.add_argument("--profile", default="")
+    parser.add_argument("--to", default="", help="Comma-separated recipients")
+    parser.add_argument("--min-score", type=int, default=0)
+    parser.add_argument("--top-k", type=int)
+    parser.add_argument("--remove", type=int, metavar="ID", help="Remove a subscription")
+    parser.add_argument("--full", action="store_true", help="Whole day, not only tenders new since the last digest")
+    args = parser.parse_args()
+
+    if args.add:
+        sub_id = db.add_subscription(args.add, args.keywords, args.profile, _recipients(args.to), args.min_score, args.top_k)
+        print(f"Subscription {sub_id} added.")
+    elif args.remove is not None:
+        db.remove_subscription(args.remove)
+        print(f"Subscription {args.remove} removed.")
+    elif args.list:
+        for sub in db.get_subscriptions():
+            print(f"{sub['id']:4d}  {sub['name']}: [{sub['keywords']}] -> {', '.join(sub['recipients'])} "
+                  f"(min score {sub['min_score']}, top {sub['top_k'] or DIGEST_TOP_K})")
+    else:
+        run_digest(full=args.full)
@@ -1,40 +1,882 @@
 import sqlite3
 import json
+import zlib
+import time
+import datetime
+import threading
 
 DB_NAME = "tenders.db"
 
+# Raw `Listado` payloads per day. Past days are immutable once fetched after
+# the day ended; today's listing keeps changing, so it expires quickly.
+RAW_LISTING_TODAY_TTL = 15 * 60  # seconds
+
+# Historical listings, full-text indexed with FTS5 (accent-insensitive).
+# The FTS table uses `listings` as external content and is kept in sync by triggers.
+#
+# Schema changes are migrations: MIGRATIONS[i] brings a database from
+# PRAGMA user_version i to i + 1. Never edit a shipped migration, append a new one.
+MIGRATIONS = [
+    # 1: baseline (statements are idempotent, databases created before
+    # versioning already have most of these tables)
+    [
+        '''CREATE TABLE IF NOT EXISTS raw_listings
+           (fecha TEXT PRIMARY KEY, payload BLOB, fetched_at REAL)''',
+        '''CREATE TABLE IF NOT EXISTS listings
+           (codigo TEXT PRIMARY KEY, nombre TEXT, descripcion TEXT, organismo TEXT,
+            codigo_estado INTEGER, estado TEXT, fecha_cierre TEXT, fecha TEXT)''',
+        '''CREATE INDEX IF NOT EXISTS idx_listings_fecha ON listings(fecha)''',
+        '''CREATE VIRTUAL TABLE IF NOT EXISTS listings_fts USING fts5
+           (nombre, descripcion, organismo, content='listings', content_rowid='rowid',
+            tokenize='unicode61 remove_diacritics 2')''',
+        '''CREATE TABLE IF NOT EXISTS analysis_cache
+           (key TEXT PRIMARY KEY, result TEXT, created_at REAL, last_access REAL)''',
+        '''CREATE INDEX IF NOT EXISTS idx_analysis_cache_access ON analysis_cache(last_access)''',
+        '''CREATE TABLE IF NOT EXISTS tender_details
+           (codigo TEXT PRIMARY KEY, codigo_estado INTEGER, nombre TEXT, descripcion TEXT, tipo TEXT,
+            monto_estimado REAL, moneda TEXT, fecha_publicacion TEXT, fecha_cierre TEXT,
+            organismo TEXT, region TEXT, comuna TEXT, adjudicacion TEXT, fetched_at REAL)''',
+        '''CREATE TABLE IF NOT EXISTS tender_items
+           (codigo TEXT, correlativo INTEGER, categoria TEXT, producto TEXT, descripcion TEXT,
+            cantidad REAL, unidad TEXT, PRIMARY KEY (codigo, correlativo))''',
+        '''CREATE TABLE IF NOT EXISTS backfill_progress
+           (fecha TEXT PRIMARY KEY, status TEXT, listings INTEGER, attempts INTEGER,
+            error TEXT, updated_at REAL)''',
+        '''CREATE TABLE IF NOT EXISTS subscriptions
+           (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, keywords TEXT, profile TEXT,
+            recipients TEXT, min_score INTEGER DEFAULT 0, top_k INTEGER)''',
+        '''CREATE TRIGGER IF NOT EXISTS listings_ai AFTER INSERT ON listings BEGIN
+             INSERT INTO listings_fts(rowid, nombre, descripcion, organismo)
+             VALUES (new.rowid, new.nombre, new.descripcion, new.organismo);
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS listings_ad AFTER DELETE ON listings BEGIN
+             INSERT INTO listings_fts(listings_fts, rowid, nombre, descripcion, organismo)
+             VALUES ('delete', old.rowid, old.nombre, old.descripcion, old.organismo);
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS listings_au AFTER UPDATE ON listings BEGIN
+             INSERT INTO listings_fts(listings_fts, rowid, nombre, descripcion, organismo)
+             VALUES ('delete', old.rowid, old.nombre, old.descripcion, old.organismo);
+             INSERT INTO listings_fts(rowid, nombre, descripcion, organismo)
+             VALUES (new.rowid, new.nombre, new.descripcion, new.organismo);
+           END''',
+        '''CREATE TABLE IF NOT EXISTS favorites
+           (id TEXT PRIMARY KEY, title TEXT, date TEXT, score REAL, reason TEXT)''',
+    ],
+    # 2: favorites sortable/filterable by closing date, score and save time
+    [
+        '''ALTER TABLE favorites ADD COLUMN added_at REAL''',
+        '''CREATE INDEX IF NOT EXISTS idx_favorites_date ON favorites(date)''',
+        '''CREATE INDEX IF NOT EXISTS idx_favorites_score ON favorites(score)''',
+    ],
+    # 3: job queue for worker.py (fetch/hydrate/analysis/digest jobs) and worker heartbeats
+    [
+        '''CREATE TABLE IF NOT EXISTS jobs
+           (id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT, key TEXT, params TEXT,
+            status TEXT, progress REAL DEFAULT 0, message TEXT, result BLOB, error TEXT,
+            attempts INTEGER DEFAULT 0, worker TEXT, created_at REAL, started_at REAL,
+            heartbeat_at REAL, finished_at REAL)''',
+        '''CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, id)''',
+        '''CREATE INDEX IF NOT EXISTS idx_jobs_key ON jobs(key)''',
+        '''CREATE TABLE IF NOT EXISTS workers
+           (id TEXT PRIMARY KEY, started_at REAL, heartbeat_at REAL, jobs_done INTEGER DEFAULT 0)''',
+    ],
+    # 4: change feed. One fingerprint per tender from the last snapshot seen,
+    # and the events (new tender, state transition) found when diffing a new
+    # snapshot against them. Consumers (digest, app) keep their own cursor.
+    [
+        '''CREATE TABLE IF NOT EXISTS tender_fingerprints
+           (codigo TEXT PRIMARY KEY, codigo_estado INTEGER, fingerprint INTEGER, first_seen REAL, last_seen REAL)''',
+        '''CREATE TABLE IF NOT EXISTS tender_events
+           (id INTEGER PRIMARY KEY AUTOINCREMENT, codigo TEXT, kind TEXT, old_estado INTEGER,
+            new_estado INTEGER, fecha TEXT, nombre TEXT, created_at REAL)''',
+        '''CREATE INDEX IF NOT EXISTS idx_tender_events_codigo ON tender_events(codigo)''',
+        '''CREATE TABLE IF NOT EXISTS event_cursors (consumer TEXT PRIMARY KEY, last_id INTEGER, updated_at REAL)''',
+    ],
+    # 5: semantic index (semantic.py): row of each tender in the memory-mapped
+    # vector matrix of an embedding model
+    [
+        '''CREATE TABLE IF NOT EXISTS embeddings
+           (model TEXT, codigo TEXT, row INTEGER, PRIMARY KEY (model, codigo))''',
+        '''CREATE UNIQUE INDEX IF NOT EXISTS idx_embeddings_row ON embeddings(model, row)''',
+    ],
+    # 6: structured requirements extracted once per tender document (PDF),
+    # keyed by the SHA-256 of its bytes (analyst.extract_requirements)
+    [
+        '''CREATE TABLE IF NOT EXISTS pdf_extracts
+           (sha256 TEXT PRIMARY KEY, version INTEGER, extract TEXT, pages INTEGER,
+            created_at REAL, last_access REAL)''',
+        '''CREATE INDEX IF NOT EXISTS idx_pdf_extracts_access ON pdf_extracts(last_access)''',
+    ],
+]
+
+# App, digest, backfill and workers write concurrently: WAL lets readers run
+# alongside the writer and busy_timeout makes writers queue instead of
+# failing with "database is locked".
+BUSY_TIMEOUT = 30  # seconds
+
+_local = threading.local()
+_migrated = set()
+_migrate_lock = threading.Lock()
+
+def _migrate(conn):
+    # BEGIN IMMEDIATE takes the write lock first, so concurrent processes
+    # apply each migration exactly once
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for target in range(version, len(MIGRATIONS)):
+            for statement in MIGRATIONS[target]:
+                conn.execute(statement)
+        conn.execute(f"PRAGMA user_version = {len(MIGRATIONS)}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+def _connect():
+    """
+    Returns this thread's connection to DB_NAME, opened (and the schema
+    migrated) on first use. Connections are reused, never closed by callers.
+    """
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(DB_NAME)
+    if conn is None:
+        conn = sqlite3.connect(DB_NAME, timeout=BUSY_TIMEOUT)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT * 1000}")
+        with _migrate_lock:
+            if DB_NAME not in _migrated:
+                _migrate(conn)
+                _migrated.add(DB_NAME)
+        conns[DB_NAME] = conn
+    return conn
+
 def init_db():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS favorites
-                 (id TEXT PRIMARY KEY, title TEXT, date TEXT, score REAL, reason TEXT)''')
-    conn.commit()
-    conn.close()
+    _connect()
+
+FAVORITE_ORDER = {"date": "date", "score": "score DESC", "added": "added_at DESC"}
+
+def add_favorites_many(tenders):
+    """
+    Saves several tenders as favorites in one transaction. Already saved ones
+    are left untouched. Returns the number of new favorites.
+    """
+    now = time.time()
+    rows = [(t['CodigoExterno'], t['Nombre'], t['FechaCierre'], t.get('ai_score', 0), t.get('ai_reason', ''), now)
+            for t in tenders]
+    conn = _connect()
+    with conn:
+        before = conn.total_changes
+        conn.executemany("INSERT OR IGNORE INTO favorites (id, title, date, score, reason, added_at) VALUES (?, ?, ?, ?, ?, ?)", rows)
+        return conn.total_changes - before
 
 def add_favorite(tender_data):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    try:
-        c.execute("INSERT INTO favorites VALUES (?, ?, ?, ?, ?)",
-                  (tender_data['CodigoExterno'], tender_data['Nombre'], tender_data['FechaCierre'], tender_data.get('ai_score', 0), tender_data.get('ai_reason', '')))
-        conn.commit()
-        return True
-    except sqlite3.IntegrityError:
-        return False
-    finally:
-        conn.close()
-
-def get_favorites():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT * FROM favorites")
-    rows = c.fetchall()
-    conn.close()
+    return add_favorites_many([tender_data]) == 1
+
+def _favorite_filters(min_score=None, search=None):
+    filters = []
+    params = []
+    if min_score is not None:
+        filters.append("score >= ?")
+        params.append(min_score)
+    if search:
+        filters.append("(title LIKE ? OR id LIKE ?)")
+        params.extend([f"%{search}%"] * 2)
+    return (" WHERE " + " AND ".join(filters) if filters else ""), params
+
+def get_favorites(limit=None, offset=0, min_score=None, search=None, order_by="date"):
+    """
+    Favorites page, filtered by minimum score and/or a title/code substring,
+    ordered by closing date, score or save time (see FAVORITE_ORDER).
+    """
+    where, params = _favorite_filters(min_score, search)
+    sql = f"SELECT id, title, date, score, reason FROM favorites{where} ORDER BY {FAVORITE_ORDER[order_by]}"
+    if limit is not None:
+        sql += " LIMIT ? OFFSET ?"
+        params.extend([limit, offset])
+    conn = _connect()
+    rows = conn.execute(sql, params).fetchall()
     return [{"CodigoExterno": r[0], "Nombre": r[1], "FechaCierre": r[2], "ai_score": r[3], "ai_reason": r[4]} for r in rows]
 
+def count_favorites(min_score=None, search=None):
+    where, params = _favorite_filters(min_score, search)
+    return _connect().execute(f"SELECT COUNT(*) FROM favorites{where}", params).fetchone()[0]
+
+def remove_favorites_many(tender_ids):
+    conn = _connect()
+    with conn:
+        conn.executemany("DELETE FROM favorites WHERE id=?", [(tender_id,) for tender_id in tender_ids])
+
 def remove_favorite(tender_id):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("DELETE FROM favorites WHERE id=?", (tender_id,))
-    conn.commit()
-    conn.close()
+    remove_favorites_many([tender_id])
+
+def get_raw_listing(day, today_ttl=RAW_LISTING_TODAY_TTL):
+    """
+    Returns the cached `Listado` items for `day` (a date), or None if missing/expired.
+    """
+    conn = _connect()
+    with conn:
+        row = conn.execute("SELECT payload, fetched_at FROM raw_listings WHERE fecha=?",
+                           (day.isoformat(),)).fetchone()
+    if row is None:
+        return None
+
+    payload, fetched_at = row
+    fetched_day = datetime.date.fromtimestamp(fetched_at)
+    # Only a snapshot taken after the day was over is final
+    if fetched_day <= day and time.time() - fetched_at > today_ttl:
+        return None
+    return json.loads(zlib.decompress(payload))
+
+def cached_listing_days(days, today_ttl=RAW_LISTING_TODAY_TTL):
+    """
+    Returns the subset of `days` whose raw listing can be served from the cache.
+    """
+    days = list(days)
+    if not days:
+        return set()
+    conn = _connect()
+    with conn:
+        rows = conn.execute("SELECT fecha, fetched_at FROM raw_listings WHERE fecha BETWEEN ? AND ?",
+                            (min(days).isoformat(), max(days).isoformat())).fetchall()
+    fetched = {fecha: fetched_at for fecha, fetched_at in rows}
+    now = time.time()
+    cached = set()
+    for day in days:
+        fetched_at = fetched.get(day.isoformat())
+        if fetched_at is None:
+            continue
+        if datetime.date.fromtimestamp(fetched_at) > day or now - fetched_at <= today_ttl:
+            cached.add(day)
+    return cached
+
+def save_raw_listing(day, items):
+    payload = zlib.compress(json.dumps(items, ensure_ascii=False).encode("utf-8"))
+    conn = _connect()
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO raw_listings VALUES (?, ?, ?)",
+                     (day.isoformat(), payload, time.time()))
+        conn.commit()
+
+def index_listings(day, items, estado_map=None):
+    """
+    Stores a day's raw `Listado` items in the historical full-text index.
+    Re-indexing the same day is idempotent: known tenders are updated in place
+    and keep the first date they were seen.
+    """
+    estado_map = estado_map or {}
+    rows = [(item.get("CodigoExterno"), item.get("Nombre") or "", item.get("Descripcion") or "",
+             (item.get("Comprador") or {}).get("NombreOrganismo", ""), item.get("CodigoEstado"),
+             estado_map.get(item.get("CodigoEstado"), "Desconocido"), item.get("FechaCierre"), day.isoformat())
+            for item in items if item.get("CodigoExterno")]
+
+    conn = _connect()
+    with conn:
+        conn.executemany('''INSERT INTO listings VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                            ON CONFLICT(codigo) DO UPDATE SET
+                              nombre=excluded.nombre, descripcion=excluded.descripcion,
+                              organismo=excluded.organismo, codigo_estado=excluded.codigo_estado,
+                              estado=excluded.estado, fecha_cierre=excluded.fecha_cierre,
+                              fecha=MIN(fecha, excluded.fecha)''', rows)
+        conn.commit()
+    return len(rows)
+
+def _fts_query(query):
+    # Comma-separated keywords (same input as the sidebar) -> OR of prefix phrases
+    terms = [t.strip().replace('"', '""') for t in query.split(",")]
+    return " OR ".join(f'"{t}"*' for t in terms if t)
+
+def search_tenders(query, date_from=None, date_to=None, estado=None, limit=200):
+    """
+    Ranked (BM25) search over the local historical index, no network involved.
+    `query` uses the sidebar syntax (comma-separated keywords), dates are
+    datetime.date bounds (inclusive) and `estado` is a status name like "Publicada".
+    Returns tenders in the same shape as get_tenders, best match first.
+    """
+    filters = []
+    params = []
+    if date_from:
+        filters.append("l.fecha >= ?")
+        params.append(date_from.isoformat())
+    if date_to:
+        filters.append("l.fecha <= ?")
+        params.append(date_to.isoformat())
+    if estado:
+        filters.append("l.estado = ?")
+        params.append(estado)
+
+    match = _fts_query(query or "")
+    if match:
+        # Title hits weigh more than description or organismo hits
+        sql = '''SELECT l.codigo, l.nombre, l.fecha_cierre, l.organismo, l.estado, l.fecha,
+                        bm25(listings_fts, 10.0, 1.0, 2.0) AS rank
+                 FROM listings_fts JOIN listings l ON l.rowid = listings_fts.rowid
+                 WHERE listings_fts MATCH ?'''
+        params.insert(0, match)
+        if filters:
+            sql += " AND " + " AND ".join(filters)
+        sql += " ORDER BY rank LIMIT ?"
+    else:
+        sql = "SELECT l.codigo, l.nombre, l.fecha_cierre, l.organismo, l.estado, l.fecha, 0.0 FROM listings l"
+        if filters:
+            sql += " WHERE " + " AND ".join(filters)
+        sql += " ORDER BY l.fecha DESC LIMIT ?"
+    params.append(limit)
+
+    conn = _connect()
+    with conn:
+        rows = conn.execute(sql, params).fetchall()
+
+    return [_listing_record(r, round(-r[6], 2)) for r in rows]
+
+def _listing_record(r, relevance):
+    return {"CodigoExterno": r[0], "Nombre": r[1], "FechaCierre": r[2], "Organismo": r[3] or "Desconocido",
+            "Estado": r[4], "FechaPublicacion": datetime.date.fromisoformat(r[5]).strftime("%d%m%Y"),
+            "Relevancia": relevance}
+
+def get_listings(codes, date_from=None, date_to=None, estado=None):
+    """
+    Indexed listings for the given codes (same shape and filters as
+    search_tenders), in the order of `codes`. `codes` may be a dict
+    code -> relevance.
+    """
+    codes = dict(codes) if isinstance(codes, dict) else dict.fromkeys(codes, 0.0)
+    sql = '''SELECT l.codigo, l.nombre, l.fecha_cierre, l.organismo, l.estado, l.fecha FROM listings l
+             WHERE l.codigo IN (SELECT value FROM json_each(?))'''
+    params = [json.dumps(list(codes))]
+    if date_from:
+        sql += " AND l.fecha >= ?"
+        params.append(date_from.isoformat())
+    if date_to:
+        sql += " AND l.fecha <= ?"
+        params.append(date_to.isoformat())
+    if estado:
+        sql += " AND l.estado = ?"
+        params.append(estado)
+    found = {r[0]: r for r in _connect().execute(sql, params).fetchall()}
+    return [_listing_record(found[c], relevance) for c, relevance in codes.items() if c in found]
+
+def iter_listing_texts(batch_size=10000):
+    """
+    Every indexed listing as {"CodigoExterno", "Nombre", "Descripcion"}, in
+    batches of `batch_size` (semantic.py --index).
+    """
+    cursor = _connect().execute("SELECT codigo, nombre, descripcion FROM listings")
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield [{"CodigoExterno": r[0], "Nombre": r[1], "Descripcion": r[2]} for r in rows]
+
+def get_cached_analysis(key, ttl):
+    """
+    Returns the cached analysis for `key` if younger than `ttl` seconds, else None.
+    Hits refresh the entry's LRU timestamp.
+    """
+    now = time.time()
+    conn = _connect()
+    with conn:
+        row = conn.execute("SELECT result, created_at FROM analysis_cache WHERE key=?", (key,)).fetchone()
+        if row is None:
+            return None
+        if now - row[1] > ttl:
+            conn.execute("DELETE FROM analysis_cache WHERE key=?", (key,))
+            conn.commit()
+            return None
+        conn.execute("UPDATE analysis_cache SET last_access=? WHERE key=?", (now, key))
+        conn.commit()
+        return json.loads(row[0])
+
+def put_cached_analysis(key, result, max_entries):
+    now = time.time()
+    conn = _connect()
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO analysis_cache VALUES (?, ?, ?, ?)",
+                     (key, json.dumps(result, ensure_ascii=False), now, now))
+        # Size bound: drop the least recently used entries beyond max_entries
+        conn.execute('''DELETE FROM analysis_cache WHERE key IN
+                        (SELECT key FROM analysis_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)''',
+                     (max_entries,))
+        conn.commit()
+
+def get_pdf_extract(sha256, version):
+    """
+    Returns the stored extract of a document, or None if missing or produced
+    by another extraction `version`. Hits refresh the entry's LRU timestamp.
+    """
+    conn = _connect()
+    with conn:
+        row = conn.execute("SELECT extract, pages FROM pdf_extracts WHERE sha256=? AND version=?",
+                           (sha256, version)).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE pdf_extracts SET last_access=? WHERE sha256=?", (time.time(), sha256))
+        conn.commit()
+        return dict(json.loads(row[0]), pages=row[1])
+
+def put_pdf_extract(sha256, version, extract, pages, max_entries):
+    now = time.time()
+    conn = _connect()
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO pdf_extracts VALUES (?, ?, ?, ?, ?, ?)",
+                     (sha256, version, json.dumps(extract, ensure_ascii=False), pages, now, now))
+        conn.execute('''DELETE FROM pdf_extracts WHERE sha256 IN
+                        (SELECT sha256 FROM pdf_extracts ORDER BY last_access DESC LIMIT -1 OFFSET ?)''',
+                     (max_entries,))
+        conn.commit()
+
+def get_detail_states(codes):
+    """
+    Returns {codigo: codigo_estado} for the tenders whose detail is already stored.
+    """
+    codes = list(codes)
+    states = {}
+    conn = _connect()
+    with conn:
+        # Chunked to stay below SQLite's bound-parameter limit
+        for i in range(0, len(codes), 500):
+            chunk = codes[i:i + 500]
+            rows = conn.execute(f"SELECT codigo, codigo_estado FROM tender_details WHERE codigo IN ({','.join('?' * len(chunk))})",
+                                chunk).fetchall()
+            states.update(rows)
+    return states
+
+def save_tender_details(records):
+    """
+    Stores full `codigo` records (as returned by licitaciones.json?codigo=...)
+    normalized into tender_details and tender_items.
+    """
+    now = time.time()
+    details = []
+    items = []
+    for r in records:
+        comprador = r.get("Comprador") or {}
+        fechas = r.get("Fechas") or {}
+        details.append((r.get("CodigoExterno"), r.get("CodigoEstado"), r.get("Nombre"), r.get("Descripcion"),
+                        r.get("Tipo"), r.get("MontoEstimado"), r.get("Moneda"), fechas.get("FechaPublicacion"),
+                        fechas.get("FechaCierre"), comprador.get("NombreOrganismo"), comprador.get("RegionUnidad"),
+                        comprador.get("ComunaUnidad"),
+                        json.dumps(r["Adjudicacion"], ensure_ascii=False) if r.get("Adjudicacion") else None, now))
+        for it in (r.get("Items") or {}).get("Listado") or []:
+            items.append((r.get("CodigoExterno"), it.get("Correlativo"), it.get("Categoria"), it.get("NombreProducto"),
+                          it.get("Descripcion"), it.get("Cantidad"), it.get("UnidadMedida")))
+
+    conn = _connect()
+    with conn:
+        conn.executemany("INSERT OR REPLACE INTO tender_details VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", details)
+        conn.executemany("DELETE FROM tender_items WHERE codigo=?", [(d[0],) for d in details])
+        conn.executemany("INSERT OR REPLACE INTO tender_items VALUES (?, ?, ?, ?, ?, ?, ?)", items)
+        conn.commit()
+
+def get_tender_details(codes):
+    """
+    Returns {codigo: detail dict (with an "Items" list)} for the stored tenders among `codes`.
+    """
+    codes = list(codes)
+    details = {}
+    conn = _connect()
+    with conn:
+        for i in range(0, len(codes), 500):
+            chunk = codes[i:i + 500]
+            marks = ','.join('?' * len(chunk))
+            for r in conn.execute(f"""SELECT codigo, descripcion, tipo, monto_estimado, moneda, fecha_publicacion,
+                                             fecha_cierre, organismo, region, comuna, adjudicacion
+                                      FROM tender_details WHERE codigo IN ({marks})""", chunk):
+                details[r[0]] = {"Descripcion": r[1], "Tipo": r[2], "MontoEstimado": r[3], "Moneda": r[4],
+                                 "FechaPublicacionDetalle": r[5], "FechaCierreDetalle": r[6], "OrganismoDetalle": r[7],
+                                 "Region": r[8], "Comuna": r[9],
+                                 "Adjudicacion": json.loads(r[10]) if r[10] else None, "Items": []}
+            for r in conn.execute(f"""SELECT codigo, categoria, producto, descripcion, cantidad, unidad
+                                      FROM tender_items WHERE codigo IN ({marks}) ORDER BY codigo, correlativo""", chunk):
+                details[r[0]]["Items"].append({"Categoria": r[1], "Producto": r[2], "Descripcion": r[3],
+                                               "Cantidad": r[4], "Unidad": r[5]})
+    return details
+
+def get_backfill_done(date_from, date_to):
+    """
+    Returns the days (dates) between `date_from` and `date_to` already backfilled.
+    """
+    conn = _connect()
+    with conn:
+        rows = conn.execute("SELECT fecha FROM backfill_progress WHERE status='done' AND fecha BETWEEN ? AND ?",
+                            (date_from.isoformat(), date_to.isoformat())).fetchall()
+    return {datetime.date.fromisoformat(fecha) for (fecha,) in rows}
+
+def mark_backfill_day(day, status, listings=0, error=None):
+    """
+    Checkpoints one backfill day ('done' or 'failed'), counting attempts.
+    """
+    conn = _connect()
+    with conn:
+        conn.execute('''INSERT INTO backfill_progress VALUES (?, ?, ?, 1, ?, ?)
+                        ON CONFLICT(fecha) DO UPDATE SET
+                          status=excluded.status, listings=excluded.listings,
+                          attempts=attempts + 1, error=excluded.error,
+                          updated_at=excluded.updated_at''',
+                     (day.isoformat(), status, listings, error, time.time()))
+        conn.commit()
+
+def add_subscription(name, keywords, profile, recipients, min_score=0, top_k=None):
+    """
+    Registers a digest subscription. `recipients` is a list of emails.
+    Returns the new subscription id.
+    """
+    conn = _connect()
+    with conn:
+        cur = conn.execute("INSERT INTO subscriptions (name, keywords, profile, recipients, min_score, top_k) VALUES (?, ?, ?, ?, ?, ?)",
+                           (name, keywords, profile, ",".join(recipients), min_score, top_k))
+        conn.commit()
+        return cur.lastrowid
+
+def get_subscriptions():
+    conn = _connect()
+    with conn:
+        rows = conn.execute("SELECT id, name, keywords, profile, recipients, min_score, top_k FROM subscriptions ORDER BY id").fetchall()
+    return [{"id": r[0], "name": r[1], "keywords": r[2], "profile": r[3],
+             "recipients": [e for e in (r[4] or "").split(",") if e], "min_score": r[5] or 0, "top_k": r[6]}
+            for r in rows]
+
+def remove_subscription(subscription_id):
+    conn = _connect()
+    with conn:
+        conn.execute("DELETE FROM subscriptions WHERE id=?", (subscription_id,))
+        conn.commit()
+
+# Job queue. Status goes queued -> running -> done/failed; running jobs whose
+# worker stopped heartbeating (crash, kill -9) go back to queued.
+JOB_ACTIVE = ("queued", "running")
+JOB_MAX_ATTEMPTS = 3
+JOB_COLUMNS = ("id, kind, key, params, status, progress, message, result, error, attempts, worker, "
+               "created_at, started_at, heartbeat_at, finished_at")
+
+def _pack(value):
+    return zlib.compress(json.dumps(value, ensure_ascii=False).encode("utf-8")) if value is not None else None
+
+def _job(row, with_result=True):
+    job = {"id": row[0], "kind": row[1], "key": row[2], "params": json.loads(row[3] or "{}"), "status": row[4],
+           "progress": row[5] or 0.0, "message": row[6], "error": row[8], "attempts": row[9], "worker": row[10],
+           "created_at": row[11], "started_at": row[12], "heartbeat_at": row[13], "finished_at": row[14]}
+    if with_result:
+        job["result"] = json.loads(zlib.decompress(row[7])) if row[7] else None
+    return job
+
+def enqueue_job(kind, params, key=None, reuse_for=0):
+    """
+    Adds a job and returns its id. If `key` is given and a job with the same
+    key is still queued/running, or finished fine less than `reuse_for`
+    seconds ago, that job's id is returned instead (no duplicate work).
+    """
+    conn = _connect()
+    with conn:
+        if key:
+            row = conn.execute('''SELECT id FROM jobs WHERE key=? AND
+                                    (status IN ('queued', 'running') OR (status='done' AND finished_at > ?))
+                                  ORDER BY id DESC LIMIT 1''', (key, time.time() - reuse_for)).fetchone()
+            if row:
+                return row[0]
+        cur = conn.execute("INSERT INTO jobs (kind, key, params, status, created_at) VALUES (?, ?, ?, 'queued', ?)",
+                           (kind, key, json.dumps(params, ensure_ascii=False), time.time()))
+        return cur.lastrowid
+
+def claim_job(worker_id, kinds=None):
+    """
+    Atomically takes the oldest queued job (optionally of the given kinds)
+    for `worker_id`. Returns the job dict, or None if the queue is empty.
+    """
+    conn = _connect()
+    sql = "SELECT id FROM jobs WHERE status='queued'"
+    params = []
+    if kinds:
+        sql += f" AND kind IN ({','.join('?' * len(kinds))})"
+        params.extend(kinds)
+    # BEGIN IMMEDIATE: two workers can't claim the same row
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(sql + " ORDER BY id LIMIT 1", params).fetchone()
+        if row is None:
+            conn.commit()
+            return None
+        now = time.time()
+        conn.execute('''UPDATE jobs SET status='running', worker=?, attempts=attempts + 1,
+                          started_at=?, heartbeat_at=? WHERE id=?''', (worker_id, now, now, row[0]))
+        job = conn.execute(f"SELECT {JOB_COLUMNS} FROM jobs WHERE id=?", (row[0],)).fetchone()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return _job(job)
+
+def update_job(job_id, progress=None, message=None, result=None):
+    """
+    Progress report from the worker. `result` (optional) stores partial
+    results, which the app can show and a resumed job can pick up.
+    """
+    conn = _connect()
+    with conn:
+        conn.execute('''UPDATE jobs SET progress=COALESCE(?, progress), message=COALESCE(?, message),
+                          result=COALESCE(?, result), heartbeat_at=? WHERE id=?''',
+                     (progress, message, _pack(result), time.time(), job_id))
+
+def finish_job(job_id, worker_id, result=None):
+    """
+    Marks a job done. Only applies while `worker_id` still holds it: a job
+    released or requeued in the meantime may belong to another worker now.
+    Returns True if the job was updated.
+    """
+    conn = _connect()
+    with conn:
+        cur = conn.execute('''UPDATE jobs SET status='done', progress=1, result=COALESCE(?, result), error=NULL,
+                                finished_at=? WHERE status='running' AND id=? AND worker=?''',
+                           (_pack(result), time.time(), job_id, worker_id))
+        return cur.rowcount > 0
+
+def fail_job(job_id, worker_id, error, retry=False, max_attempts=JOB_MAX_ATTEMPTS):
+    """
+    Marks a job failed, or back to queued when `retry` and attempts remain.
+    Same ownership check as finish_job.
+    """
+    conn = _connect()
+    with conn:
+        cur = conn.execute('''UPDATE jobs SET status=CASE WHEN ? AND attempts < ? THEN 'queued' ELSE 'failed' END,
+                                error=?, worker=NULL, finished_at=? WHERE status='running' AND id=? AND worker=?''',
+                           (retry, max_attempts, str(error), time.time(), job_id, worker_id))
+        return cur.rowcount > 0
+
+def release_jobs(worker_id):
+    """
+    Graceful shutdown: hands this worker's running jobs back to the queue
+    (keeping partial results) without counting the interrupted attempt.
+    Returns the number of jobs released.
+    """
+    conn = _connect()
+    with conn:
+        cur = conn.execute('''UPDATE jobs SET status='queued', worker=NULL, attempts=MAX(attempts - 1, 0)
+                                WHERE status='running' AND worker=?''', (worker_id,))
+        return cur.rowcount
+
+def requeue_stale_jobs(stale_after, max_attempts=JOB_MAX_ATTEMPTS):
+    """
+    Running jobs with no heartbeat for `stale_after` seconds (their worker
+    died) are queued again, or failed once they used up their attempts.
+    Returns the number of jobs touched.
+    """
+    now = time.time()
+    conn = _connect()
+    with conn:
+        cur = conn.execute('''UPDATE jobs SET worker=NULL,
+                                  status=CASE WHEN attempts < ? THEN 'queued' ELSE 'failed' END,
+                                  error=CASE WHEN attempts < ? THEN error ELSE 'worker lost' END,
+                                  finished_at=CASE WHEN attempts < ? THEN finished_at ELSE ? END
+                                WHERE status='running' AND heartbeat_at < ?''',
+                           (max_attempts, max_attempts, max_attempts, now, now - stale_after))
+        return cur.rowcount
+
+def heartbeat_jobs(worker_id, job_ids):
+    conn = _connect()
+    with conn:
+        conn.executemany("UPDATE jobs SET heartbeat_at=? WHERE id=? AND worker=?",
+                         [(time.time(), job_id, worker_id) for job_id in job_ids])
+
+def get_job(job_id, with_result=True):
+    row = _connect().execute(f"SELECT {JOB_COLUMNS} FROM jobs WHERE id=?", (job_id,)).fetchone()
+    return _job(row, with_result) if row else None
+
+def get_jobs(status=None, limit=50):
+    sql = f"SELECT {JOB_COLUMNS} FROM jobs"
+    params = []
+    if status:
+        sql += " WHERE status=?"
+        params.append(status)
+    rows = _connect().execute(sql + " ORDER BY id DESC LIMIT ?", params + [limit]).fetchall()
+    return [_job(r, with_result=False) for r in rows]
+
+def active_job_files():
+    """
+    Paths of the uploaded files (params "pdf_path") of queued/running jobs.
+    """
+    rows = _connect().execute('''SELECT json_extract(params, '$.pdf_path') FROM jobs
+                                 WHERE status IN ('queued', 'running') AND json_extract(params, '$.pdf_path') IS NOT NULL''').fetchall()
+    return [r[0] for r in rows]
+
+def purge_jobs(older_than):
+    """
+    Deletes finished/failed jobs older than `older_than` seconds.
+    """
+    conn = _connect()
+    with conn:
+        cur = conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+                           (time.time() - older_than,))
+        return cur.rowcount
+
+def worker_heartbeat(worker_id, jobs_done=0):
+    now = time.time()
+    conn = _connect()
+    with conn:
+        conn.execute('''INSERT INTO workers (id, started_at, heartbeat_at, jobs_done) VALUES (?, ?, ?, ?)
+                        ON CONFLICT(id) DO UPDATE SET heartbeat_at=excluded.heartbeat_at,
+                          jobs_done=excluded.jobs_done''', (worker_id, now, now, jobs_done))
+
+def remove_worker(worker_id):
+    conn = _connect()
+    with conn:
+        conn.execute("DELETE FROM workers WHERE id=?", (worker_id,))
+
+def worker_alive(max_age):
+    """
+    True if some worker heartbeated in the last `max_age` seconds.
+    """
+    row = _connect().execute("SELECT MAX(heartbeat_at) FROM workers").fetchone()
+    return bool(row[0]) and row[0] > time.time() - max_age
+
+# Change feed (see migration 4)
+EVENT_NEW = "new"
+EVENT_STATE = "state"
+def listing_fingerprint(item):
+    # Compact 32-bit digest of the fields a snapshot diff cares about
+    key = "\x1f".join(str(item.get(k) or "") for k in ("CodigoEstado", "Nombre", "FechaCierre"))
+    return zlib.crc32(key.encode("utf-8"))
+
+def diff_snapshot(day, items, emit=True):
+    """
+    Diffs a fresh `Listado` snapshot against the stored fingerprints and
+    records an event per new tender and per CodigoEstado transition
+    (e.g. Publicada -> Adjudicada). Unchanged tenders cost one lookup and no
+    write. With emit=False only the fingerprints are stored (backfills, so
+    history doesn't flood the feed). Returns the new events.
+    """
+    snapshot = {}
+    for item in items:
+        codigo = item.get("CodigoExterno")
+        if codigo:
+            snapshot[codigo] = item
+    if not snapshot:
+        return []
+
+    conn = _connect()
+    # One query for the whole snapshot (a JSON array avoids the host parameter limit)
+    known = {r[0]: (r[1], r[2]) for r in conn.execute(
+        "SELECT codigo, codigo_estado, fingerprint FROM tender_fingerprints WHERE codigo IN (SELECT value FROM json_each(?))",
+        (json.dumps(list(snapshot)),))}
+
+    now = time.time()
+    fecha = day.isoformat()
+    upserts = []
+    events = []
+    for codigo, item in snapshot.items():
+        estado = item.get("CodigoEstado")
+        fingerprint = listing_fingerprint(item)
+        previous = known.get(codigo)
+        if previous is None:
+            events.append((codigo, EVENT_NEW, None, estado, fecha, item.get("Nombre"), now))
+        elif previous[1] == fingerprint:
+            continue
+        elif previous[0] != estado:
+            events.append((codigo, EVENT_STATE, previous[0], estado, fecha, item.get("Nombre"), now))
+        upserts.append((codigo, estado, fingerprint, now, now))
+
+    with conn:
+        conn.executemany('''INSERT INTO tender_fingerprints VALUES (?, ?, ?, ?, ?)
+                            ON CONFLICT(codigo) DO UPDATE SET codigo_estado=excluded.codigo_estado,
+                              fingerprint=excluded.fingerprint, last_seen=excluded.last_seen''', upserts)
+        if emit:
+            conn.executemany("INSERT INTO tender_events (codigo, kind, old_estado, new_estado, fecha, nombre, created_at) "
+                             "VALUES (?, ?, ?, ?, ?, ?, ?)", events)
+    if not emit:
+        return []
+    return [{"codigo": e[0], "kind": e[1], "old_estado": e[2], "new_estado": e[3], "fecha": e[4], "nombre": e[5]}
+            for e in events]
+
+def get_events(since_id=0, kinds=None, codes=None, limit=None, favorites_only=False):
+    """
+    Events after `since_id`, oldest first, optionally only some kinds and/or
+    tenders (`codes`, or the saved favorites with favorites_only=True).
+    """
+    sql = "SELECT id, codigo, kind, old_estado, new_estado, fecha, nombre, created_at FROM tender_events WHERE id > ?"
+    params = [since_id or 0]
+    if kinds:
+        sql += f" AND kind IN ({','.join('?' * len(kinds))})"
+        params.extend(kinds)
+    if codes is not None:
+        codes = list(codes)
+        if not codes:
+            return []
+        sql += " AND codigo IN (SELECT value FROM json_each(?))"
+        params.append(json.dumps(codes))
+    if favorites_only:
+        sql += " AND codigo IN (SELECT id FROM favorites)"
+    sql += " ORDER BY id"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    rows = _connect().execute(sql, params).fetchall()
+    return [{"id": r[0], "codigo": r[1], "kind": r[2], "old_estado": r[3], "new_estado": r[4],
+             "fecha": r[5], "nombre": r[6], "created_at": r[7]} for r in rows]
+
+def latest_event_id():
+    return _connect().execute("SELECT COALESCE(MAX(id), 0) FROM tender_events").fetchone()[0]
+
+def get_event_cursor(consumer):
+    """
+    Last event id `consumer` has processed, or None if it never ran.
+    """
+    row = _connect().execute("SELECT last_id FROM event_cursors WHERE consumer=?", (consumer,)).fetchone()
+    return row[0] if row else None
+
+def set_event_cursor(consumer, last_id):
+    conn = _connect()
+    with conn:
+        conn.execute('''INSERT INTO event_cursors VALUES (?, ?, ?)
+                        ON CONFLICT(consumer) DO UPDATE SET last_id=excluded.last_id, updated_at=excluded.updated_at''',
+                     (consumer, last_id, time.time()))
+
+def purge_events(older_than):
+    conn = _connect()
+    with conn:
+        return conn.execute("DELETE FROM tender_events WHERE created_at < ?", (time.time() - older_than,)).rowcount
+
+def get_embedding_rows(model, codes):
+    """
+    {codigo: row} for the codes already embedded with `model`.
+    """
+    rows = _connect().execute("SELECT codigo, row FROM embeddings WHERE model=? AND codigo IN (SELECT value FROM json_each(?))",
+                              (model, json.dumps(list(codes)))).fetchall()
+    return dict(rows)
+
+def get_embedding_codes(model, rows):
+    """
+    {row: codigo} for the given matrix rows.
+    """
+    found = _connect().execute("SELECT row, codigo FROM embeddings WHERE model=? AND row IN (SELECT value FROM json_each(?))",
+                               (model, json.dumps([int(r) for r in rows]))).fetchall()
+    return dict(found)
+
+def count_embeddings(model):
+    return _connect().execute("SELECT COALESCE(MAX(row) + 1, 0) FROM embeddings WHERE model=?", (model,)).fetchone()[0]
+
+def reserve_embedding_rows(model, codes, on_reserved=None):
+    """
+    Assigns the next free matrix rows to the codes not embedded yet with
+    `model` and returns {codigo: row} for them. `on_reserved(first, last)`
+    runs while the write lock is held, so concurrent processes never hand
+    out (or create storage for) the same rows.
+    """
+    conn = _connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        known = {c for (c,) in conn.execute(
+            "SELECT codigo FROM embeddings WHERE model=? AND codigo IN (SELECT value FROM json_each(?))",
+            (model, json.dumps(list(codes))))}
+        new = [c for c in dict.fromkeys(codes) if c not in known]
+        first = conn.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM embeddings WHERE model=?", (model,)).fetchone()[0]
+        reserved = {c: first + i for i, c in enumerate(new)}
+        conn.executemany("INSERT INTO embeddings VALUES (?, ?, ?)", [(model, c, row) for c, row in reserved.items()])
+        if reserved and on_reserved:
+            on_reserved(first, first + len(reserved) - 1)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return reserved
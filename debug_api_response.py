@@ -1,4 +1,4 @@
-import requests
+import mp_client
 import json
 import datetime
 
@@ -28,7 +28,7 @@ params = {
 
 print(f"Querying for date: {date_str}")
 try:
-    response = requests.get(url, params=params, timeout=30)
+    response = mp_client.get(url, params=params, timeout=30)
     print(f"Status Code: {response.status_code}")
     if response.status_code == 200:
         data = response.json()
@@ -0,0 +1,46 @@
+import argparse
+import datetime
+import json
+import db
+import semantic
+from mercado_logic import load_day_listing, get_rate_limiter, API_URL, CODIGO_ESTADO_MAP
+
+CONFIG_FILE = "config.json"
+
+def load_config():
+    with open(CONFIG_FILE, "r") as f:
+        return json.load(f)
+
+def ingest_day(day, ticket, limiter=None):
+    """
+    Stores one day of listings in the local full-text index (tenders.db).
+    Uses the raw listing cache, so re-ingesting a known past day is free.
+    """
+    items = load_day_listing(day, ticket, limiter)
+    count = db.index_listings(day, items, CODIGO_ESTADO_MAP)
+    # Embedded once here, semantic matching later only reads the vectors
+    semantic.index_items(items)
+    print(f"[INFO] {day.isoformat()}: {count} listings indexed.")
+    return count
+
+def run_ingest(start_date, end_date, ticket):
+    limiter = get_rate_limiter(API_URL)
+    total = 0
+    day = start_date
+    while day <= end_date:
+        total += ingest_day(day, ticket, limiter)
+        day += datetime.timedelta(days=1)
+    return total
+
+if __name__ == "__main__":
+    # Meant for cron: by default indexes yesterday (now final) and today
+    today = datetime.date.today()
+    parser = argparse.ArgumentParser(description="Index Mercado Público listings into tenders.db")
+    parser.add_argument("--from", dest="date_from", type=datetime.date.fromisoformat, default=today - datetime.timedelta(days=1))
+    parser.add_argument("--to", dest="date_to", type=datetime.date.fromisoformat, default=today)
+    args = parser.parse_args()
+
+    config = load_config()
+    total = run_ingest(args.date_from, args.date_to, config.get("api_ticket"))
+    semantic.get_store().maybe_rebuild_index()
+    print(f"Done. {total} listings indexed between {args.date_from} and {args.date_to}.")
@@ -0,0 +1,73 @@
+import bisect
+import itertools
+
+# Byte table that lowercases and strips Spanish accents in one pass over
+# latin-1 encoded text ("Tecnología" -> "tecnologia", "Ñuble" -> "nuble").
+_ACCENTED = "ÁÉÍÓÚÀÈÌÒÙÄËÏÖÜÂÊÎÔÛÑÇáéíóúàèìòùäëïöüâêîôûñç"
+_PLAIN = "aeiouaeiouaeiouaeiouncaeiouaeiouaeiouaeiounc"
+
+_table = bytearray(range(256))
+for _i in range(ord("A"), ord("Z") + 1):
+    _table[_i] = _i + 32
+for _src, _dst in zip(_ACCENTED, _PLAIN):
+    _table[ord(_src)] = ord(_dst)
+_FOLD_TABLE = bytes(_table)
+
+def fold(text):
+    """
+    Lowercased, accent-free bytes of `text`. Every character maps to exactly
+    one byte (chars outside latin-1 become '?'), so offsets are preserved.
+    """
+    return (text or "").encode("latin-1", "replace").translate(_FOLD_TABLE)
+
+def normalize_text(text):
+    return fold(text).decode("latin-1")
+
+
+class KeywordMatcher:
+    """
+    Accent-insensitive multi-keyword matcher, built once per query.
+
+    Instead of looping over every term for every item in Python, a whole
+    day of listings is folded into a single buffer and each term is located
+    with C-level `bytes.find`, jumping straight to the next item after a hit.
+    """
+    def __init__(self, keyword):
+        self.terms = []
+        self._folded = []
+        for term in (keyword or "").split(","):
+            term = term.strip()
+            folded = fold(term)
+            if folded and folded not in self._folded:
+                self.terms.append(term)
+                self._folded.append(folded)
+
+        # Empty keyword matches everything (same as the old behaviour)
+        self.match_all = not self.terms
+
+    def match_many(self, texts):
+        """
+        Returns, for each text, the list of original terms found in it.
+        Non-matching texts get an empty list.
+        """
+        results = [[] for _ in texts]
+        if self.match_all or not texts:
+            return results
+
+        blob = fold("\x00".join(texts))
+        starts = list(itertools.accumulate((len(t) + 1 for t in texts[:-1]), initial=0))
+        ends = starts[1:] + [len(blob)]
+
+        for term, folded in zip(self.terms, self._folded):
+            pos = blob.find(folded)
+            while pos != -1:
+                idx = bisect.bisect_right(starts, pos) - 1
+                results[idx].append(term)
+                pos = blob.find(folded, ends[idx])
+        return results
+
+    def hits(self, *texts):
+        return self.match_many(["\n".join(t for t in texts if t)])[0]
+
+    def search(self, *texts):
+        return self.match_all or bool(self.hits(*texts))
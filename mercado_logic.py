@@ -1,5 +1,30 @@
-import requests
 import random
+import datetime
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+import db
+import metrics
+import mp_client
+from matcher import KeywordMatcher
+import semantic
+import tender_frame
+from tender_frame import tender_link
+
+API_URL = "https://api.mercadopublico.cl/servicios/v1/publico/licitaciones.json"
+
+# Concurrency for per-day fetching. The listing endpoint takes 5-15s per day,
+# so days are requested in parallel, but request starts to the same host are
+# spaced out to avoid getting the ticket banned.
+MAX_WORKERS = 4
+MIN_REQUEST_INTERVAL = 0.5  # seconds between request starts per host
+# Uncached days a single interactive query may fetch from the API
+MAX_LIVE_DAYS = 8
+# Details that failed to load are not retried for DETAIL_RETRY_BASE seconds,
+# doubling per consecutive failure up to DETAIL_RETRY_MAX (in-process only)
+DETAIL_RETRY_BASE = 60
+DETAIL_RETRY_MAX = 3600
 
 # Map codes to human readable statuses
 CODIGO_ESTADO_MAP = {
@@ -11,91 +36,332 @@ CODIGO_ESTADO_MAP = {
     19: "Suspendida"
 }
 
-def get_tenders(keyword="computacion", ticket=None, start_date=None, end_date=None, only_published=True):
-    # FALLBACK MOCK DATA
-    url = "https://api.mercadopublico.cl/servicios/v1/publico/licitaciones.json"
-    
+
+class RateLimiter:
+    """
+    Thread-safe spacing of request starts: at most one request begins
+    every `min_interval` seconds.
+    """
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.min_interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+# host -> RateLimiter. app.py hot-reloads this module on every rerun, so the
+# limiters (and their last request times) survive reloads.
+_host_limiters = globals().get("_host_limiters", {})
+_host_limiters_lock = globals().get("_host_limiters_lock") or threading.Lock()
+
+def get_rate_limiter(url, min_interval=MIN_REQUEST_INTERVAL):
+    # One limiter per host, shared by every caller (app reruns, digest, etc.)
+    host = urlparse(url).netloc
+    with _host_limiters_lock:
+        limiter = _host_limiters.get(host)
+        if limiter is None:
+            limiter = RateLimiter(min_interval)
+            _host_limiters[host] = limiter
+        limiter.min_interval = min_interval
+    return limiter
+
+def fetch_day_listing(day, ticket, limiter=None):
+    """
+    Downloads the raw `Listado` for a single day.
+    Returns a list of items, or None if the request failed.
+    """
+    date_str = day.strftime("%d%m%Y")
+    params = {
+        "fecha": date_str,
+        "ticket": ticket
+    }
+
+    if limiter:
+        limiter.wait()
+
+    try:
+        with metrics.timer("api.fetch_day"):
+            response = mp_client.get(API_URL, params=params, timeout=30)
+        if response.status_code == 200:
+            with metrics.timer("api.json_parse"):
+                data = response.json()
+            return data.get("Listado", [])
+        metrics.incr("api.errors", status=response.status_code)
+    except Exception as e:
+        metrics.incr("api.errors")
+        print(f"[ERROR] Failed fetching {date_str}: {e}")
+        # Continue with other days even if one fails
+    return None
+
+def load_day_listing(day, ticket, limiter=None, use_cache=True):
+    """
+    Returns the raw `Listado` for a day, served from the local cache in
+    tenders.db when possible so keyword/status changes cost no HTTP calls.
+    """
+    if use_cache:
+        cached = db.get_raw_listing(day)
+        if cached is not None:
+            return cached
+
+    items = fetch_day_listing(day, ticket, limiter)
+    if items is None:
+        # Never cache failures, next run should retry the day
+        return []
+    if use_cache:
+        db.save_raw_listing(day, items)
+        # Every fresh snapshot feeds the change feed (new tenders, state changes);
+        # past days are only fingerprinted, like in backfill.py
+        db.diff_snapshot(day, items, emit=day >= datetime.date.today())
+    return items
+
+def poll_day(day, ticket, limiter=None):
+    """
+    Refetches a day's listing regardless of the cache TTL, stores it and
+    returns only what changed since the previous snapshot: new tenders and
+    CodigoEstado transitions (db.diff_snapshot events). Returns None if the
+    API call failed.
+    """
+    items = fetch_day_listing(day, ticket, limiter or get_rate_limiter(API_URL))
+    if items is None:
+        return None
+    db.save_raw_listing(day, items)
+    db.index_listings(day, items, CODIGO_ESTADO_MAP)
+    semantic.index_items(items)
+    with metrics.timer("diff_snapshot"):
+        return db.diff_snapshot(day, items)
+
+def fetch_tender_detail(code, ticket, limiter=None):
+    """
+    Downloads the full record of one tender (Items, Fechas, MontoEstimado,
+    Adjudicacion, Comprador region...). Returns the record dict or None.
+    """
+    params = {
+        "codigo": code,
+        "ticket": ticket
+    }
+
+    if limiter:
+        limiter.wait()
+
+    try:
+        with metrics.timer("api.fetch_detail"):
+            response = mp_client.get(API_URL, params=params, timeout=30)
+        if response.status_code == 200:
+            listado = response.json().get("Listado") or []
+            if listado:
+                return listado[0]
+    except Exception as e:
+        print(f"[ERROR] Failed fetching detail {code}: {e}")
+    return None
+
+def hydrate_details(tenders, ticket, max_workers=MAX_WORKERS, min_interval=MIN_REQUEST_INTERVAL):
+    """
+    Fetches and stores (tenders.db) the full record of each tender, concurrently.
+    Records already stored are only refetched when the listing shows a
+    different CodigoEstado. Returns the number of records fetched.
+    """
+    if not ticket or not tenders:
+        return 0
+
+    known = db.get_detail_states(t['CodigoExterno'] for t in tenders)
+    stale = list({t['CodigoExterno'] for t in tenders
+                  if t['CodigoExterno'] not in known or known[t['CodigoExterno']] != t.get('CodigoEstado')})
+    now = time.monotonic()
+    with _detail_failures_lock:
+        stale = [code for code in stale if _detail_failures.get(code, (0, 0))[0] <= now]
+    if not stale:
+        return 0
+
+    limiter = get_rate_limiter(API_URL, min_interval)
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(stale)))) as executor:
+        fetched = list(executor.map(lambda code: fetch_tender_detail(code, ticket, limiter), stale))
+    records = [r for r in fetched if r]
+
+    # Failed codes back off instead of being refetched on every app rerun
+    with _detail_failures_lock:
+        for code, record in zip(stale, fetched):
+            if record:
+                _detail_failures.pop(code, None)
+            else:
+                failures = _detail_failures.get(code, (0, 0))[1] + 1
+                delay = min(DETAIL_RETRY_MAX, DETAIL_RETRY_BASE * 2 ** (failures - 1))
+                _detail_failures[code] = (time.monotonic() + delay, failures)
+
+    db.save_tender_details(records)
+    print(f"[INFO] Hydrated {len(records)}/{len(stale)} tender details.")
+    return len(records)
+
+# codigo -> (retry not before, consecutive failures). app.py hot-reloads this
+# module on every rerun, so the backoff state survives reloads.
+_detail_failures = globals().get("_detail_failures", {})
+_detail_failures_lock = globals().get("_detail_failures_lock") or threading.Lock()
+
+_hydrating = set()
+_hydrating_lock = threading.Lock()
+
+def start_background_hydration(tenders, ticket):
+    """
+    Runs hydrate_details in a daemon thread so the UI doesn't wait on the
+    detail calls. Tenders already being hydrated are skipped.
+    """
+    with _hydrating_lock:
+        todo = [t for t in tenders if t['CodigoExterno'] not in _hydrating]
+        _hydrating.update(t['CodigoExterno'] for t in todo)
+    if not todo or not ticket:
+        return None
+
+    def run():
+        try:
+            hydrate_details(todo, ticket)
+        except Exception as e:
+            print(f"[ERROR] Background hydration failed: {e}")
+        finally:
+            with _hydrating_lock:
+                _hydrating.difference_update(t['CodigoExterno'] for t in todo)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+def attach_details(tenders):
+    """
+    Returns copies of `tenders` enriched with the stored detail records (if any).
+    """
+    details = db.get_tender_details(t['CodigoExterno'] for t in tenders)
+    enriched = []
+    for t in tenders:
+        detail = details.get(t['CodigoExterno'])
+        if detail:
+            t = dict(t, **detail)
+            # The daily listing often lacks the buyer, the full record has it
+            if t.get('Organismo') in (None, "Desconocido") and detail.get("OrganismoDetalle"):
+                t['Organismo'] = detail["OrganismoDetalle"]
+        enriched.append(t)
+    return enriched
+
+def listing_texts(items):
+    # Text each listing item is matched on
+    return [(item.get("Nombre") or "") + "\n" + (item.get("Descripcion") or "") for item in items]
+
+def tender_record(item, hits, date_str):
+    codigo_estado = item.get("CodigoEstado")
+    return {
+        "CodigoExterno": item.get("CodigoExterno"),
+        "Nombre": item.get("Nombre"),
+        "FechaCierre": item.get("FechaCierre"),
+        "Organismo": item.get("Comprador", {}).get("NombreOrganismo", "Desconocido"),
+        "Estado": CODIGO_ESTADO_MAP.get(codigo_estado, "Desconocido"),
+        "CodigoEstado": codigo_estado,
+        "Link": tender_link(item.get('CodigoExterno')),
+        "FechaPublicacion": date_str,
+        "Coincidencias": hits
+    }
+
+def filter_listing(items, matcher, date_str, only_published=True, similarity=None, min_similarity=0.0):
+    results = []
+
+    # One pass over the whole day instead of a term loop per item
+    all_hits = matcher.match_many(listing_texts(items))
+
+    for i, (item, hits) in enumerate(zip(items, all_hits)):
+        # If keyword is empty string, match everything
+        match = matcher.match_all or bool(hits)
+        # Semantic mode: close enough to the keywords without sharing a word
+        if not match and similarity is not None:
+            match = similarity[i] >= min_similarity
+
+        if match:
+            # Filter by CodigoEstado.
+            # If only_published is True, strictly require 5.
+            # If False, allow everything.
+            if not only_published or item.get("CodigoEstado") == 5:
+                record = tender_record(item, hits, date_str)
+                if similarity is not None:
+                    record["Similitud"] = round(float(similarity[i]), 3)
+                results.append(record)
+    return results
+
+@metrics.timed("get_tenders")
+def get_tenders(keyword="computacion", ticket=None, start_date=None, end_date=None, only_published=True,
+                max_workers=MAX_WORKERS, min_interval=MIN_REQUEST_INTERVAL, use_cache=True, as_frame=False,
+                semantic_match=False):
+    """
+    Returns the matching tenders as a list of dicts, or with `as_frame=True`
+    as a columnar DataFrame (see tender_frame) built without per-row dicts.
+    With `semantic_match=True` listings similar enough to the keywords
+    (semantic.MIN_SIMILARITY) are kept too, scored in a "Similitud" field.
+    """
     if not ticket:
         print("[WARNING] No API Ticket provided. Using Mock Data.")
-        return get_mock_data(keyword)
+        mock = get_mock_data(keyword)
+        return tender_frame.to_frame(mock) if as_frame else mock
 
     if not start_date:
-        import datetime
         start_date = datetime.date.today()
         end_date = start_date
 
-    # Prepare logic to loop through dates
-    import datetime
-    all_tenders = []
+    days = []
     current_date = start_date
-    
-    # Safety: Limit range to 7 days to prevent API spam/ban
-    if (end_date - start_date).days > 7:
-        print("[WARN] Range too long, limiting to first 7 days.")
-        end_date = start_date + datetime.timedelta(days=7)
-
     while current_date <= end_date:
-        date_str = current_date.strftime("%d%m%Y")
-        
-        params = {
-            "fecha": date_str,
-            "ticket": ticket
-        }
-        
-        try:
-            # Short timeout for loops to be snappy
-            response = requests.get(url, params=params, timeout=30)
-            if response.status_code == 200:
-                data = response.json()
-                
-                if "Listado" in data:
-                    search_terms = [k.strip().lower() for k in keyword.split(",")]
-                    
-                    for item in data["Listado"]:
-                        name = item.get("Nombre", "").lower()
-                        desc = item.get("Descripcion", "").lower()
-                        
-                        match = False
-                        # If keyword is empty string, match everything
-                        if keyword.strip() == "":
-                             match = True
-                        else:
-                            for term in search_terms:
-                                if term and (term in name or term in desc):
-                                    match = True
-                                    break
-                        
-                        if match:
-                            # Filter by CodigoEstado. 
-                            codigo_estado = item.get("CodigoEstado")
-                            
-                            # If only_published is True, strictly require 5.
-                            # If False, allow everything.
-                            if not only_published or codigo_estado == 5:
-                                t_obj = {
-                                    "CodigoExterno": item.get("CodigoExterno"),
-                                    "Nombre": item.get("Nombre"),
-                                    "FechaCierre": item.get("FechaCierre"),
-                                    "Organismo": item.get("Comprador", {}).get("NombreOrganismo", "Desconocido"),
-                                    "Estado": CODIGO_ESTADO_MAP.get(codigo_estado, "Desconocido"), 
-                                    "Link": f"https://www.google.com/search?q=site:mercadopublico.cl+%22{item.get('CodigoExterno')}%22",
-                                    "FechaPublicacion": date_str
-                                }
-                                all_tenders.append(t_obj)
-                            
-        except Exception as e:
-            print(f"[ERROR] Failed fetching {date_str}: {e}")
-            # Continue to next day even if one fails
-            
+        days.append(current_date)
         current_date += datetime.timedelta(days=1)
-        
+
+    # Safety: at most MAX_LIVE_DAYS API calls per query to prevent API spam/ban.
+    # Days already in the local cache are free, so backfilled ranges
+    # (backfill.py) can be searched without limit.
+    cached = db.cached_listing_days(days) if use_cache else set()
+    missing = [d for d in days if d not in cached]
+    if len(missing) > MAX_LIVE_DAYS:
+        cutoff = missing[MAX_LIVE_DAYS]
+        print(f"[WARN] Range needs {len(missing)} uncached days, stopping before {cutoff} "
+              f"(run backfill.py to load longer ranges).")
+        days = [d for d in days if d < cutoff]
+
+    # Days are fetched concurrently (max_workers=1 keeps the old sequential
+    # behaviour). executor.map preserves input order, so results merge in
+    # date order exactly as before.
+    limiter = get_rate_limiter(API_URL, min_interval)
+    workers = max(1, min(max_workers, len(days)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        listings = list(executor.map(lambda d: load_day_listing(d, ticket, limiter, use_cache), days))
+
+    # Build the keyword matcher once for the whole query
+    matcher = KeywordMatcher(keyword)
+    similarity = [None] * len(days)
+    if semantic_match and not matcher.match_all:
+        # Vectors are stored once per tender, later queries only gather rows
+        with metrics.timer("semantic_match"):
+            similarity = [semantic.similarities(items, keyword) for items in listings]
+    if as_frame:
+        with metrics.timer("match"):
+            frame = tender_frame.concat_frames(
+                tender_frame.listing_frame(items, matcher, day.strftime("%d%m%Y"), only_published, CODIGO_ESTADO_MAP,
+                                           sims, semantic.MIN_SIMILARITY)
+                for day, items, sims in zip(days, listings, similarity))
+        if frame.empty:
+            print("[INFO] No tenders found via API for these criteria.")
+        return frame
+
+    all_tenders = []
+    with metrics.timer("match"):
+        for day, items, sims in zip(days, listings, similarity):
+            all_tenders.extend(filter_listing(items, matcher, day.strftime("%d%m%Y"), only_published,
+                                              sims, semantic.MIN_SIMILARITY))
+
     if not all_tenders and ticket:
          # If valid ticket but empty result after loop, implies no matches found.
          # DO NOT fallback to mock data, just return empty list so user knows there are no real results.
          print("[INFO] No tenders found via API for these criteria.")
          return []
 
-         
     return all_tenders
 
 def get_mock_data(keyword):
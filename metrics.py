@@ -0,0 +1,172 @@
+import atexit
+import contextlib
+import cProfile
+import functools
+import json
+import math
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+# Lightweight timers/counters. Events are buffered and appended as JSON
+# lines to METRICS_LOG (shared by app, digest, backfill...) at most every
+# FLUSH_INTERVAL seconds, and the last WINDOW samples per stage are kept in
+# memory for quick percentiles. The log is rotated to METRICS_LOG + ".1"
+# past MAX_LOG_BYTES; read_log only reads its last READ_TAIL_BYTES.
+METRICS_LOG = os.environ.get("TENDER_METRICS_LOG", "metrics.jsonl")
+ENABLED = os.environ.get("TENDER_METRICS", "1") != "0"
+WINDOW = 1000
+FLUSH_INTERVAL = 2.0  # seconds
+FLUSH_EVENTS = 500
+MAX_LOG_BYTES = 5 * 2**20
+READ_TAIL_BYTES = 2 * 2**20
+
+# Opt-in cProfile per run: TENDER_PROFILE=1 (or profile(..., enabled=True))
+PROFILE_DIR = "profiles"
+
+_lock = threading.Lock()
+_samples = defaultdict(lambda: deque(maxlen=WINDOW))
+_counters = defaultdict(int)
+_pending = []
+_last_flush = time.monotonic()
+
+def flush():
+    """
+    Appends the buffered events to METRICS_LOG, rotating it first if it grew past MAX_LOG_BYTES.
+    """
+    global _last_flush
+    with _lock:
+        lines = _pending[:]
+        _pending.clear()
+        _last_flush = time.monotonic()
+    if not lines or not METRICS_LOG:
+        return
+    try:
+        if os.path.getsize(METRICS_LOG) > MAX_LOG_BYTES:
+            os.replace(METRICS_LOG, METRICS_LOG + ".1")
+    except OSError:
+        pass  # no log yet, or another process is rotating it
+    try:
+        with _lock, open(METRICS_LOG, "a", encoding="utf-8") as f:
+            f.writelines(lines)
+    except OSError:
+        pass
+
+atexit.register(flush)
+
+def _write(event):
+    if not ENABLED or not METRICS_LOG:
+        return
+    line = json.dumps(event, ensure_ascii=False) + "\n"
+    with _lock:
+        _pending.append(line)
+        due = len(_pending) >= FLUSH_EVENTS or time.monotonic() - _last_flush >= FLUSH_INTERVAL
+    if due:
+        flush()
+
+def record(name, seconds, **tags):
+    with _lock:
+        _samples[name].append(seconds)
+    _write({"ts": round(time.time(), 3), "type": "timer", "name": name, "ms": round(seconds * 1000, 3), **tags})
+
+def incr(name, n=1, **tags):
+    with _lock:
+        _counters[name] += n
+    _write({"ts": round(time.time(), 3), "type": "counter", "name": name, "n": n, **tags})
+
+@contextlib.contextmanager
+def timer(name, **tags):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - t0, **tags)
+
+def timed(name=None):
+    """
+    Decorator version of timer(); defaults to the function's name.
+    """
+    def decorator(fn):
+        stage = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timer(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def percentile(values, q):
+    # Nearest-rank percentile, values need not be sorted
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100.0 * len(ordered)) - 1)]
+
+def _summarize(samples, counters):
+    stages = {name: {"count": len(values), "p50_ms": round(percentile(values, 50) * 1000, 1),
+                     "p95_ms": round(percentile(values, 95) * 1000, 1), "max_ms": round(max(values) * 1000, 1)}
+              for name, values in samples.items() if values}
+    return {"stages": stages, "counters": dict(counters)}
+
+def summary():
+    """
+    Percentiles for this process (last WINDOW samples per stage) and counters.
+    """
+    with _lock:
+        samples = {name: list(values) for name, values in _samples.items()}
+        counters = dict(_counters)
+    return _summarize(samples, counters)
+
+def read_log(path=None, since=None):
+    """
+    Same as summary() but over the JSONL log, i.e. across every process.
+    Only the last READ_TAIL_BYTES are read. `since` is an epoch timestamp lower bound.
+    """
+    flush()
+    samples = defaultdict(lambda: deque(maxlen=WINDOW))
+    counters = defaultdict(int)
+    try:
+        with open(path or METRICS_LOG, "rb") as f:
+            size = f.seek(0, os.SEEK_END)
+            f.seek(max(0, size - READ_TAIL_BYTES))
+            if size > READ_TAIL_BYTES:
+                f.readline()  # partial line
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                if since and event.get("ts", 0) < since:
+                    continue
+                if event.get("type") == "timer":
+                    samples[event["name"]].append(event["ms"] / 1000.0)
+                elif event.get("type") == "counter":
+                    counters[event["name"]] += event.get("n", 1)
+    except FileNotFoundError:
+        pass
+    return _summarize(samples, counters)
+
+@contextlib.contextmanager
+def profile(name, enabled=None):
+    """
+    cProfile the enclosed block when enabled (default: TENDER_PROFILE=1) and
+    dump the stats to PROFILE_DIR/<name>-<timestamp>.prof (snakeviz, pstats...).
+    """
+    if enabled is None:
+        enabled = os.environ.get("TENDER_PROFILE") == "1"
+    if not enabled:
+        yield None
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        # Milliseconds too: quick reruns must not overwrite each other's profile
+        path = os.path.join(PROFILE_DIR, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{int(time.time() * 1000) % 1000:03d}.prof")
+        profiler.dump_stats(path)
+        print(f"[INFO] Profile written to {path}")
@@ -0,0 +1,178 @@
+import json
+import threading
+import time
+from collections import OrderedDict, deque
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Single HTTP client for every Mercado Público call: one pooled keep-alive
+# session (no fresh TLS handshake per request), gzip, retries with backoff on
+# 429/5xx/timeouts (honoring Retry-After, capped), conditional requests and
+# per-request timing.
+POOL_SIZE = 10
+RETRIES = 3
+RETRY_BACKOFF = 0.5  # seconds, doubles per retry
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Longest Retry-After we sleep on; a server asking for more gets retried sooner
+RETRY_AFTER_MAX = 10
+DEFAULT_TIMEOUT = 30
+# Bodies kept for If-None-Match / If-Modified-Since revalidation, bounded in
+# bytes; larger answers are not revalidated
+CONDITIONAL_CACHE_BYTES = 16 * 2**20
+CONDITIONAL_MAX_BODY = 4 * 2**20
+
+_session = None
+_session_lock = threading.Lock()
+
+_validators = OrderedDict()  # (url, params) -> _Revalidated
+_validators_bytes = 0
+_validators_lock = threading.Lock()
+
+_timings = deque(maxlen=500)
+_stats = {"requests": 0, "errors": 0, "not_modified": 0, "seconds": 0.0}
+_stats_lock = threading.Lock()
+
+class _CappedRetry(Retry):
+    # urllib3 sleeps for whatever Retry-After says, which could stall an app rerun or a job for minutes
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        return min(retry_after, RETRY_AFTER_MAX) if retry_after is not None else None
+
+class _Revalidated:
+    """
+    What a 304 returns: the validators and body of the last 200 for the same
+    url+params, with the part of the requests.Response interface callers use.
+    """
+    status_code = 200
+    ok = True
+
+    def __init__(self, response):
+        self.url = response.url
+        self.etag = response.headers.get("ETag")
+        self.last_modified = response.headers.get("Last-Modified")
+        self.headers = dict(response.headers)
+        self.encoding = response.encoding or "utf-8"
+        self.content = response.content
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding, errors="replace")
+
+    def json(self, **kwargs):
+        return json.loads(self.content, **kwargs)
+
+    def raise_for_status(self):
+        pass
+
+class _TrackingAdapter(HTTPAdapter):
+    # Remembers the connection pools it hands out, so stats can read their
+    # (public) num_connections without reaching into urllib3 internals
+    def __init__(self, *args, **kwargs):
+        self.pools = set()
+        self._pools_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    def get_connection_with_tls_context(self, *args, **kwargs):
+        pool = super().get_connection_with_tls_context(*args, **kwargs)
+        with self._pools_lock:
+            self.pools.add(pool)
+        return pool
+
+def _build_session():
+    session = requests.Session()
+    retry = _CappedRetry(
+        total=RETRIES,
+        connect=RETRIES,
+        read=RETRIES,
+        status=RETRIES,
+        backoff_factor=RETRY_BACKOFF,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset(["GET"]),
+        raise_on_status=False,
+    )
+    adapter = _TrackingAdapter(pool_connections=4, pool_maxsize=POOL_SIZE, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Accept-Encoding": "gzip, deflate"})
+    return session
+
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = _build_session()
+        return _session
+
+def get(url, params=None, timeout=DEFAULT_TIMEOUT, headers=None, **kwargs):
+    """
+    GET through the shared session. If a previous response for the same
+    url+params carried an ETag/Last-Modified, the request is made conditional
+    and a 304 answer returns that previous response.
+    """
+    global _validators_bytes
+    key = (url, tuple(sorted((params or {}).items())))
+    headers = dict(headers or {})
+    with _validators_lock:
+        cached = _validators.get(key)
+    if cached is not None:
+        if cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+
+    t0 = time.perf_counter()
+    try:
+        response = get_session().get(url, params=params, timeout=timeout, headers=headers, **kwargs)
+    except Exception:
+        _record(url, None, time.perf_counter() - t0, 0)
+        raise
+    elapsed = time.perf_counter() - t0
+
+    if response.status_code == 304 and cached is not None:
+        _record(url, 304, elapsed, 0)
+        return cached
+
+    _record(url, response.status_code, elapsed, len(response.content))
+    if (response.status_code == 200 and len(response.content) <= CONDITIONAL_MAX_BODY
+            and (response.headers.get("ETag") or response.headers.get("Last-Modified"))):
+        entry = _Revalidated(response)
+        with _validators_lock:
+            old = _validators.pop(key, None)
+            if old is not None:
+                _validators_bytes -= len(old.content)
+            _validators[key] = entry
+            _validators_bytes += len(entry.content)
+            while _validators_bytes > CONDITIONAL_CACHE_BYTES:
+                _, evicted = _validators.popitem(last=False)
+                _validators_bytes -= len(evicted.content)
+    return response
+
+def _record(url, status, elapsed, size):
+    with _stats_lock:
+        _stats["requests"] += 1
+        _stats["seconds"] += elapsed
+        if status is None or status >= 400:
+            _stats["errors"] += 1
+        if status == 304:
+            _stats["not_modified"] += 1
+        _timings.append({"url": url, "status": status, "ms": round(elapsed * 1000, 1), "bytes": size, "at": time.time()})
+
+def connections_opened():
+    # New TCP/TLS connections made by the pool so far (the rest were reused)
+    total = 0
+    for adapter in set(get_session().adapters.values()):
+        if isinstance(adapter, _TrackingAdapter):
+            with adapter._pools_lock:
+                total += sum(pool.num_connections for pool in adapter.pools)
+    return total
+
+def stats():
+    with _stats_lock:
+        result = dict(_stats)
+        recent = list(_timings)
+    result["seconds"] = round(result["seconds"], 3)
+    result["avg_ms"] = round(1000 * result["seconds"] / result["requests"], 1) if result["requests"] else 0.0
+    result["connections_opened"] = connections_opened()
+    result["recent"] = recent[-20:]
+    return result
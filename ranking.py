@@ -0,0 +1,127 @@
+import re
+import numpy as np
+from matcher import fold, normalize_text
+
+# Fast local relevance stage that runs before the LLM: BM25 of each listing
+# (Nombre + Descripcion + Organismo) against the company profile, scored for
+# the whole day at once with NumPy.
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Listings mentioning something the profile rules out ("No vendo hardware")
+# keep only this fraction of their score
+NEGATIVE_PENALTY = 0.3
+# Crude Spanish stemming: compare word prefixes ("computadores" ~ "computacion")
+STEM_LENGTH = 6
+
+STOP_WORDS = {
+    "empresa", "busca", "buscamos", "somos", "para", "donde", "pero", "fines", "vendo", "hago", "tener",
+    "los", "las", "del", "que", "con", "una", "por", "como", "mas", "sus", "este", "esta", "estos", "estas",
+    "entre", "cuando", "muy", "sin", "sobre", "tambien", "hasta", "hay", "quien", "desde", "todo", "todos",
+    "nos", "durante", "uno", "les", "contra", "otros", "ese", "eso", "ante", "ellos", "esto", "antes",
+    "algunos", "unos", "otro", "otras", "otra", "tanto", "esa", "mucho", "quienes", "nada", "muchos", "cual",
+    "poco", "ella", "estar", "algunas", "algo", "nosotros", "soy", "servicio", "servicios", "adquisicion",
+}
+NEGATIONS = {"no", "sin", "excepto", "salvo"}
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+# Keeps [a-z0-9] and the "\x00" separator, everything else becomes a space
+_word_bytes = bytearray(b" " * 256)
+for _c in b"abcdefghijklmnopqrstuvwxyz0123456789\x00":
+    _word_bytes[_c] = _c
+_WORD_BYTES = bytes(_word_bytes)
+_CLAUSE_RE = re.compile(r"[.;,\n]")
+
+def profile_terms(profile):
+    """
+    Splits the profile into wanted and excluded stems. Words after a negation
+    ("no", "sin", ...) up to the end of the clause count as excluded.
+    """
+    wanted, excluded = [], []
+    for clause in _CLAUSE_RE.split(normalize_text(profile or "")):
+        negated = False
+        for word in _WORD_RE.findall(clause):
+            if word in NEGATIONS:
+                negated = True
+                continue
+            if len(word) <= 2 or word in STOP_WORDS:
+                continue
+            stem = word[:STEM_LENGTH]
+            target = excluded if negated else wanted
+            if stem not in target:
+                target.append(stem)
+    wanted = [w for w in wanted if w not in excluded]
+    return wanted, excluded
+
+def _tender_text(t):
+    return f"{t.get('Nombre') or ''} {t.get('Descripcion') or ''} {t.get('Organismo') or ''}"
+
+def bm25_scores(tenders, profile):
+    """
+    Returns a NumPy array with the BM25 score of each tender against `profile`.
+    """
+    n_docs = len(tenders)
+    wanted, excluded = profile_terms(profile)
+    if n_docs == 0 or not wanted:
+        return np.zeros(n_docs)
+
+    vocab = {term: i for i, term in enumerate(wanted + excluded)}
+
+    # Tokenize the whole day in one pass over folded bytes: every byte that is
+    # not [a-z0-9] becomes a space, and "\x00" (the listing separator) is kept
+    # as its own token so each word can be assigned to its listing.
+    blob = fold("\x00".join(_tender_text(t) for t in tenders)).translate(_WORD_BYTES).replace(b"\x00", b" \x00 ")
+    tokens = blob.split()
+    uniques = dict.fromkeys(tokens)
+    for i, word in enumerate(uniques):
+        uniques[word] = i
+    inverse = np.fromiter(map(uniques.__getitem__, tokens), dtype=np.intp, count=len(tokens))
+    doc_ids = np.cumsum(inverse == uniques.get(b"\x00", -1))
+
+    # Per distinct word (a few thousand per day), not per token: does it count
+    # towards document length, and which profile term (if any) it is
+    words = [w.decode("ascii", "ignore") for w in uniques]
+    counted = np.array([len(w) > 2 and w not in STOP_WORDS for w in words], dtype=bool)
+    columns = np.array([vocab.get(w[:STEM_LENGTH], -1) if ok else -1 for w, ok in zip(words, counted)], dtype=np.intp)
+    counted, columns = counted[inverse], columns[inverse]
+
+    doc_lengths = np.bincount(doc_ids[counted], minlength=n_docs).astype(float)
+    # Term-frequency matrix restricted to profile terms (docs x terms)
+    hit = columns >= 0
+    flat = doc_ids[hit] * len(vocab) + columns[hit]
+    tf = np.bincount(flat, minlength=n_docs * len(vocab)).reshape(n_docs, len(vocab)).astype(float)
+
+    df = np.count_nonzero(tf, axis=0)
+    idf = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+    avg_len = max(doc_lengths.mean(), 1.0)
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_lengths / avg_len)
+    weights = tf * (BM25_K1 + 1) / (tf + norm[:, None])
+
+    n_wanted = len(wanted)
+    scores = weights[:, :n_wanted] @ idf[:n_wanted]
+    if excluded:
+        has_excluded = tf[:, n_wanted:].any(axis=1)
+        scores = np.where(has_excluded, scores * NEGATIVE_PENALTY, scores)
+    return scores
+
+def rank_tenders(tenders, profile, top_k=None, min_score=None, scorer=bm25_scores):
+    """
+    Orders tenders by local relevance to the profile, best first, adding a
+    "Relevancia" field. Keeps at most `top_k` and only scores above `min_score`.
+    `scorer(tenders, profile)` returns one score per tender (BM25 by default,
+    semantic.profile_scores for embedding similarity).
+    A profile with no usable terms (empty, only stop words) ranks nothing:
+    the first `top_k` tenders are kept in their original order, as a
+    general profile.
+    """
+    if not tenders:
+        return []
+    if not profile_terms(profile)[0]:
+        return [dict(t, Relevancia=0.0) for t in tenders[:top_k]]
+    scores = scorer(tenders, profile)
+    order = np.argsort(-scores, kind="stable")
+    if min_score is not None:
+        order = order[scores[order] > min_score]
+    if top_k is not None:
+        order = order[:top_k]
+    return [dict(tenders[i], Relevancia=round(float(scores[i]), 2)) for i in order]
@@ -1,4 +1,4 @@
-import requests
+import mp_client
 import json
 import datetime
 
@@ -11,7 +11,7 @@ def research_pdf_links():
     # 1. Fetch List
     print(f"Fetching List for {date_str}...")
     try:
-        resp = requests.get(url_list, params={"fecha": date_str, "ticket": ticket}, timeout=10)
+        resp = mp_client.get(url_list, params={"fecha": date_str, "ticket": ticket}, timeout=10)
         data = resp.json()
     except Exception as e:
         print(f"List Fetch Error: {e}")
@@ -28,7 +28,7 @@ def research_pdf_links():
     # 2. Fetch Detail
     print(f"Fetching Detail for {code}...")
     try:
-        resp_det = requests.get(url_list, params={"codigo": code, "ticket": ticket}, timeout=10)
+        resp_det = mp_client.get(url_list, params={"codigo": code, "ticket": ticket}, timeout=10)
         print(f"Status: {resp_det.status_code}")
         
         if resp_det.status_code == 200:
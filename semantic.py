@@ -0,0 +1,402 @@
+import argparse
+import functools
+import os
+import re
+import threading
+import zlib
+import numpy as np
+import db
+from matcher import normalize_text
+from ranking import STOP_WORDS, STEM_LENGTH, profile_terms
+
+try:
+    from sentence_transformers import SentenceTransformer  # optional, real multilingual model
+except ImportError:
+    SentenceTransformer = None
+
+# Offline semantic matching. Each tender (Nombre + Descripcion) is embedded
+# once, when it is ingested, into a row of a memory-mapped float32 matrix
+# (EMBEDDINGS_DIR/<model>/vectors-NNNNN.npy, SHARD_ROWS rows per file; the
+# code -> row map lives in tenders.db). Scoring a profile against a day is a
+# row gather plus one matrix-vector product; history searches go through an
+# IVF index (k-means lists, only the closest ones are scanned).
+EMBEDDINGS_DIR = "embeddings"
+DIM = 384
+SHARD_ROWS = 16384  # 24 MB per shard file at DIM=384
+
+# Default embedder: signed feature hashing of word stems, character trigrams
+# and CONCEPTS (no model download, ~20k tenders/s). TENDER_EMBEDDER=
+# sentence-transformers switches to ST_MODEL when the package is installed.
+ST_MODEL = "paraphrase-multilingual-MiniLM-L12-v2"
+NGRAM = 3
+STEM_WEIGHT = 1.0
+NGRAM_WEIGHT = 1.0  # split among the word's n-grams
+CONCEPT_WEIGHT = 2.0
+
+# Words that mean the same thing in a tender, folded. A word (or its stem)
+# listed here also emits the concept feature, so "notebooks" and
+# "computadores portátiles" share dimensions without sharing a word.
+# Changing this table changes the vectors: bump HashingEmbedder.version.
+CONCEPTS = {
+    "computacion": "computador computadores computadora computadoras computacion computacional computacionales "
+                   "pc pcs desktop notebook notebooks laptop laptops portatil portatiles tablet tablets "
+                   "workstation informatico informaticos informatica hardware",
+    "portatil": "notebook notebooks laptop laptops portatil portatiles ultrabook netbook",
+    "impresion": "impresora impresoras impresion multifuncional multifuncionales toner toners tinta tintas "
+                 "cartucho cartuchos plotter fotocopiadora fotocopiadoras",
+    "software": "software licencia licencias aplicacion aplicaciones sistema sistemas plataforma plataformas "
+                "desarrollo programa programas saas erp",
+    "servidores": "servidor servidores datacenter storage almacenamiento nube cloud hosting virtualizacion",
+    "redes": "red redes switch switches router routers wifi cableado fibra conectividad internet enlace enlaces",
+    "telefonia": "telefonia telefono telefonos celular celulares movil moviles smartphone smartphones",
+    "aseo": "aseo limpieza higiene detergente detergentes desinfeccion sanitizacion",
+    "vehiculos": "vehiculo vehiculos camioneta camionetas automovil automoviles camion camiones furgon furgones "
+                 "bus buses",
+    "alimentacion": "alimento alimentos alimentacion colacion colaciones casino viveres abarrotes",
+    "construccion": "construccion obra obras edificacion remodelacion pavimentacion infraestructura",
+    "mobiliario": "mobiliario mueble muebles silla sillas escritorio escritorios estante estantes",
+    "salud": "medicamento medicamentos farmaco farmacos clinico clinicos hospitalario hospitalarios medico medicos",
+    "seguridad": "seguridad vigilancia guardia guardias camara camaras cctv alarma alarmas",
+    "capacitacion": "capacitacion capacitaciones curso cursos taller talleres formacion entrenamiento",
+    "consultoria": "consultoria consultorias asesoria asesorias estudio estudios auditoria diagnostico",
+    "mantencion": "mantencion mantenimiento soporte reparacion reparaciones",
+}
+_CONCEPTS_OF = {}
+for _concept, _words in CONCEPTS.items():
+    for _word in _words.split():
+        for _key in (_word, _word[:STEM_LENGTH]):
+            _CONCEPTS_OF.setdefault(_key, set()).add(_concept)
+
+# get_tenders(semantic=True) keeps listings at least this similar to the keywords
+MIN_SIMILARITY = 0.3
+# Profile clauses after a negation ("No vendo hardware") subtract this much similarity
+EXCLUDED_WEIGHT = 0.5
+QUERY_CACHE_SIZE = 256
+
+# IVF index: below IVF_MIN_ROWS a search just scans everything
+IVF_MIN_ROWS = 20000
+IVF_NPROBE = 8
+KMEANS_ITERS = 10
+KMEANS_SAMPLE = 20000
+# The index is rebuilt once the matrix grew this much since the last build
+REBUILD_GROWTH = 0.2
+SEARCH_K = 200
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+def _hash(feature, dim):
+    # Stable across processes (unlike hash()), vectors are stored on disk
+    h = zlib.crc32(feature.encode("utf-8"))
+    return h % dim, (1.0 if h & 0x80000000 else -1.0)
+
+@functools.lru_cache(maxsize=200000)
+def _word_features(word, dim):
+    # Feature indexes and signed weights of one word, computed once per distinct word
+    stem = word[:STEM_LENGTH]
+    padded = f"<{word}>"
+    grams = [padded[i:i + NGRAM] for i in range(len(padded) - NGRAM + 1)]
+    features = [("w:" + stem, STEM_WEIGHT)]
+    features += [("g:" + g, NGRAM_WEIGHT / len(grams)) for g in grams]
+    concepts = _CONCEPTS_OF.get(word) or _CONCEPTS_OF.get(stem) or ()
+    features += [("c:" + c, CONCEPT_WEIGHT) for c in sorted(concepts)]
+    idx, weights = [], []
+    for feature, weight in features:
+        i, sign = _hash(feature, dim)
+        idx.append(i)
+        weights.append(sign * weight)
+    return np.array(idx, dtype=np.intp), np.array(weights)
+
+
+class HashingEmbedder:
+    version = 1
+
+    def __init__(self, dim=DIM):
+        self.dim = dim
+        self.name = f"hash-v{self.version}-{dim}"
+
+    def embed(self, texts):
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = [w for w in _WORD_RE.findall(normalize_text(text)) if len(w) > 2 and w not in STOP_WORDS]
+            if not words:
+                continue
+            parts = [_word_features(w, self.dim) for w in words]
+            vector = np.bincount(np.concatenate([p[0] for p in parts]),
+                                 weights=np.concatenate([p[1] for p in parts]), minlength=self.dim)
+            norm = np.linalg.norm(vector)
+            if norm:
+                out[row] = vector / norm
+        return out
+
+
+class SentenceTransformerEmbedder:
+    def __init__(self, model_name=ST_MODEL):
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.name = "st-" + model_name.replace("/", "-")
+
+    def embed(self, texts):
+        return self.model.encode(list(texts), batch_size=64, normalize_embeddings=True,
+                                 convert_to_numpy=True).astype(np.float32)
+
+
+_embedder = None
+_stores = {}
+_lock = threading.Lock()
+
+def get_embedder():
+    global _embedder
+    with _lock:
+        if _embedder is None:
+            if os.environ.get("TENDER_EMBEDDER") == "sentence-transformers" and SentenceTransformer is not None:
+                _embedder = SentenceTransformerEmbedder()
+            else:
+                _embedder = HashingEmbedder()
+        return _embedder
+
+
+def tender_text(item):
+    return f"{item.get('Nombre') or ''}\n{item.get('Descripcion') or ''}"
+
+
+class VectorStore:
+    """
+    Embeddings of one model: memory-mapped shard files plus the code -> row
+    map in tenders.db. Several processes (app, worker, backfill) can add rows
+    concurrently: rows are handed out under the database write lock.
+    """
+    def __init__(self, embedder, root=EMBEDDINGS_DIR):
+        self.embedder = embedder
+        self.model = embedder.name
+        self.dim = embedder.dim
+        self.dir = os.path.join(root, self.model)
+        self._shards = {}
+        self._rows = {}  # codigo -> row, rows never move once assigned
+        self._index = None
+        self._index_mtime = None
+        self._lock = threading.Lock()
+
+    def _shard_path(self, i):
+        return os.path.join(self.dir, f"vectors-{i:05d}.npy")
+
+    def _create_shards(self, first, last):
+        # Runs under the db write lock (reserve_embedding_rows): one creator per file
+        os.makedirs(self.dir, exist_ok=True)
+        for i in range(first // SHARD_ROWS, last // SHARD_ROWS + 1):
+            path = self._shard_path(i)
+            if not os.path.exists(path):
+                shard = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(SHARD_ROWS, self.dim))
+                shard.flush()
+                del shard
+
+    def _shard(self, i):
+        with self._lock:
+            shard = self._shards.get(i)
+            if shard is None:
+                shard = self._shards[i] = np.load(self._shard_path(i), mmap_mode="r+")
+            return shard
+
+    def count(self):
+        return db.count_embeddings(self.model)
+
+    def add(self, codes, vectors):
+        """
+        Stores vectors for codes not embedded yet. Returns {codigo: row} of the new rows.
+        """
+        by_code = dict(zip(codes, vectors))
+        reserved = db.reserve_embedding_rows(self.model, list(by_code), self._create_shards)
+        if reserved:
+            rows = np.fromiter(reserved.values(), dtype=np.intp, count=len(reserved))
+            matrix = np.stack([by_code[c] for c in reserved])
+            for s in np.unique(rows // SHARD_ROWS):
+                mask = rows // SHARD_ROWS == s
+                shard = self._shard(int(s))
+                shard[rows[mask] % SHARD_ROWS] = matrix[mask]
+                shard.flush()
+        return reserved
+
+    def ensure(self, items):
+        """
+        {codigo: row} for listing items / tenders, embedding (tender_text)
+        only the ones not stored yet.
+        """
+        by_code = {item["CodigoExterno"]: item for item in items}
+        unknown = [c for c in by_code if c not in self._rows]
+        if unknown:
+            self._rows.update(db.get_embedding_rows(self.model, unknown))
+            missing = [c for c in unknown if c not in self._rows]
+            if missing:
+                self._rows.update(self.add(missing, self.embedder.embed([tender_text(by_code[c]) for c in missing])))
+                # Another process may have embedded some of them first
+                self._rows.update(db.get_embedding_rows(self.model, [c for c in missing if c not in self._rows]))
+        return {c: self._rows[c] for c in by_code}
+
+    def gather(self, rows):
+        rows = np.asarray(rows, dtype=np.intp)
+        out = np.empty((len(rows), self.dim), dtype=np.float32)
+        shard_ids = rows // SHARD_ROWS
+        for s in np.unique(shard_ids):
+            mask = shard_ids == s
+            out[mask] = self._shard(int(s))[rows[mask] % SHARD_ROWS]
+        return out
+
+    def _iter_chunks(self, total, size=50000):
+        for start in range(0, total, size):
+            rows = np.arange(start, min(start + size, total))
+            yield rows, self.gather(rows)
+
+    def build_index(self, seed=0):
+        """
+        Spherical k-means over (a sample of) every stored vector, then each
+        row is filed under its closest centroid. Saved as ivf.npz.
+        """
+        total = self.count()
+        if total == 0:
+            return None
+        rng = np.random.default_rng(seed)
+        n_lists = int(np.clip(np.sqrt(total), 8, 1024))
+        sample = self.gather(np.sort(rng.choice(total, min(total, KMEANS_SAMPLE), replace=False)))
+        centroids = sample[rng.choice(len(sample), min(n_lists, len(sample)), replace=False)]
+        for _ in range(KMEANS_ITERS):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # Empty lists keep their previous centroid
+            centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids)
+
+        assign = np.concatenate([np.argmax(chunk @ centroids.T, axis=1) for _, chunk in self._iter_chunks(total)])
+        order = np.argsort(assign, kind="stable")
+        offsets = np.searchsorted(assign[order], np.arange(len(centroids) + 1))
+        tmp = os.path.join(self.dir, "ivf.tmp.npz")
+        np.savez(tmp, centroids=centroids, list_rows=order, offsets=offsets, built_rows=total)
+        os.replace(tmp, os.path.join(self.dir, "ivf.npz"))
+        print(f"[INFO] IVF index: {total} vectors in {len(centroids)} lists.")
+        return total
+
+    def load_index(self):
+        path = os.path.join(self.dir, "ivf.npz")
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None
+        if self._index is None or mtime != self._index_mtime:
+            with np.load(path) as data:
+                self._index = {k: data[k] for k in data.files}
+            self._index_mtime = mtime
+        return self._index
+
+    def maybe_rebuild_index(self):
+        total = self.count()
+        index = self.load_index()
+        built = int(index["built_rows"]) if index is not None else 0
+        if total >= IVF_MIN_ROWS and total - built > REBUILD_GROWTH * max(built, 1):
+            return self.build_index()
+        return None
+
+    def search(self, query_vector, k=SEARCH_K, nprobe=IVF_NPROBE):
+        """
+        Approximate top-k rows by cosine similarity: the `nprobe` closest IVF
+        lists plus the rows added after the last build. Returns (rows, scores).
+        """
+        total = self.count()
+        index = self.load_index() if total >= IVF_MIN_ROWS else None
+        if index is None:
+            candidates = np.arange(total)
+        else:
+            offsets = index["offsets"]
+            lists = np.argsort(-(index["centroids"] @ query_vector))[:nprobe]
+            candidates = np.concatenate([index["list_rows"][offsets[l]:offsets[l + 1]] for l in lists] +
+                                        [np.arange(int(index["built_rows"]), total)])
+        if len(candidates) == 0:
+            return candidates, np.zeros(0)
+        scores = self.gather(candidates) @ query_vector
+        top = np.argsort(-scores, kind="stable")[:k] if len(scores) <= k else \
+            np.argpartition(-scores, k)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return candidates[top], scores[top]
+
+
+def get_store():
+    embedder = get_embedder()
+    with _lock:
+        store = _stores.get(embedder.name)
+        if store is None:
+            store = _stores[embedder.name] = VectorStore(embedder)
+        return store
+
+def index_items(items):
+    """
+    Ingestion hook: embeds the listing items not stored yet. Returns how many are stored.
+    """
+    return len(get_store().ensure(item for item in items if item.get("CodigoExterno")))
+
+@functools.lru_cache(maxsize=QUERY_CACHE_SIZE)
+def embed_query(text):
+    # Keywords/profiles repeat across reruns and digests: embedded once
+    vector = get_embedder().embed([text])[0]
+    vector.setflags(write=False)
+    return vector
+
+def _matrix(items):
+    # One row per item, in order; items without a code are embedded on the fly
+    store = get_store()
+    coded = [item for item in items if item.get("CodigoExterno")]
+    rows = store.ensure(coded)
+    if len(coded) == len(items):
+        return store.gather([rows[item["CodigoExterno"]] for item in items])
+    return np.stack([store.gather([rows[item["CodigoExterno"]]])[0] if item.get("CodigoExterno")
+                     else store.embedder.embed([tender_text(item)])[0] for item in items])
+
+def similarities(items, query):
+    """
+    Cosine similarity of each listing item / tender to `query`.
+    """
+    if not items or not (query or "").strip():
+        return np.zeros(len(items))
+    return _matrix(items) @ embed_query(query)
+
+def profile_scores(tenders, profile):
+    """
+    Semantic counterpart of ranking.bm25_scores: similarity to the wanted
+    part of the profile, minus a penalty for what it rules out.
+    Usable as rank_tenders(..., scorer=profile_scores).
+    """
+    wanted, excluded = profile_terms(profile)
+    if not tenders or not wanted:
+        return np.zeros(len(tenders))
+    matrix = _matrix(tenders)
+    scores = matrix @ embed_query(" ".join(wanted))
+    if excluded:
+        scores -= EXCLUDED_WEIGHT * np.maximum(matrix @ embed_query(" ".join(excluded)), 0)
+    return scores
+
+def search(query, k=SEARCH_K):
+    """
+    Most similar indexed tenders to `query` across the whole history.
+    Returns {codigo: similarity}, best first.
+    """
+    if not (query or "").strip():
+        return {}
+    store = get_store()
+    rows, scores = store.search(embed_query(query), k)
+    codes = db.get_embedding_codes(store.model, rows)
+    return {codes[int(r)]: round(float(s), 3) for r, s in zip(rows, scores) if int(r) in codes}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Semantic index of the local listings (embeddings + IVF)")
+    parser.add_argument("--index", action="store_true", help="Embed every indexed listing not embedded yet")
+    parser.add_argument("--build", action="store_true", help="(Re)build the IVF index")
+    parser.add_argument("--search", metavar="QUERY")
+    args = parser.parse_args()
+
+    store = get_store()
+    if args.index:
+        for batch in db.iter_listing_texts():
+            store.ensure(batch)
+        print(f"{store.count()} vectors ({store.model}).")
+    if args.build:
+        store.build_index()
+    if args.search:
+        for codigo, score in list(search(args.search).items())[:20]:
+            print(f"{score:.3f}  {codigo}")
@@ -0,0 +1,126 @@
+import pandas as pd
+from matcher import KeywordMatcher
+
+# Columnar form of a tender listing: one DataFrame instead of a list of dicts
+# with the same keys repeated on every row. Low-cardinality columns
+# (buyer, state, publication day, matched terms) are categoricals, so a
+# month of listings keeps one copy of each distinct string.
+COLUMNS = ["CodigoExterno", "Nombre", "FechaCierre", "Organismo", "Estado",
+           "CodigoEstado", "FechaPublicacion", "Coincidencias"]
+CATEGORICAL_COLUMNS = ["Organismo", "Estado", "FechaPublicacion", "Coincidencias"]
+
+# MP's portal blocks external referrers/sessions, so the ficha link is a Google search
+LINK_PREFIX = "https://www.google.com/search?q=site:mercadopublico.cl+%22"
+LINK_SUFFIX = "%22"
+
+def tender_link(code):
+    return f"{LINK_PREFIX}{code}{LINK_SUFFIX}"
+
+def links(frame):
+    # Vectorized tender_link over the whole frame
+    return LINK_PREFIX + frame["CodigoExterno"].astype(str) + LINK_SUFFIX
+
+def _typed(frame):
+    for col in CATEGORICAL_COLUMNS:
+        if col in frame:
+            frame[col] = frame[col].astype("category")
+    if "CodigoEstado" in frame:
+        frame["CodigoEstado"] = frame["CodigoEstado"].astype("Int8")
+    return frame
+
+def empty_frame():
+    return _typed(pd.DataFrame({col: pd.Series(dtype="str") for col in COLUMNS}))
+
+def listing_frame(items, matcher, date_str, only_published=True, estado_map=None, similarity=None, min_similarity=0.0):
+    """
+    Columnar equivalent of mercado_logic.filter_listing: same rows, same order.
+    With `similarity` (one score per item, see semantic.similarities) items at
+    least `min_similarity` close to the query are kept even without a keyword
+    hit, and the score goes in a "Similitud" column.
+    """
+    estado_map = estado_map or {}
+    texts = [(item.get("Nombre") or "") + "\n" + (item.get("Descripcion") or "") for item in items]
+    all_hits = matcher.match_many(texts)
+    close = similarity >= min_similarity if similarity is not None else [False] * len(items)
+
+    keep = [i for i, (item, hits) in enumerate(zip(items, all_hits))
+            if (matcher.match_all or hits or close[i]) and (not only_published or item.get("CodigoEstado") == 5)]
+    if not keep:
+        return empty_frame()
+
+    kept = [items[i] for i in keep]
+    codigo_estado = [item.get("CodigoEstado") for item in kept]
+    frame = pd.DataFrame({
+        "CodigoExterno": [item.get("CodigoExterno") for item in kept],
+        "Nombre": [item.get("Nombre") for item in kept],
+        "FechaCierre": [item.get("FechaCierre") for item in kept],
+        "Organismo": [(item.get("Comprador") or {}).get("NombreOrganismo", "Desconocido") for item in kept],
+        "Estado": [estado_map.get(c, "Desconocido") for c in codigo_estado],
+        "CodigoEstado": codigo_estado,
+        "FechaPublicacion": date_str,
+        "Coincidencias": [", ".join(all_hits[i]) for i in keep],
+    })
+    if similarity is not None:
+        frame["Similitud"] = similarity[keep].round(3)
+    return _typed(frame)
+
+def concat_frames(frames):
+    frames = [f for f in frames if len(f)]
+    if not frames:
+        return empty_frame()
+    # Categoricals with different categories concat as plain columns, re-type once
+    frame = pd.concat(frames, ignore_index=True)
+    return _typed(frame)
+
+def filter_text(frame, text):
+    """
+    Rows whose name or buyer mention any of the comma-separated terms
+    (accent/case-insensitive, same matching as the keyword search).
+    """
+    if not text or not text.strip() or frame.empty:
+        return frame
+    matcher = KeywordMatcher(text)
+    texts = (frame["Nombre"].astype(str) + "\n" + frame["Organismo"].astype(str)).tolist()
+    mask = [bool(hits) for hits in matcher.match_many(texts)]
+    return frame[mask].reset_index(drop=True)
+
+def to_frame(tenders):
+    """
+    Builds a frame from tender dicts (local search results, mock data...).
+    Columns not present in the dicts are left out.
+    """
+    if not tenders:
+        return empty_frame()
+    frame = pd.DataFrame(tenders)
+    if "Link" in frame:
+        # Derived column, rebuilt on demand with links()
+        frame = frame.drop(columns="Link")
+    if "Coincidencias" in frame:
+        frame["Coincidencias"] = frame["Coincidencias"].map(lambda h: ", ".join(h) if isinstance(h, list) else h)
+    return _typed(frame)
+
+def _record(columns, values):
+    t = {}
+    for col, value in zip(columns, values):
+        if pd.isna(value):
+            value = None
+        elif hasattr(value, "item"):
+            # numpy scalar -> plain Python value
+            value = value.item()
+        t[col] = value
+    if "Coincidencias" in t:
+        t["Coincidencias"] = t["Coincidencias"].split(", ") if t["Coincidencias"] else []
+    t["Link"] = tender_link(t["CodigoExterno"])
+    return t
+
+def iter_records(frame):
+    """
+    Yields one tender dict per row (the shape the AI/ranking code expects),
+    materializing rows only as they are consumed.
+    """
+    columns = list(frame.columns)
+    for values in frame.itertuples(index=False, name=None):
+        yield _record(columns, values)
+
+def to_records(frame):
+    return list(iter_records(frame))
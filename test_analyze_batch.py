@@ -0,0 +1,95 @@
+import json
+import re
+import time
+import pytest
+import analyst
+import db
+from bench_support import FakeGeminiModel, FakeResponse
+
+# analyze_batch against the fake Gemini client (latency + injected 429s), no network
+
+
+class TitleModel(FakeGeminiModel):
+    # Single-tender answers carry the title, so each result can be traced back to its tender
+    def generate_content(self, content_parts):
+        prompt = content_parts[0]
+        title = re.search(r"Título: (.*)", prompt)
+        response = super().generate_content(content_parts)
+        if title is None:
+            return response
+        return FakeResponse(json.dumps({"score": 50, "reason": title.group(1).strip()}))
+
+
+@pytest.fixture
+def fake_gemini(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_NAME", str(tmp_path / "test.db"))
+    monkeypatch.setattr(analyst, "scheduler", analyst.ModelScheduler(base_delay=0.01, max_delay=0.05, max_attempts=10))
+
+    def install(model):
+        monkeypatch.setattr(analyst, "_build_model", lambda api_key, model_name: model)
+        return model
+    return install
+
+
+def make_tenders(n):
+    return [{"CodigoExterno": f"{i}-LE26", "Nombre": f"Licitación {i}", "Organismo": "Municipalidad"} for i in range(n)]
+
+
+def test_one_result_per_tender_with_retries(fake_gemini):
+    model = fake_gemini(TitleModel("fake", latency=0.01, error_rate=0.3, seed=1))
+    tenders = make_tenders(30)
+    results = list(analyst.analyze_batch(tenders, criteria="software", api_key="FAKE", max_workers=4,
+                                         requests_per_minute=6000))
+
+    codes = [t["CodigoExterno"] for t, _ in results]
+    assert sorted(codes) == sorted(t["CodigoExterno"] for t in tenders)
+    for t, analysis in results:
+        assert analysis["reason"] == t["Nombre"]
+    # Injected 429s were retried, not turned into "busy" results
+    assert analyst.scheduler.stats()["retries"] > 0
+    assert model.calls == len(tenders) + analyst.scheduler.stats()["quota_errors"]
+
+
+def test_packed_results_map_to_their_tender(fake_gemini):
+    fake_gemini(TitleModel("fake", latency=0.01, error_rate=0.2, seed=2, drop_rate=0.2))
+    tenders = make_tenders(50)
+    results = list(analyst.analyze_batch(tenders, criteria="software", api_key="FAKE", max_workers=4,
+                                         requests_per_minute=6000, packed=True))
+
+    assert sorted(t["CodigoExterno"] for t, _ in results) == sorted(t["CodigoExterno"] for t in tenders)
+    for t, analysis in results:
+        # Packed entries are scored by their code; entries dropped from a packed
+        # answer end up re-analyzed on their own, answered with their title
+        assert analysis["score"] == sum(map(ord, t["CodigoExterno"])) % 100 or analysis["reason"] == t["Nombre"]
+
+
+def test_early_stop_cancels_queued_calls(fake_gemini):
+    model = fake_gemini(FakeGeminiModel("fake", latency=0.2))
+    batch = analyst.analyze_batch(make_tenders(40), criteria="software", api_key="FAKE", max_workers=2,
+                                  requests_per_minute=6000)
+    next(batch)
+    t0 = time.perf_counter()
+    batch.close()
+    assert time.perf_counter() - t0 < 0.5
+    time.sleep(0.3)
+    # Only the calls already running when the consumer stopped went through
+    assert model.calls <= 4
+
+
+class BrokenModel(FakeGeminiModel):
+    # Non-quota failure on every call (bad key, blocked prompt)
+    def generate_content(self, content_parts):
+        self.calls += 1
+        raise RuntimeError("400 API key not valid")
+
+
+def test_packed_chunk_not_resplit_when_no_model_answers(fake_gemini):
+    model = fake_gemini(BrokenModel("fake"))
+    tenders = make_tenders(16)
+    results = list(analyst.analyze_batch(tenders, criteria="software", api_key="FAKE", max_workers=4,
+                                         requests_per_minute=6000, packed=True, token_budget=10**6))
+
+    assert len(results) == len(tenders)
+    assert all(analysis == analyst.BUSY_RESULT for _, analysis in results)
+    # One packed call per model, no halving into smaller calls
+    assert model.calls == len(analyst.MODELS_TO_TRY)
@@ -1,4 +1,4 @@
-import requests
+import mp_client
 import json
 from datetime import datetime
 
@@ -26,7 +26,7 @@ def test_connection():
     print(f"Connecting to {url} with date={date_str}...")
     try:
         # 30 second timeout
-        response = requests.get(url, params=params, timeout=30)
+        response = mp_client.get(url, params=params, timeout=30)
         print(f"Status Code: {response.status_code}")
         
         if response.status_code == 200:
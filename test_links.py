@@ -1,4 +1,4 @@
-import requests
+import mp_client
 
 def test_links():
     code = "1030177-1-LP26" # Use a real recent ID from previous output
@@ -18,7 +18,7 @@ def test_links():
     for url in candidates:
         try:
             print(f"Trying: {url}")
-            resp = requests.get(url, headers=headers, timeout=5, allow_redirects=True)
+            resp = mp_client.get(url, headers=headers, timeout=5, allow_redirects=True)
             print(f"Status: {resp.status_code}")
             print(f"Final URL: {resp.url}")
             
@@ -0,0 +1,84 @@
+import codecs
+import io
+import pandas as pd
+import tender_frame
+
+try:
+    import xlsxwriter  # optional, fastest xlsx writer
+except ImportError:
+    xlsxwriter = None
+
+# format -> (label, extension, mime)
+EXPORT_FORMATS = {
+    "xlsx": ("Excel", "xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "csv": ("CSV", "csv", "text/csv"),
+    "parquet": ("Parquet", "parquet", "application/vnd.apache.parquet"),
+}
+CSV_CHUNK_ROWS = 10000
+SHEET_NAME = "Licitaciones"
+
+def export_frame(frame, analyses):
+    """
+    Export table for a tender frame. `analyses` maps CodigoExterno -> analysis dict.
+    """
+    codes = frame["CodigoExterno"]
+    return pd.DataFrame({
+        "ID": codes,
+        "Nombre": frame["Nombre"],
+        "Organismo": frame["Organismo"],
+        "Fecha Cierre": frame["FechaCierre"],
+        "Estado": frame["Estado"] if "Estado" in frame else "Desconocido",
+        "Link": tender_frame.links(frame),
+        "Score IA": codes.map(lambda c: analyses[c]['score'] if c in analyses else 0),
+        "Razón IA": codes.map(lambda c: analyses[c]['reason'] if c in analyses else "No analizado"),
+    })
+
+def parquet_available():
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def available_formats():
+    return [fmt for fmt in EXPORT_FORMATS if fmt != "parquet" or parquet_available()]
+
+def to_csv(df):
+    # BOM so Excel opens accents correctly; written in chunks of rows
+    output = io.BytesIO()
+    output.write(codecs.BOM_UTF8)
+    df.to_csv(output, index=False, encoding="utf-8", chunksize=CSV_CHUNK_ROWS)
+    return output.getvalue()
+
+def to_parquet(df):
+    output = io.BytesIO()
+    df.to_parquet(output, index=False)
+    return output.getvalue()
+
+def to_xlsx(df):
+    """
+    Streams rows into a write-only workbook instead of building the styled
+    in-memory sheet pd.ExcelWriter/openpyxl creates.
+    """
+    output = io.BytesIO()
+    rows = df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+    if xlsxwriter:
+        workbook = xlsxwriter.Workbook(output, {"constant_memory": True, "strings_to_urls": False})
+        sheet = workbook.add_worksheet(SHEET_NAME)
+        sheet.write_row(0, 0, list(df.columns))
+        for r, row in enumerate(rows, start=1):
+            sheet.write_row(r, 0, row)
+        workbook.close()
+    else:
+        from openpyxl import Workbook
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet(SHEET_NAME)
+        sheet.append(list(df.columns))
+        for row in rows:
+            sheet.append(row)
+        workbook.save(output)
+    return output.getvalue()
+
+def export_bytes(df, fmt):
+    writers = {"xlsx": to_xlsx, "csv": to_csv, "parquet": to_parquet}
+    return writers[fmt](df)
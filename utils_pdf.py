@@ -1,24 +1,141 @@
-from pypdf import PdfReader
+from pypdf import PdfReader, PdfWriter
+import hashlib
 import io
+import mmap
+import os
+import metrics
 
-def extract_text_from_pdf(file_stream):
+# Pages with less extractable text than this (and at least one image) are
+# treated as scanned and sent to the model as a page subset instead of text.
+MIN_TEXT_CHARS = 40
+# Compact text budget forwarded to the model (~15k tokens)
+MAX_TEXT_CHARS = 60000
+# Upper bound on scanned pages attached, to keep uploads small
+MAX_SCANNED_PAGES = 20
+
+def open_pdf(source):
+    """
+    Opens a PdfReader without loading the whole document into a new buffer.
+    `source` can be a path (memory-mapped), bytes, or a file-like object such
+    as Streamlit's UploadedFile. pypdf then parses objects lazily, page by page.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            source = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    elif isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    return PdfReader(source)
+
+def pdf_digest(source):
+    """
+    SHA-256 of the document bytes, for any `source` open_pdf accepts.
+    File-like objects are rewound afterwards.
+    """
+    digest = hashlib.sha256()
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    elif isinstance(source, (bytes, bytearray)):
+        digest.update(source)
+    elif hasattr(source, "getbuffer"):
+        digest.update(source.getbuffer())
+    else:
+        position = source.tell()
+        source.seek(0)
+        for block in iter(lambda: source.read(1 << 20), b""):
+            digest.update(block)
+        source.seek(position)
+    return digest.hexdigest()
+
+def iter_page_texts(reader, max_pages=None):
+    """
+    Lazily yields (page_number, text) for each page.
+    """
+    for i, page in enumerate(reader.pages):
+        if max_pages is not None and i >= max_pages:
+            return
+        try:
+            text = page.extract_text() or ""
+        except Exception as e:
+            print(f"PDF Error (page {i + 1}): {e}")
+            text = ""
+        yield i, text
+
+def _has_images(page):
+    try:
+        resources = page.get("/Resources")
+        xobjects = resources.get_object().get("/XObject") if resources else None
+        if not xobjects:
+            return False
+        return any(x.get_object().get("/Subtype") == "/Image" for x in xobjects.get_object().values())
+    except Exception:
+        return False
+
+@metrics.timed("pdf.prepare")
+def prepare_pdf(source, max_chars=MAX_TEXT_CHARS, max_scanned_pages=MAX_SCANNED_PAGES):
+    """
+    Turns a tender PDF into what the model actually needs:
+    - "text": compact extracted text of the text pages (up to max_chars)
+    - "scanned_pdf": a small PDF holding only the scanned pages, or None
+    plus page counts for display. Returns None if the PDF can't be read.
+    Pages after the text budget is spent are not read.
+    """
+    try:
+        reader = open_pdf(source)
+        parts = []
+        used = 0
+        truncated = False
+        scanned = []
+
+        for i, text in iter_page_texts(reader):
+            page = reader.pages[i]
+            if len(text.strip()) < MIN_TEXT_CHARS:
+                if _has_images(page) and len(scanned) < max_scanned_pages:
+                    scanned.append(i)
+                continue
+            chunk = f"--- Página {i + 1} ---\n{text.strip()}\n"
+            parts.append(chunk[:max_chars - used])
+            used += len(parts[-1])
+            if used >= max_chars:
+                truncated = len(chunk) > len(parts[-1]) or i + 1 < len(reader.pages)
+                break
+
+        if truncated:
+            parts.append(f"\n[...Texto truncado en {max_chars} caracteres...]")
+
+        scanned_pdf = None
+        if scanned:
+            writer = PdfWriter()
+            for i in scanned:
+                writer.add_page(reader.pages[i])
+            buffer = io.BytesIO()
+            writer.write(buffer)
+            scanned_pdf = buffer.getvalue()
+
+        return {
+            "text": "".join(parts),
+            "scanned_pdf": scanned_pdf,
+            "pages": len(reader.pages),
+            "scanned_pages": [i + 1 for i in scanned],
+        }
+    except Exception as e:
+        print(f"PDF Error: {e}")
+        return None
+
+@metrics.timed("pdf.extract_text")
+def extract_text_from_pdf(file_stream, max_pages=5):
     """
     Extracts text from a PDF file stream (bytes).
     Returns string of text or None if error.
     """
     try:
-        reader = PdfReader(file_stream)
-        text = ""
+        reader = open_pdf(file_stream)
         # Limit pages to not overwhelm the LLM context window
-        max_pages = 5
-        count = 0
-        for page in reader.pages:
-            text += page.extract_text() + "\n"
-            count += 1
-            if count >= max_pages:
-                text += "\n[...Texto truncado después de 5 páginas...]"
-                break
-        return text
+        parts = [text + "\n" for _, text in iter_page_texts(reader, max_pages)]
+        if len(reader.pages) > max_pages:
+            parts.append(f"\n[...Texto truncado después de {max_pages} páginas...]")
+        return "".join(parts)
     except Exception as e:
         print(f"PDF Error: {e}")
         return None
@@ -0,0 +1,364 @@
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import signal
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+import db
+import metrics
+import mercado_logic
+import tender_frame
+import daily_digest
+import semantic
+from analyst import analyze_tender, analyze_batch, tender_description, get_requirements, extract_requirements, requirements_context
+from ranking import rank_tenders, bm25_scores
+from utils_pdf import prepare_pdf, pdf_digest
+
+CONFIG_FILE = "config.json"
+
+# Background worker: takes jobs from the `jobs` table in tenders.db and runs
+# them on a thread pool (the work is network-bound: MP API and Gemini).
+# The Streamlit app only enqueues jobs and polls them, so closing the tab
+# doesn't lose work. It also sends the daily digest, replacing the cron job.
+MAX_JOBS = 4
+POLL_INTERVAL = 1.0  # seconds between queue checks when idle
+HEARTBEAT_INTERVAL = 10  # seconds
+# Running jobs without a heartbeat for this long belong to a dead worker
+STALE_AFTER = 6 * HEARTBEAT_INTERVAL
+SHUTDOWN_GRACE = 30  # seconds to let running jobs finish on SIGTERM/Ctrl+C
+JOB_RETENTION = 7 * 24 * 3600  # finished jobs are purged after this
+PURGE_INTERVAL = 3600
+# Uploaded PDFs are handed to the worker as files, not inside the job params
+JOB_FILES_DIR = "job_files"
+JOB_FILE_GRACE = 3600  # orphaned job files are removed after this
+DIGEST_TIME = "07:00"  # local time, overridable with "digest_time" in config.json
+# Today's listing is re-polled this often (config "poll_minutes", 0 disables);
+# only new tenders and state changes are recorded (db.diff_snapshot)
+POLL_MINUTES = 15
+EVENT_RETENTION = 30 * 24 * 3600
+
+def load_config():
+    try:
+        with open(CONFIG_FILE, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def worker_available():
+    return db.worker_alive(STALE_AFTER)
+
+def save_job_file(data, suffix=".pdf"):
+    """
+    Stores an upload for a job and returns its path. Each upload gets its own
+    file (content hash plus a random token), so the job that removes it when
+    done can't pull it from under another job of the same document.
+    """
+    os.makedirs(JOB_FILES_DIR, exist_ok=True)
+    name = f"{hashlib.sha256(data).hexdigest()}-{uuid.uuid4().hex[:12]}{suffix}"
+    path = os.path.join(JOB_FILES_DIR, name)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+def purge_job_files(older_than=JOB_FILE_GRACE):
+    """
+    Removes job files no queued/running job points to (left by jobs that
+    failed for good or were purged). Files younger than `older_than` seconds
+    are kept: the app saves the file before enqueuing its job.
+    """
+    if not os.path.isdir(JOB_FILES_DIR):
+        return 0
+    referenced = {os.path.abspath(p) for p in db.active_job_files()}
+    removed = 0
+    for name in os.listdir(JOB_FILES_DIR):
+        path = os.path.abspath(os.path.join(JOB_FILES_DIR, name))
+        try:
+            if path not in referenced and time.time() - os.path.getmtime(path) > older_than:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            pass
+    return removed
+
+def run_analysis(t, criteria, api_key, pdf=None):
+    """
+    Single tender analysis, optionally with a PDF (path, bytes or upload).
+    The document is read once (text pages as text, scanned pages through
+    Gemini Vision) into a requirements extract stored by its SHA-256; the
+    analysis itself, and any later one of the same document, only sends that extract.
+    """
+    pdf_bytes = None
+    pdf_text = ""
+    if pdf is not None:
+        digest = pdf_digest(pdf)
+        extract = get_requirements(digest) if api_key else None
+        if extract is None:
+            prepared = prepare_pdf(pdf)
+            if prepared:
+                extract = extract_requirements(prepared, digest, api_key)
+                if extract is None:
+                    # No key or no model answered: the document itself, as before
+                    pdf_bytes = prepared["scanned_pdf"]
+                    if prepared["text"]:
+                        pdf_text = f"[DOCUMENTO PDF ADJUNTO - TEXTO EXTRAÍDO ({prepared['pages']} páginas)]\n{prepared['text']}"
+        if extract is not None:
+            pdf_text = requirements_context(extract)
+    t_full = mercado_logic.attach_details([t])[0]
+    return analyze_tender(t['Nombre'], description=tender_description(t_full), criteria=criteria, api_key=api_key,
+                          extra_context=pdf_text, pdf_data=pdf_bytes, code=t['CodigoExterno'])
+
+class JobInterrupted(Exception):
+    """
+    Raised inside a handler when the worker is shutting down; the job goes
+    back to the queue with its partial results.
+    """
+
+class JobContext:
+    def __init__(self, job, stopping, config):
+        self.job = job
+        self.params = job["params"]
+        self.partial = job["result"]
+        self.stopping = stopping
+        self.config = config
+
+    def credential(self, name):
+        # Keys typed in the app but not saved travel with the job, otherwise config.json
+        return self.params.get(name) or self.config.get(name)
+
+    def credentials(self):
+        return {name: self.params[name] for name in ("api_ticket", "gemini_key") if self.params.get(name)}
+
+    def progress(self, fraction, message=None, result=None):
+        db.update_job(self.job["id"], fraction, message, result)
+
+    def check(self):
+        if self.stopping.is_set():
+            raise JobInterrupted()
+
+def fetch_job(ctx):
+    p = ctx.params
+    ticket = ctx.credential("api_ticket")
+    ctx.progress(0.0, "Consultando Mercado Público")
+    frame = mercado_logic.get_tenders(p["keyword"], ticket=ticket,
+                                      start_date=datetime.date.fromisoformat(p["start_date"]),
+                                      end_date=datetime.date.fromisoformat(p["end_date"]),
+                                      only_published=p.get("only_published", True), as_frame=True,
+                                      semantic_match=p.get("semantic", False))
+    # Full records (description, items, amounts) for the AI load as a separate job
+    if ticket and len(frame):
+        tenders = tender_frame.to_records(frame.filter(["CodigoExterno", "CodigoEstado"]))
+        db.enqueue_job("hydrate", {"tenders": [{k: v for k, v in t.items() if k != "Link"} for t in tenders],
+                                   **ctx.credentials()})
+    return [{k: v for k, v in t.items() if k != "Link"} for t in tender_frame.iter_records(frame)]
+
+def hydrate_job(ctx):
+    return {"fetched": mercado_logic.hydrate_details(ctx.params["tenders"], ctx.credential("api_ticket"))}
+
+def analyze_job(ctx):
+    p = ctx.params
+    analysis = run_analysis(p["tender"], p.get("criteria", ""), ctx.credential("gemini_key"), pdf=p.get("pdf_path"))
+    if p.get("pdf_path") and os.path.exists(p["pdf_path"]):
+        os.remove(p["pdf_path"])
+    return analysis
+
+def analyze_batch_job(ctx):
+    """
+    Ranks the tenders against the profile and analyzes the top ones. Results
+    are saved as they arrive, so a resumed job skips what it already did.
+    """
+    p = ctx.params
+    results = dict(ctx.partial or {})
+    skip = set(p.get("skip", []))
+    candidates = rank_tenders(mercado_logic.attach_details(p["tenders"]), p.get("criteria", ""),
+                              top_k=p.get("top_k"), min_score=0,
+                              scorer=semantic.profile_scores if p.get("semantic") else bm25_scores)
+    pending = [t for t in candidates if t['CodigoExterno'] not in results and t['CodigoExterno'] not in skip]
+    total = len(candidates)
+    done = total - len(pending)
+    ctx.progress(done / total if total else 1.0, f"{total} de {len(p['tenders'])} licitaciones pasan el filtro local.", results)
+
+    for t, analysis in analyze_batch(pending, criteria=p.get("criteria", ""), api_key=ctx.credential("gemini_key"),
+                                     packed=p.get("packed", False)):
+        results[t['CodigoExterno']] = analysis
+        done += 1
+        ctx.progress(done / total, f"Analizado {done}/{total}: {t['Nombre']}", results)
+        ctx.check()
+    return results
+
+def poll_job(ctx):
+    events = mercado_logic.poll_day(datetime.date.fromisoformat(ctx.params["date"]), ctx.credential("api_ticket"))
+    if events is None:
+        raise RuntimeError("listing fetch failed")
+    new = sum(1 for e in events if e["kind"] == db.EVENT_NEW)
+    return {"new": new, "state": len(events) - new}
+
+def digest_job(ctx):
+    return {"sent": daily_digest.run_digest(ctx.config)}
+
+JOB_HANDLERS = {
+    "fetch": fetch_job,
+    "hydrate": hydrate_job,
+    "analyze": analyze_job,
+    "analyze_batch": analyze_batch_job,
+    "digest": digest_job,
+    "poll": poll_job,
+}
+# Bad params won't get better on retry
+PERMANENT_ERRORS = (KeyError, TypeError, ValueError)
+
+class Worker:
+    def __init__(self, max_jobs=MAX_JOBS, kinds=None, digest_time=DIGEST_TIME, poll_minutes=POLL_MINUTES):
+        self.id = f"{socket.gethostname()}:{os.getpid()}"
+        self.max_jobs = max_jobs
+        self.kinds = kinds
+        self.digest_time = digest_time
+        self.poll_minutes = poll_minutes
+        self.next_poll = 0.0
+        self.stopping = threading.Event()
+        self.running = {}  # job id -> future
+        self.jobs_done = 0
+        self.last_digest = None
+
+    def stop(self, *_):
+        if self.stopping.is_set():
+            # Second signal: don't wait for running jobs
+            print("[WARN] Forced exit, releasing running jobs.")
+            db.release_jobs(self.id)
+            db.remove_worker(self.id)
+            os._exit(1)
+        print("[INFO] Stopping: no new jobs, waiting for running ones...")
+        self.stopping.set()
+
+    def run_job(self, job):
+        ctx = JobContext(job, self.stopping, load_config())
+        print(f"[INFO] Job {job['id']} ({job['kind']}) started, attempt {job['attempts']}.")
+        try:
+            handler = JOB_HANDLERS.get(job["kind"])
+            if handler is None:
+                raise ValueError(f"unknown job kind {job['kind']!r}")
+            with metrics.timer(f"job.{job['kind']}"):
+                result = handler(ctx)
+            if not db.finish_job(job["id"], self.id, result):
+                print(f"[WARN] Job {job['id']} ({job['kind']}) finished after it was released, result dropped.")
+                return
+            self.jobs_done += 1
+            print(f"[INFO] Job {job['id']} ({job['kind']}) done.")
+        except JobInterrupted:
+            print(f"[INFO] Job {job['id']} ({job['kind']}) interrupted, will resume.")
+        except Exception as e:
+            print(f"[ERROR] Job {job['id']} ({job['kind']}) failed: {e}")
+            metrics.incr("jobs.failed", kind=job["kind"])
+            db.fail_job(job["id"], self.id, e, retry=not isinstance(e, PERMANENT_ERRORS))
+
+    def schedule_digest(self):
+        # Enqueued once a day after digest_time; the key dedups across restarts
+        now = datetime.datetime.now()
+        today = now.date().isoformat()
+        if self.digest_time and now.strftime("%H:%M") >= self.digest_time and self.last_digest != today:
+            db.enqueue_job("digest", {"date": today}, key=f"digest:{today}", reuse_for=2 * 24 * 3600)
+            self.last_digest = today
+
+    def schedule_poll(self):
+        # One poll per interval slot (the key dedups across workers); without a ticket there is nothing to poll
+        if not self.poll_minutes or time.time() < self.next_poll:
+            return
+        self.next_poll = time.time() + self.poll_minutes * 60
+        if not load_config().get("api_ticket"):
+            return
+        slot = int(time.time() // (self.poll_minutes * 60))
+        today = datetime.date.today().isoformat()
+        db.enqueue_job("poll", {"date": today}, key=f"poll:{today}:{slot}", reuse_for=self.poll_minutes * 60)
+
+    def heartbeat(self):
+        db.heartbeat_jobs(self.id, list(self.running))
+        db.worker_heartbeat(self.id, self.jobs_done)
+        requeued = db.requeue_stale_jobs(STALE_AFTER)
+        if requeued:
+            print(f"[WARN] {requeued} job(s) from a dead worker back in the queue.")
+
+    def run(self, drain=False):
+        """
+        Main loop until SIGTERM/SIGINT (or, with drain=True, until the queue
+        is empty). On shutdown, running jobs get SHUTDOWN_GRACE seconds to
+        finish; the rest go back to the queue and resume on the next start.
+        Their threads can't be interrupted (they may sit in an HTTP or Gemini
+        call), so the process exits without waiting for them.
+        """
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        print(f"[INFO] Worker {self.id} started ({self.max_jobs} slots).")
+        pool = ThreadPoolExecutor(max_workers=self.max_jobs, thread_name_prefix="job")
+        next_heartbeat = next_purge = 0.0
+        try:
+            while not self.stopping.is_set():
+                now = time.time()
+                if now >= next_heartbeat:
+                    self.heartbeat()
+                    next_heartbeat = now + HEARTBEAT_INTERVAL
+                if now >= next_purge:
+                    db.purge_jobs(JOB_RETENTION)
+                    db.purge_events(EVENT_RETENTION)
+                    purge_job_files()
+                    semantic.get_store().maybe_rebuild_index()
+                    next_purge = now + PURGE_INTERVAL
+                if not drain:
+                    self.schedule_digest()
+                    self.schedule_poll()
+
+                self.running = {job_id: f for job_id, f in self.running.items() if not f.done()}
+                while len(self.running) < self.max_jobs:
+                    job = db.claim_job(self.id, self.kinds)
+                    if job is None:
+                        break
+                    self.running[job["id"]] = pool.submit(self.run_job, job)
+
+                if drain and not self.running:
+                    break
+                self.stopping.wait(POLL_INTERVAL)
+        finally:
+            self.stopping.set()
+            _, unfinished = wait(self.running.values(), timeout=SHUTDOWN_GRACE)
+            released = db.release_jobs(self.id)
+            if released:
+                print(f"[INFO] {released} unfinished job(s) released, they resume on the next start.")
+            db.remove_worker(self.id)
+            pool.shutdown(wait=False, cancel_futures=True)
+        print(f"[INFO] Worker stopped after {self.jobs_done} job(s).")
+        if unfinished:
+            # Interpreter exit would join the stuck job threads; whatever they
+            # finish now is dropped anyway (finish_job checks the owner)
+            metrics.flush()
+            os._exit(0)
+
+def print_jobs(status=None, limit=20):
+    for job in db.get_jobs(status, limit):
+        created = datetime.datetime.fromtimestamp(job["created_at"]).strftime("%Y-%m-%d %H:%M:%S")
+        print(f"{job['id']:6d}  {created}  {job['kind']:<14} {job['status']:<8} {job['progress'] * 100:5.1f}%  "
+              f"{job['error'] or job['message'] or ''}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Background worker: runs fetch, hydration, analysis and digest jobs queued in tenders.db")
+    parser.add_argument("--jobs", type=int, default=MAX_JOBS, help="Jobs run concurrently")
+    parser.add_argument("--kinds", help=f"Comma-separated job kinds to take ({', '.join(JOB_HANDLERS)})")
+    parser.add_argument("--digest-at", help=f"Daily digest time HH:MM (default: config digest_time or {DIGEST_TIME})")
+    parser.add_argument("--no-digest", action="store_true", help="Don't schedule the daily digest")
+    parser.add_argument("--digest-now", action="store_true", help="Enqueue a digest run now")
+    parser.add_argument("--poll-minutes", type=int, help=f"Minutes between change polls, 0 disables (default: config poll_minutes or {POLL_MINUTES})")
+    parser.add_argument("--drain", action="store_true", help="Exit once the queue is empty")
+    parser.add_argument("--status", action="store_true", help="List recent jobs and exit")
+    args = parser.parse_args()
+
+    if args.status:
+        print_jobs()
+    else:
+        if args.digest_now:
+            db.enqueue_job("digest", {"date": datetime.date.today().isoformat()})
+        digest_time = None if args.no_digest else (args.digest_at or load_config().get("digest_time", DIGEST_TIME))
+        poll_minutes = args.poll_minutes if args.poll_minutes is not None else load_config().get("poll_minutes", POLL_MINUTES)
+        kinds = [k.strip() for k in args.kinds.split(",")] if args.kinds else None
+        Worker(max_jobs=args.jobs, kinds=kinds, digest_time=digest_time, poll_minutes=poll_minutes).run(drain=args.drain)